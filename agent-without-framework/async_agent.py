@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from main import (
+    MAX_ITERATIONS,
+    AIAgent,
+    IterationSpan,
+    _merge_tool_call_fragment,
+    _message_from_completion,
+    _message_from_stream,
+    _used_tokens,
+)
+from model_router import Route, RoutingState
+from transport import create_async_http_client, default_timeout, is_rate_limited
+
+
+class AsyncAIAgent(AIAgent):
+    """AIAgent driven by asyncio, so one event loop can serve many sessions.
+
+    Pass the same AsyncOpenAI client to every agent to share its connection
+    pool between conversations.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        tool_concurrency: Optional[Dict[str, int]] = None,
+        client=None,
+        **kwargs,
+    ):
+        super().__init__(
+            api_key, tool_concurrency=tool_concurrency, client=client, **kwargs
+        )
+        # asyncio.Semaphore only binds to a loop on first use, so these can
+        # be created outside of one.
+        self._async_tool_semaphores = {
+            name: asyncio.Semaphore(limit)
+            for name, limit in self.tool_concurrency.items()
+        }
+
+    def _create_client(self, api_key: str):
+        from openai import AsyncOpenAI
+
+        # An async connection pool belongs to one event loop, so it is not
+        # shared process-wide; share the client itself between agents instead.
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=self.base_url,
+            http_client=self.http_client or create_async_http_client(),
+            timeout=default_timeout(),
+            max_retries=0,
+        )
+
+    async def _create_completion(
+        self,
+        tool_schemas: List[Dict[str, Any]],
+        on_token: Optional[Callable[[str], None]] = None,
+        span: Optional[IterationSpan] = None,
+        route: Optional[Route] = None,
+    ) -> Dict[str, Any]:
+        route = route or self.router.fast
+        params = self._request_params(tool_schemas, route)
+        span = span or IterationSpan(0)
+        span.model = params["model"]
+        span.route = route.name
+        started = time.perf_counter()
+        try:
+            if self.response_cache is None:
+                assistant_message = await self._request_with_retries(
+                    params, on_token, span
+                )
+                span.record_usage(assistant_message["usage"])
+                return assistant_message
+
+            # SQLite reads and commits block, so they run off the loop
+            cached = await asyncio.to_thread(self.response_cache.get, params)
+            if cached is not None:
+                span.cached_response = True
+                if on_token is not None and cached["content"]:
+                    on_token(cached["content"])
+                return cached
+            assistant_message = await self._request_with_retries(params, on_token, span)
+            span.record_usage(assistant_message["usage"])
+            await asyncio.to_thread(
+                self.response_cache.put,
+                params,
+                {
+                    "content": assistant_message["content"],
+                    "tool_calls": assistant_message["tool_calls"],
+                },
+            )
+            return assistant_message
+        finally:
+            span.completion_seconds = time.perf_counter() - started
+
+    async def _routed_completion(
+        self,
+        tool_schemas: List[Dict[str, Any]],
+        on_token: Optional[Callable[[str], None]],
+        span: IterationSpan,
+        routing: RoutingState,
+    ) -> Tuple[Dict[str, Any], IterationSpan]:
+        routed = self.router.begin(routing, on_token)
+        assistant_message = await self._create_completion(
+            tool_schemas, routed.on_token, span, routed.route
+        )
+        repeat_route = routed.finish(span, assistant_message)
+        if repeat_route is None:
+            return assistant_message, span
+        span = self._turn.start_iteration(span.iteration)
+        assistant_message = await self._create_completion(
+            tool_schemas, on_token, span, repeat_route
+        )
+        routed.record_repeat(span)
+        return assistant_message, span
+
+    async def _request_with_retries(
+        self,
+        params: Dict[str, Any],
+        on_token: Optional[Callable[[str], None]],
+        span: IterationSpan,
+    ) -> Dict[str, Any]:
+        estimated_tokens = self._estimate_request_tokens(params)
+        attempt = 0
+        while True:
+            wait = self.rate_limiter.reserve(estimated_tokens)
+            if wait > 0:
+                span.rate_limit_wait_seconds += wait
+                await asyncio.sleep(wait)
+            streamed = False
+
+            def forward(token: str):
+                nonlocal streamed
+                streamed = True
+                on_token(token)
+
+            try:
+                assistant_message = await self._request_completion(
+                    params, forward if on_token is not None else None
+                )
+            except Exception as error:
+                if is_rate_limited(error):
+                    self.rate_limiter.record_rate_limited()
+                delay = (
+                    None if streamed else self.retry_policy.retry_delay(error, attempt)
+                )
+                if delay is None:
+                    raise
+                attempt += 1
+                span.retries += 1
+                logging.warning(
+                    f"Completion request failed ({error}); retry {attempt} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+            else:
+                self.rate_limiter.record_success(
+                    estimated_tokens, _used_tokens(assistant_message["usage"])
+                )
+                return assistant_message
+
+    async def _request_completion(
+        self,
+        params: Dict[str, Any],
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
+        if on_token is None:
+            response = await self.client.chat.completions.create(**params)
+            return _message_from_completion(response)
+
+        stream = await self.client.chat.completions.create(
+            **params, stream=True, stream_options={"include_usage": True}
+        )
+        content_parts: List[str] = []
+        tool_calls_by_index: Dict[int, Dict[str, Any]] = {}
+        usage = None
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                on_token(delta.content)
+            for fragment in delta.tool_calls or []:
+                _merge_tool_call_fragment(tool_calls_by_index, fragment)
+
+        return _message_from_stream(content_parts, tool_calls_by_index, usage)
+
+    async def _run_tool_call(self, tool_call: Dict[str, Any]) -> str:
+        tool_name = tool_call["function"]["name"]
+        try:
+            tool_args = json.loads(tool_call["function"]["arguments"])
+        except json.JSONDecodeError as e:
+            # Answered like a failed call, so the tool_calls are not left
+            # without results
+            return f"Error: The arguments for {tool_name} are not valid JSON: {e}"
+
+        # The file tools block, so they run on the default thread pool
+        # instead of stalling every other session on the loop.
+        semaphore = self._async_tool_semaphores.get(tool_name)
+        if semaphore is None:
+            return await asyncio.to_thread(
+                self._timed_execute_tool, tool_name, tool_args
+            )
+        # Bounded by the tool's deadline, as in AIAgent._run_tool_call
+        try:
+            await asyncio.wait_for(
+                semaphore.acquire(), self.tool_timeouts.get(tool_name)
+            )
+        except asyncio.TimeoutError:
+            return self._no_slot_result(tool_name)
+        loop = asyncio.get_running_loop()
+
+        # Called from the tool's thread once it really ends, which for a call
+        # abandoned at its deadline is after this coroutine has returned
+        def release():
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                pass  # The loop has closed
+
+        return await asyncio.to_thread(
+            self._timed_execute_tool, tool_name, tool_args, release
+        )
+
+    async def _run_serial_tool_calls(
+        self, tool_calls: List[Dict[str, Any]]
+    ) -> List[str]:
+        return [await self._run_tool_call(tool_call) for tool_call in tool_calls]
+
+    async def _run_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[str]:
+        # Same grouping as AIAgent: tools limited to one call at a time keep
+        # their call order, everything else is gathered concurrently.
+        serial_groups: Dict[str, List[int]] = {}
+        groups: List[List[int]] = []
+        tasks = []
+        for index, tool_call in enumerate(tool_calls):
+            tool_name = tool_call["function"]["name"]
+            if self.tool_concurrency.get(tool_name) == 1:
+                serial_groups.setdefault(tool_name, []).append(index)
+            else:
+                groups.append([index])
+                tasks.append(self._run_serial_tool_calls([tool_call]))
+        for indexes in serial_groups.values():
+            groups.append(indexes)
+            tasks.append(self._run_serial_tool_calls([tool_calls[i] for i in indexes]))
+
+        results: List[str] = [""] * len(tool_calls)
+        for indexes, group_results in zip(groups, await asyncio.gather(*tasks)):
+            for index, result in zip(indexes, group_results):
+                results[index] = result
+        return results
+
+    async def chat(
+        self, user_input: str, on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        # Session log writes (appends, fsyncs and compaction snapshots) and
+        # the metrics sinks' file writes block, so they run off the loop
+        await asyncio.to_thread(self._start_turn, user_input)
+        tool_schemas = self._tool_schemas()
+        turn = self._turn = self.metrics.start_turn(self.session_id)
+        routing = self.router.start_turn()
+
+        iteration = 0
+
+        try:
+            while iteration < MAX_ITERATIONS:
+                iteration += 1
+                span = turn.start_iteration(iteration)
+                try:
+                    await asyncio.to_thread(self._compact_history, tool_schemas)
+                    assistant_message, span = await self._routed_completion(
+                        tool_schemas, on_token, span, routing
+                    )
+                    await asyncio.to_thread(
+                        self._record_assistant_message, assistant_message
+                    )
+
+                    if assistant_message["tool_calls"]:
+                        started = time.perf_counter()
+                        tool_results = await self._run_tool_calls(
+                            assistant_message["tool_calls"]
+                        )
+                        span.tool_seconds = time.perf_counter() - started
+                        await asyncio.to_thread(
+                            self._record_tool_results,
+                            assistant_message["tool_calls"],
+                            tool_results,
+                        )
+                        self._record_routed_tools(routing, tool_results)
+                        continue
+                    else:
+                        turn.outcome = "answer"
+                        return self._final_response(assistant_message)
+
+                except Exception as e:
+                    return f"An error occurred during chat completion: {str(e)}"
+
+            turn.outcome = "max_iterations"
+            return "Maximum iterations reached. The conversation may be too complex."
+        finally:
+            turn.escalation = routing.escalation
+            await asyncio.to_thread(self.metrics.finish_turn, turn)
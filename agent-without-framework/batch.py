@@ -0,0 +1,248 @@
+"""Runs a JSONL file of prompts through the agent without the interactive REPL.
+
+Each input line is one conversation, either {"id": ..., "prompt": "..."} or
+{"id": ..., "turns": ["first message", "follow-up", ...]}; a bare JSON string
+is a prompt too. Lines without an id are named after their line number.
+Every conversation gets its own AIAgent and one result line is appended to
+the output as soon as it finishes. Rerunning with the same output file skips
+the conversations it already holds, so a crashed run picks up where it
+stopped.
+
+    uv run python batch.py prompts.jsonl results.jsonl --concurrency 16
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, Optional, Set
+
+from main import AIAgent, configure_logging, load_environment
+from metrics import InMemorySink
+from rate_limiter import configure_shared_rate_limiter
+from response_cache import ResponseCache
+from session_store import SESSION_ID_PATTERN, SessionStore
+
+
+def load_items(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            item: Dict[str, Any] = {"id": f"line-{number}", "turns": []}
+            try:
+                record = json.loads(line)
+                if isinstance(record, str):
+                    record = {"prompt": record}
+                if not isinstance(record, dict):
+                    raise ValueError("expected an object or a string")
+                if "id" in record:
+                    item["id"] = str(record["id"])
+                turns = record.get("turns") or [record["prompt"]]
+                if not isinstance(turns, list) or not all(
+                    isinstance(turn, str) for turn in turns
+                ):
+                    raise ValueError("turns must be a list of strings")
+                item["turns"] = turns
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                item["error"] = f"Invalid input on line {number}: {e}"
+            yield item
+
+
+def load_finished(path: str, retry_failed: bool = False) -> Set[str]:
+    """Ids that already have a result in the output file."""
+    finished: Set[str] = set()
+    try:
+        file = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return finished
+    with file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # The line being written when the previous run died
+                continue
+            if retry_failed and result.get("outcome") != "answer":
+                finished.discard(result["id"])
+            else:
+                finished.add(result["id"])
+    return finished
+
+
+def open_output(path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    output = open(path, "a+b")
+    # Start on a fresh line if the previous run stopped mid-write
+    if output.tell() > 0:
+        output.seek(-1, os.SEEK_END)
+        if output.read(1) != b"\n":
+            output.write(b"\n")
+    return output
+
+
+def session_id_for(item_id: str) -> str:
+    if SESSION_ID_PATTERN.match(item_id):
+        return item_id
+    return "batch-" + hashlib.sha256(item_id.encode("utf-8")).hexdigest()[:32]
+
+
+def run_item(
+    item: Dict[str, Any],
+    api_key: str,
+    session_store: Optional[SessionStore] = None,
+    response_cache: Optional[ResponseCache] = None,
+) -> Dict[str, Any]:
+    if "error" in item:
+        return {"id": item["id"], "outcome": "invalid", "error": item["error"]}
+
+    session_id = session_id_for(item["id"])
+    sink = InMemorySink()
+    started = time.perf_counter()
+    responses = []
+    error = None
+    agent = None
+    try:
+        if session_store is not None:
+            # An unfinished conversation from a crashed run starts over
+            session_store.delete(session_id)
+        agent = AIAgent(
+            api_key=api_key,
+            session_store=session_store,
+            session_id=session_id if session_store is not None else None,
+            response_cache=response_cache,
+            metrics_sinks=[sink],
+        )
+        for turn in item["turns"]:
+            responses.append(agent.chat(turn))
+    except Exception as e:
+        # Recorded on the item's result line; the rest of the batch goes on
+        logging.exception(f"Batch item {item['id']} failed")
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        if agent is not None:
+            agent.close()
+
+    turns = sink.snapshot()
+    failed = [turn.outcome for turn in turns if turn.outcome != "answer"]
+    if error is not None:
+        failed.insert(0, "error")
+    result = {
+        "id": item["id"],
+        "outcome": failed[0] if failed else "answer",
+        "responses": responses,
+        "seconds": round(time.perf_counter() - started, 3),
+        "iterations": sum(len(turn.iterations) for turn in turns),
+        "retries": sum(turn.retries for turn in turns),
+        "prompt_tokens": sum(turn.prompt_tokens for turn in turns),
+        "completion_tokens": sum(turn.completion_tokens for turn in turns),
+    }
+    if error is not None:
+        result["error"] = error
+    return result
+
+
+def run_batch(
+    input_path: str,
+    output_path: str,
+    api_key: str,
+    concurrency: int = 8,
+    session_store: Optional[SessionStore] = None,
+    response_cache: Optional[ResponseCache] = None,
+    retry_failed: bool = False,
+) -> Dict[str, int]:
+    finished = load_finished(output_path, retry_failed)
+    counts = {"skipped": 0, "answer": 0, "failed": 0}
+    output = open_output(output_path)
+
+    def write(future: Future):
+        result = future.result()
+        output.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+        output.flush()
+        counts["answer" if result["outcome"] == "answer" else "failed"] += 1
+        logging.info(f"Batch item {result['id']} finished: {result['outcome']}")
+
+    # Keep a bounded number of items in flight so huge inputs are streamed
+    pending: Set[Future] = set()
+    with output, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for item in load_items(input_path):
+            if item["id"] in finished:
+                counts["skipped"] += 1
+                continue
+            finished.add(item["id"])
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future)
+            pending.add(
+                executor.submit(run_item, item, api_key, session_store, response_cache)
+            )
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                write(future)
+    return counts
+
+
+def main():
+    load_environment()
+    configure_logging()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL file of prompts or conversations")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Conversations run at once"
+    )
+    parser.add_argument(
+        "--sessions-dir", help="Also keep a session log per conversation here"
+    )
+    parser.add_argument(
+        "--response-cache",
+        metavar="PATH",
+        help="Answer repeated requests from an on-disk cache at PATH",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Rerun conversations whose earlier result was not an answer",
+    )
+    parser.add_argument(
+        "--rpm", type=float, help="Requests per minute allowed to the API"
+    )
+    parser.add_argument(
+        "--tpm", type=float, help="Tokens per minute allowed to the API"
+    )
+    args = parser.parse_args()
+    if args.rpm or args.tpm:
+        configure_shared_rate_limiter(args.rpm, args.tpm)
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        print("Error: OPENAI_API_KEY is not set in environment variables.")
+        sys.exit(1)
+
+    counts = run_batch(
+        args.input,
+        args.output,
+        api_key,
+        concurrency=args.concurrency,
+        session_store=SessionStore(args.sessions_dir) if args.sessions_dir else None,
+        response_cache=(
+            ResponseCache(args.response_cache) if args.response_cache else None
+        ),
+        retry_failed=args.retry_failed,
+    )
+    print(
+        f"{counts['answer']} answered, {counts['failed']} failed, "
+        f"{counts['skipped']} already done"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Agent loop benchmark against the local mock server.
+
+Runs AIAgent turns against MockOpenAIServer, which follows a scripted list of
+tool calls, and reports end-to-end latency, time spent in tools and the
+agent's own overhead per loop iteration (everything that is neither waiting
+for the server nor running tools). Timings and token counts come from the
+agent's own turn metrics.
+
+    uv run python benchmarks/bench_agent.py --turns 50 --latency 0.05
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent  # noqa: E402
+from metrics import InMemorySink  # noqa: E402
+from rate_limiter import configure_shared_rate_limiter  # noqa: E402
+from mock_server import MockOpenAIServer  # noqa: E402
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "mean": 0.0}
+    ordered = sorted(values)
+
+    def pick(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def make_workspace(directory: str, files: int, file_bytes: int) -> List[str]:
+    paths = []
+    for index in range(files):
+        path = os.path.join(directory, f"module_{index:03d}.py")
+        with open(path, "w", encoding="utf-8") as file:
+            line = f"def function_{index}(value):\n    return value * {index}\n\n"
+            file.write(line * max(1, file_bytes // len(line)))
+        paths.append(path)
+    return paths
+
+
+def make_script(workspace: str, paths: List[str], reads: int) -> List[Dict]:
+    return [
+        {"tool_calls": [{"name": "list_files", "arguments": {"path": workspace}}]},
+        {
+            "tool_calls": [
+                {"name": "read_file", "arguments": {"path": path}}
+                for path in paths[:reads]
+            ]
+        },
+        {"content": "The workspace contains generated modules. " * 20},
+    ]
+
+
+def run_turn(server: MockOpenAIServer, stream: bool) -> Dict[str, float]:
+    sink = InMemorySink()
+    agent = AIAgent(api_key="mock", base_url=server.url, metrics_sinks=[sink])
+    tokens = []
+    start = time.perf_counter()
+    first_token = None
+
+    def on_token(token: str):
+        nonlocal first_token
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        tokens.append(token)
+
+    agent.chat("Describe this workspace.", on_token=on_token if stream else None)
+    elapsed = time.perf_counter() - start
+    agent.close()
+
+    (turn,) = sink.snapshot()
+    completion_time = turn.completion_seconds
+    tool_time = turn.tool_seconds
+    iterations = len(turn.iterations)
+    return {
+        "end_to_end": elapsed,
+        "time_to_first_token": first_token or elapsed,
+        "completion": completion_time,
+        "tools": tool_time,
+        "iterations": iterations,
+        "retries": turn.retries,
+        "overhead_per_iteration": (elapsed - completion_time - tool_time)
+        / max(iterations, 1),
+        "prompt_tokens": turn.prompt_tokens,
+        "completion_tokens": turn.completion_tokens,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=30, help="Turns to run")
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="Turns running at the same time"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Mock server latency (s)"
+    )
+    parser.add_argument(
+        "--tokens-per-second", type=float, help="Mock server streaming rate"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Share of requests given a 429"
+    )
+    parser.add_argument(
+        "--server-rpm", type=float, help="Quota enforced by the mock server"
+    )
+    parser.add_argument(
+        "--rpm", type=float, help="Requests per minute allowed by the agents' limiter"
+    )
+    parser.add_argument("--files", type=int, default=20, help="Workspace files")
+    parser.add_argument("--file-bytes", type=int, default=20_000)
+    parser.add_argument("--reads", type=int, default=8, help="Files read per turn")
+    parser.add_argument("--stream", action="store_true", help="Stream completions")
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    args = parser.parse_args()
+    if args.rpm:
+        configure_shared_rate_limiter(args.rpm)
+
+    with tempfile.TemporaryDirectory() as workspace:
+        paths = make_workspace(workspace, args.files, args.file_bytes)
+        script = make_script(workspace, paths, args.reads)
+        with MockOpenAIServer(
+            script,
+            args.latency,
+            args.tokens_per_second,
+            error_rate=args.error_rate,
+            requests_per_minute=args.server_rpm,
+        ) as server:
+            # Warm up imports, connections and the page cache
+            run_turn(server, args.stream)
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                results = list(
+                    executor.map(
+                        lambda _: run_turn(server, args.stream), range(args.turns)
+                    )
+                )
+
+    report = {
+        name: percentiles([result[name] for result in results])
+        for name in (
+            "end_to_end",
+            "time_to_first_token",
+            "completion",
+            "tools",
+            "overhead_per_iteration",
+        )
+    }
+    for name in ("iterations", "retries", "prompt_tokens", "completion_tokens"):
+        report[f"{name}_per_turn"] = statistics.fmean(
+            result[name] for result in results
+        )
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(
+        f"{args.turns} turns, concurrency {args.concurrency}, "
+        f"latency {args.latency}s, stream={args.stream}, "
+        f"{report['iterations_per_turn']:.1f} iterations and "
+        f"{report['retries_per_turn']:.2f} retries per turn, "
+        f"{report['prompt_tokens_per_turn']:.0f} prompt and "
+        f"{report['completion_tokens_per_turn']:.0f} completion tokens per turn"
+    )
+    print(f"{'metric (ms)':<26}{'p50':>10}{'p90':>10}{'p99':>10}{'mean':>10}")
+    for name, values in report.items():
+        if name.endswith("_per_turn"):
+            continue
+        print(
+            f"{name:<26}"
+            + "".join(
+                f"{values[key] * 1000:>10.2f}" for key in ("p50", "p90", "p99", "mean")
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Import-time budget for the agent's entry points.
+
+Imports each module in a fresh interpreter under `python -X importtime`,
+takes the median cumulative import time over several runs and lists the
+slowest imports beneath it. Exits with status 1 when a module goes over the
+budget or loads one of the heavy dependencies that should only be imported
+once they are used (the OpenAI SDK, httpx, pydantic, dotenv), so it can
+guard startup latency in CI.
+
+    uv run python benchmarks/bench_startup.py --budget-ms 250
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ["main", "async_agent", "batch", "server"]
+DEFERRED_IMPORTS = ["openai", "httpx", "pydantic", "dotenv"]
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """(name, self us, cumulative us) for every import of one cold start."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr}")
+    times = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            times.append((match.group(4), int(match.group(1)), int(match.group(2))))
+    return times
+
+
+def measure(module: str, runs: int, top: int) -> Dict:
+    totals = []
+    for _ in range(runs):
+        times = import_times(module)
+        totals.append(next(total for name, _, total in times if name == module))
+    loaded = {name.split(".")[0] for name, _, _ in times}
+    slowest = sorted(times, key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "ms": statistics.median(totals) / 1000,
+        "deferred_loaded": [name for name in DEFERRED_IMPORTS if name in loaded],
+        "slowest": [
+            {"name": name, "self_ms": own / 1000, "cumulative_ms": total / 1000}
+            for name, own, total in slowest
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import"
+    )
+    parser.add_argument(
+        "--budget-ms", type=float, default=250.0, help="Allowed import time per module"
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per module")
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports shown")
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    args = parser.parse_args()
+
+    results = [measure(module, args.runs, args.top) for module in args.modules]
+    failed = [
+        result
+        for result in results
+        if result["ms"] > args.budget_ms or result["deferred_loaded"]
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            status = "FAIL" if result in failed else "ok"
+            print(
+                f"{result['module']:<16}{result['ms']:>9.1f} ms  "
+                f"(budget {args.budget_ms:.0f} ms)  {status}"
+            )
+            if result["deferred_loaded"]:
+                print(f"  loads at import: {', '.join(result['deferred_loaded'])}")
+            for item in result["slowest"]:
+                print(
+                    f"  {item['name']:<36}{item['self_ms']:>8.1f} self"
+                    f"{item['cumulative_ms']:>9.1f} cumulative"
+                )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
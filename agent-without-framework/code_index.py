@@ -0,0 +1,444 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import file_tools
+from tool_runner import check_deadline
+
+# Larger files (bundles, generated code, data) are not indexed or searched
+MAX_INDEXED_FILE_BYTES = 1024 * 1024
+
+# A search walks its directory for changed files at most this often; edits
+# made through the agent are indexed as soon as they are written.
+REFRESH_INTERVAL_SECONDS = 2.0
+
+DEFAULT_MAX_RESULTS = 100
+MAX_MATCH_LINE_CHARS = 200
+
+# Candidate files are narrowed down with at most this many trigrams per query
+MAX_QUERY_TRIGRAMS = 64
+
+_QUANTIFIER = re.compile(r"\{(\d*)(?:,(\d*))?\}")
+
+
+def trigrams(data: bytes) -> Set[bytes]:
+    """Every three-byte sequence within a line, ASCII case folded."""
+    found: Set[bytes] = set()
+    for line in data.lower().split(b"\n"):
+        found.update(line[i : i + 3] for i in range(len(line) - 2))
+    return found
+
+
+def _skip_class(pattern: str, i: int) -> int:
+    # i is at "["; a "]" right after the opening (or after "^") is literal
+    i += 1
+    if pattern.startswith("^", i):
+        i += 1
+    if pattern.startswith("]", i):
+        i += 1
+    while i < len(pattern) and pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    return i + 1
+
+
+def _skip_group(pattern: str, i: int) -> int:
+    depth = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "[":
+            i = _skip_class(pattern, i)
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+# How many characters follow the letter of an escape that takes arguments
+_ESCAPE_ARGUMENT_LENGTHS = {"x": 2, "u": 4, "U": 8}
+
+
+def _escape_end(pattern: str, i: int) -> int:
+    """The index after the escape starting at pattern[i] (a backslash)."""
+    letter = pattern[i + 1 : i + 2]
+    if letter in _ESCAPE_ARGUMENT_LENGTHS:
+        return i + 2 + _ESCAPE_ARGUMENT_LENGTHS[letter]
+    if letter == "N" and pattern[i + 2 : i + 3] == "{":
+        close = pattern.find("}", i + 3)
+        return len(pattern) if close == -1 else close + 1
+    if letter.isdigit():
+        # Octal escapes and backreferences take up to three digits
+        end = i + 2
+        while end < min(i + 4, len(pattern)) and pattern[end].isdigit():
+            end += 1
+        return end
+    return i + 2
+
+
+def required_literals(pattern: str) -> List[str]:
+    """Literal strings that every match of the regex contains.
+
+    Only runs of plain characters outside groups and classes are used, and
+    nothing is required when the pattern has a top-level alternation or
+    inline flags, so the result may be incomplete but never wrong.
+    """
+    if re.compile(pattern).flags & ~re.UNICODE:
+        return []
+    literals: List[str] = []
+    current = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "|":
+            return []
+        if char == "\\":
+            escaped = pattern[i + 1 : i + 2]
+            # \. and \( are literal; \w, \d, \n, \x41 and friends break the
+            # run, together with the characters they consume
+            if escaped and not escaped.isalnum():
+                piece, i = escaped, i + 2
+            else:
+                piece, i = None, _escape_end(pattern, i)
+        elif char == "[":
+            piece, i = None, _skip_class(pattern, i)
+        elif char == "(":
+            piece, i = None, _skip_group(pattern, i)
+        elif char in ".^$":
+            piece, i = None, i + 1
+        else:
+            piece, i = char, i + 1
+
+        quantifier = _QUANTIFIER.match(pattern, i)
+        optional = repeated = False
+        if i < len(pattern) and pattern[i] in "*?":
+            optional, i = True, i + 1
+        elif i < len(pattern) and pattern[i] == "+":
+            repeated, i = True, i + 1
+        elif quantifier:
+            optional = not quantifier.group(1) or int(quantifier.group(1)) == 0
+            repeated, i = not optional, quantifier.end()
+        if (optional or repeated) and i < len(pattern) and pattern[i] in "?+":
+            i += 1
+
+        if piece is not None and not optional:
+            current += piece
+        if piece is None or optional or repeated:
+            literals.append(current)
+            current = ""
+    literals.append(current)
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+class CodeIndex:
+    """On-disk trigram index of the text files under a workspace.
+
+    For every file the set of its (ASCII case folded) three-byte sequences is
+    stored in SQLite, so a search reads only the files that contain every
+    trigram of the literal text its pattern requires. A refresh walks the
+    directory like list_files does, but reads only files whose (mtime, size,
+    inode) changed since they were indexed.
+    """
+
+    def __init__(
+        self,
+        path: str = ".cache/code_index.sqlite3",
+        max_file_bytes: int = MAX_INDEXED_FILE_BYTES,
+        refresh_interval: float = REFRESH_INTERVAL_SECONDS,
+    ):
+        self.path = path
+        self.max_file_bytes = max_file_bytes
+        self.refresh_interval = refresh_interval
+        self._connection = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshed: Dict[str, float] = {}
+
+    def _connect(self):
+        # Called with self._lock held; opened on first use so that agents
+        # which never search do not create the database
+        if self._connection is None:
+            import sqlite3
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=30
+            )
+            self._connection.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS files (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    indexed INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS trigrams (
+                    trigram BLOB NOT NULL,
+                    file_id INTEGER NOT NULL,
+                    PRIMARY KEY (trigram, file_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS trigrams_file_id ON trigrams (file_id);
+                """)
+        return self._connection
+
+    def _read_trigrams(self, path: str, stat_result: os.stat_result):
+        """The file's trigrams, or None for binary and oversized files."""
+        if stat_result.st_size > self.max_file_bytes:
+            return None
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        if b"\0" in data[: file_tools.BINARY_SNIFF_BYTES]:
+            return None
+        return trigrams(data)
+
+    def _store(self, connection, path: str, stat_result: os.stat_result, grams):
+        row = connection.execute(
+            "SELECT id FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        values = (
+            stat_result.st_mtime_ns,
+            stat_result.st_size,
+            stat_result.st_ino,
+            int(grams is not None),
+        )
+        if row is None:
+            file_id = connection.execute(
+                "INSERT INTO files (path, mtime_ns, size, inode, indexed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (path, *values),
+            ).lastrowid
+        else:
+            file_id = row[0]
+            connection.execute(
+                "UPDATE files SET mtime_ns = ?, size = ?, inode = ?, indexed = ? "
+                "WHERE id = ?",
+                (*values, file_id),
+            )
+            connection.execute("DELETE FROM trigrams WHERE file_id = ?", (file_id,))
+        connection.executemany(
+            "INSERT INTO trigrams VALUES (?, ?)",
+            ((gram, file_id) for gram in grams or ()),
+        )
+
+    def _remove(self, connection, file_ids: List[int]):
+        for file_id in file_ids:
+            connection.execute("DELETE FROM trigrams WHERE file_id = ?", (file_id,))
+            connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    @staticmethod
+    def _range(root: str) -> Tuple[str, str]:
+        # Every path under root sorts between these two strings
+        return root + os.sep, root + chr(ord(os.sep) + 1)
+
+    def refresh(self, root: str, force: bool = False) -> int:
+        """Brings the index of root up to date; returns the files re-indexed."""
+        root = os.path.abspath(root)
+        with self._refresh_lock:
+            last = self._refreshed.get(root)
+            if (
+                not force
+                and last is not None
+                and time.monotonic() - last < self.refresh_interval
+            ):
+                return 0
+            with self._lock:
+                known = {
+                    path: (file_id, (mtime_ns, size, inode))
+                    for file_id, path, mtime_ns, size, inode in self._connect().execute(
+                        "SELECT id, path, mtime_ns, size, inode FROM files "
+                        "WHERE path >= ? AND path < ?",
+                        self._range(root),
+                    )
+                }
+
+            changed = []
+            seen = set()
+            for relative_path in file_tools.walk_files(root):
+                path = os.path.join(root, relative_path)
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(path)
+                entry = known.get(path)
+                key = (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+                if entry is None or entry[1] != key:
+                    changed.append((path, stat_result))
+            removed = [
+                file_id for path, (file_id, _) in known.items() if path not in seen
+            ]
+
+            # Files are read outside the lock so searches can go on meanwhile
+            for path, stat_result in changed:
+                check_deadline()
+                grams = self._read_trigrams(path, stat_result)
+                with self._lock:
+                    self._store(self._connection, path, stat_result, grams)
+            with self._lock:
+                self._remove(self._connection, removed)
+                self._connection.commit()
+            self._refreshed[root] = time.monotonic()
+        return len(changed)
+
+    def update_file(self, path: str):
+        """Re-indexes one file right after it was written (or deleted)."""
+        path = os.path.abspath(path)
+        with self._lock:
+            if self._connection is None and not os.path.exists(self.path):
+                # Nothing was ever indexed; the first search will pick it up
+                return
+            connection = self._connect()
+            tracked = connection.execute(
+                "SELECT id FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        under_root = any(
+            path.startswith(root + os.sep) for root in list(self._refreshed)
+        )
+        if tracked is None and not under_root:
+            return
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            stat_result = None
+        grams = (
+            self._read_trigrams(path, stat_result) if stat_result is not None else None
+        )
+        with self._lock:
+            if stat_result is None:
+                if tracked is not None:
+                    self._remove(self._connection, [tracked[0]])
+            else:
+                self._store(self._connection, path, stat_result, grams)
+            self._connection.commit()
+
+    def candidates(self, root: str, grams: Set[bytes]) -> List[str]:
+        """Indexed files under root that contain all of grams, by path."""
+        root = os.path.abspath(root)
+        low, high = self._range(root)
+        with self._lock:
+            connection = self._connect()
+            if not grams:
+                rows = connection.execute(
+                    "SELECT path FROM files WHERE indexed = 1 "
+                    "AND path >= ? AND path < ? ORDER BY path",
+                    (low, high),
+                )
+                return [path for (path,) in rows]
+            grams = sorted(grams)[:MAX_QUERY_TRIGRAMS]
+            rows = connection.execute(
+                "SELECT files.path FROM trigrams JOIN files ON files.id = trigrams.file_id "
+                f"WHERE trigrams.trigram IN ({', '.join('?' * len(grams))}) "
+                "AND files.path >= ? AND files.path < ? "
+                "GROUP BY trigrams.file_id HAVING COUNT(*) = ? ORDER BY files.path",
+                (*grams, low, high, len(grams)),
+            )
+            return [path for (path,) in rows]
+
+    def search(
+        self,
+        pattern: str,
+        root: str = ".",
+        regex: bool = False,
+        ignore_case: bool = False,
+        include: Optional[List[str]] = None,
+    ) -> Iterator[Tuple[str, int, str]]:
+        """Yields (relative path, line number, line) for each matching line."""
+        compiled = re.compile(
+            pattern if regex else re.escape(pattern),
+            re.IGNORECASE if ignore_case else 0,
+        )
+        literals = required_literals(pattern) if regex else [pattern]
+        grams: Set[bytes] = set()
+        for literal in literals:
+            grams.update(trigrams(literal.encode("utf-8")))
+        if ignore_case:
+            # Only ASCII is case folded in the index
+            grams = {gram for gram in grams if gram.isascii()}
+        include_patterns = [file_tools.PathPattern(glob) for glob in include or []]
+
+        self.refresh(root)
+        root = os.path.abspath(root)
+        for path in self.candidates(root, grams):
+            check_deadline()
+            relative_path = os.path.relpath(path, root).replace(os.sep, "/")
+            if include_patterns and not any(
+                glob.matches(relative_path, False) for glob in include_patterns
+            ):
+                continue
+            try:
+                with open(path, "rb") as file:
+                    text = file.read().decode("utf-8", errors="replace")
+            except OSError:
+                continue
+            for number, line in enumerate(text.split("\n"), 1):
+                if compiled.search(line):
+                    yield relative_path, number, line.rstrip("\r")
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def search_code(
+    index: CodeIndex,
+    pattern: str,
+    path: str = ".",
+    regex: bool = False,
+    ignore_case: bool = False,
+    include: Optional[List[str]] = None,
+    max_results: Optional[int] = None,
+) -> str:
+    max_results = max_results or DEFAULT_MAX_RESULTS
+    matches = []
+    more = False
+    for relative_path, number, line in index.search(
+        pattern, path, regex, ignore_case, include
+    ):
+        if len(matches) == max_results:
+            more = True
+            break
+        line = line.strip()
+        if len(line) > MAX_MATCH_LINE_CHARS:
+            line = line[:MAX_MATCH_LINE_CHARS] + "..."
+        matches.append(f"{relative_path}:{number}: {line}")
+
+    if not matches:
+        return f"No matches for {pattern!r} in {path}."
+    result = f"Matches for {pattern!r} in {path}:\n" + "\n".join(matches)
+    if more:
+        result += (
+            f"\n[Stopped after {max_results} matches. Narrow the pattern, pass "
+            "include globs or raise max_results to see more.]"
+        )
+    return result
+
+
+_shared_index: Optional[CodeIndex] = None
+_shared_lock = threading.Lock()
+
+
+def shared_code_index() -> CodeIndex:
+    """The process-wide index used by agents without their own."""
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = CodeIndex()
+        return _shared_index
@@ -0,0 +1,332 @@
+import functools
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+# Every message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Tool results shorter than this are not worth replacing with a reference
+MIN_DEDUP_CHARS = 200
+
+# A re-read is sent as a diff only if the diff is at most this share of it
+MAX_DIFF_FRACTION = 0.5
+
+_READ_HEADER = re.compile(r"^Contents of the file (?P<path>.+?):\n", re.DOTALL)
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    # tiktoken is optional and loading an encoding can fail offline, in
+    # which case token counts fall back to a characters-per-token estimate.
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+
+            _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoder = None
+    return _encoder
+
+
+def count_text_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(message: Dict[str, Any]) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_text_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        tokens += count_text_tokens(tool_call["function"]["name"])
+        tokens += count_text_tokens(tool_call["function"]["arguments"])
+    return tokens
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def summarize_messages(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """Default extractive summary: one short line per folded message."""
+    lines = [previous_summary] if previous_summary else []
+    for message in messages:
+        if message["role"] == "user":
+            lines.append(f"- User asked: {_clip(message['content'], 200)}")
+        elif message["role"] == "assistant":
+            for tool_call in message.get("tool_calls") or []:
+                lines.append(
+                    f"- Assistant called {tool_call['function']['name']}"
+                    f"({_clip(tool_call['function']['arguments'], 120)})"
+                )
+            if message.get("content"):
+                lines.append(f"- Assistant replied: {_clip(message['content'], 300)}")
+        elif message["role"] == "tool":
+            lines.append(
+                f"- Tool result ({len(message.get('content') or '')} characters) "
+                "was dropped; call the tool again if it is still needed."
+            )
+    return "\n".join(lines)
+
+
+class ContextWindow:
+    """Keeps the message history under a token budget.
+
+    The system prompt and the most recent turns are pinned. When the history
+    grows past max_tokens the oldest turns are folded into a single summary
+    message; if that is not enough, tool results in the pinned turns (other
+    than the latest batch) are elided too.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 100_000,
+        keep_recent_turns: int = 2,
+        summarizer: Optional[Callable[[str, List[Dict[str, Any]]], str]] = None,
+        max_summary_tokens: int = 2_000,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_recent_turns = max(1, keep_recent_turns)
+        self.summarizer = summarizer or summarize_messages
+        self.max_summary_tokens = max_summary_tokens
+        # id(message) -> (message, tokens); the message is kept so its id
+        # cannot be reused by another dict while the entry exists.
+        self._token_counts: Dict[int, Any] = {}
+
+    def count(self, message: Dict[str, Any], remember: bool = True) -> int:
+        """Tokens in message; remember=False counts without caching it.
+
+        Only messages of the stored history should be remembered: the cache
+        holds on to them until the next compaction, so caching the copies
+        built for every request would grow it without bound.
+        """
+        cached = self._token_counts.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        tokens = count_message_tokens(message)
+        if remember:
+            self._token_counts[id(message)] = (message, tokens)
+        return tokens
+
+    def total_tokens(
+        self, messages: List[Dict[str, Any]], remember: bool = True
+    ) -> int:
+        return sum(self.count(message, remember) for message in messages)
+
+    def compact(self, messages: List[Dict[str, Any]], reserved_tokens: int = 0) -> bool:
+        """Compacts messages in place; returns True if anything changed."""
+        budget = self.max_tokens - reserved_tokens
+        if self.total_tokens(messages) <= budget:
+            return False
+
+        head: List[Dict[str, Any]] = []
+        index = 0
+        if messages and messages[0]["role"] == "system":
+            head.append(messages[0])
+            index = 1
+        summary = ""
+        if (
+            index < len(messages)
+            and messages[index]["role"] == "system"
+            and messages[index]["content"].startswith(SUMMARY_PREFIX)
+        ):
+            summary = messages[index]["content"][len(SUMMARY_PREFIX) :].strip()
+            index += 1
+
+        # A turn starts at a user message and runs up to the next one, so
+        # tool calls and their results are never split apart.
+        turns: List[List[Dict[str, Any]]] = []
+        for message in messages[index:]:
+            if message["role"] == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+
+        pinned = turns[-self.keep_recent_turns :]
+        folded = [
+            message for turn in turns[: -self.keep_recent_turns] for message in turn
+        ]
+
+        if folded:
+            summary = self.summarizer(summary, folded)
+            # Trim the oldest summary lines if the summary itself gets too big
+            lines = summary.splitlines()
+            while (
+                len(lines) > 1
+                and count_text_tokens("\n".join(lines)) > self.max_summary_tokens
+            ):
+                lines.pop(0)
+            summary = "\n".join(lines)
+
+        compacted = list(head)
+        if summary:
+            compacted.append(
+                {"role": "system", "content": f"{SUMMARY_PREFIX}\n{summary}"}
+            )
+        for turn in pinned:
+            compacted.extend(turn)
+        if self.total_tokens(compacted) > budget:
+            compacted = self._elide_pinned_tool_results(compacted, budget)
+
+        logging.info(
+            f"Context compacted: folded {len(folded)} messages, "
+            f"{self.total_tokens(messages)} -> {self.total_tokens(compacted)} tokens"
+        )
+        messages[:] = compacted
+        self._token_counts = {
+            id(message): (message, self.count(message)) for message in compacted
+        }
+        return True
+
+    def _elide_pinned_tool_results(
+        self, messages: List[Dict[str, Any]], budget: int
+    ) -> List[Dict[str, Any]]:
+        # The results of the latest tool call batch are what the model is
+        # about to act on, so they stay; older ones go first.
+        last_assistant = max(
+            (i for i, message in enumerate(messages) if message["role"] == "assistant"),
+            default=len(messages),
+        )
+        total = self.total_tokens(messages)
+        result = list(messages)
+        for i, message in enumerate(messages[:last_assistant]):
+            if total <= budget:
+                break
+            if message["role"] != "tool":
+                continue
+            elided = {
+                "role": "tool",
+                "tool_call_id": message["tool_call_id"],
+                "content": (
+                    f"[Tool result of {len(message['content'] or '')} characters "
+                    "elided to fit the context budget]"
+                ),
+            }
+            total += self.count(elided) - self.count(message)
+            result[i] = elided
+        return result
+
+
+def tool_schema_tokens(tool_schemas: List[Dict[str, Any]]) -> int:
+    return count_text_tokens(json.dumps(tool_schemas))
+
+
+def _tool_calls_by_id(messages: List[Dict[str, Any]]) -> Dict[str, Tuple[str, str]]:
+    calls = {}
+    for message in messages:
+        for tool_call in message.get("tool_calls") or []:
+            calls[tool_call["id"]] = (
+                tool_call["function"]["name"],
+                tool_call["function"]["arguments"],
+            )
+    return calls
+
+
+def _full_read_path(name: str, arguments: str) -> Optional[str]:
+    # Only whole-file reads can stand in for each other; ranges differ
+    if name != "read_file":
+        return None
+    try:
+        parameters = json.loads(arguments)
+    except json.JSONDecodeError:
+        return None
+    if parameters.get("offset") is not None or parameters.get("limit") is not None:
+        return None
+    return parameters.get("path")
+
+
+@functools.lru_cache(maxsize=256)
+def _read_diff(old: str, new: str) -> str:
+    # The pass runs before every request, so the same diffs come up again
+    import difflib
+
+    return "".join(
+        difflib.unified_diff(
+            old.splitlines(keepends=True),
+            new.splitlines(keepends=True),
+            "earlier read",
+            "current",
+            n=2,
+        )
+    )
+
+
+def deduplicate_tool_results(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The history as it should be sent, with repeated tool output folded.
+
+    An earlier tool result identical to a later one is replaced by a
+    reference to the later copy. A whole-file read that differs from an
+    earlier read of the same file still in context is sent as a diff against
+    it when that is much shorter. The stored history is not changed.
+    """
+    calls = _tool_calls_by_id(messages)
+    tool_indexes = [
+        i
+        for i, message in enumerate(messages)
+        if message["role"] == "tool"
+        and len(message.get("content") or "") >= MIN_DEDUP_CHARS
+    ]
+    if len(tool_indexes) < 2:
+        return messages
+
+    result = list(messages)
+    latest_by_content: Dict[str, int] = {}
+    for i in reversed(tool_indexes):
+        content = messages[i]["content"]
+        later = latest_by_content.get(content)
+        if later is None:
+            latest_by_content[content] = i
+            continue
+        name, _ = calls.get(messages[i]["tool_call_id"], ("tool", ""))
+        result[i] = {
+            **messages[i],
+            "content": (
+                f"[Same output as the later {name} result for call "
+                f"{messages[later]['tool_call_id']}; omitted here.]"
+            ),
+        }
+
+    # Chains of whole-file reads: each one kept in full becomes a diff
+    # against the previous one still in context.
+    previous_read: Dict[str, Tuple[str, str]] = {}
+    for i in tool_indexes:
+        if result[i] is not messages[i]:
+            continue
+        content = messages[i]["content"]
+        name, arguments = calls.get(messages[i]["tool_call_id"], ("", "{}"))
+        path = _full_read_path(name, arguments)
+        header = _READ_HEADER.match(content)
+        if path is None or header is None:
+            continue
+        body = content[header.end() :]
+        earlier = previous_read.get(path)
+        previous_read[path] = (body, messages[i]["tool_call_id"])
+        if earlier is None:
+            continue
+        diff = _read_diff(earlier[0], body)
+        if len(diff) > len(body) * MAX_DIFF_FRACTION:
+            continue
+        result[i] = {
+            **messages[i],
+            "content": (
+                f"Contents of the file {header.group('path')}, as a unified diff "
+                f"against the earlier read in call {earlier[1]}:\n{diff}"
+            ),
+        }
+
+    saved = sum(len(m["content"] or "") for m in messages) - sum(
+        len(m["content"] or "") for m in result
+    )
+    if saved:
+        logging.info(f"Deduplicated {saved} characters of tool results")
+    return result
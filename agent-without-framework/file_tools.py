@@ -0,0 +1,707 @@
+import mmap
+import os
+import re
+import stat
+import sys
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from tool_runner import check_deadline
+
+# Largest slice of a file handed to the model in one read_file call. read_file
+# owns this cap: it has no output policy, so its own continuation hint is the
+# only one the model sees. max_bytes may lower the cap but not raise it.
+DEFAULT_MAX_READ_BYTES = 20_000
+
+# Files at least this large are read through mmap and a line index instead
+# of being loaded into memory
+MMAP_THRESHOLD_BYTES = 8 * 1024 * 1024
+
+# The line index stores the number of newlines before each block of this size
+LINE_INDEX_BLOCK_BYTES = 64 * 1024
+
+# How many bytes are sniffed for NUL bytes to detect binary files
+BINARY_SNIFF_BYTES = 8192
+
+MAX_CACHED_LINE_INDEXES = 16
+
+# Files at least this large are edited through mmap and copied to the new
+# version in blocks of COPY_BLOCK_BYTES instead of being loaded into memory
+STREAMING_EDIT_THRESHOLD_BYTES = MMAP_THRESHOLD_BYTES
+COPY_BLOCK_BYTES = 1024 * 1024
+
+# Read once at import: os.umask can only be queried by setting it, which is
+# not safe once tool threads are running.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Entries returned by one list_files call before a cursor is handed out
+DEFAULT_LIST_LIMIT = 200
+
+# Memory budget of the cache of file contents and directory listings
+DEFAULT_CONTENT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Callables that may answer a directory listing from memory (such as a
+# running workspace_watcher.WorkspaceWatcher); None means ask the filesystem
+_listing_sources: Tuple[Callable[[str], Optional[list]], ...] = ()
+
+_line_indexes: "OrderedDict[str, tuple]" = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+
+def _file_key(stat_result: os.stat_result) -> tuple:
+    return (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+
+
+class LineIndex:
+    """Sparse line index: newline counts at fixed byte intervals of a file.
+
+    Building it counts newlines block by block without decoding the file, and
+    finding the start of line N touches at most one block.
+    """
+
+    def __init__(self, data, size: int):
+        self.size = size
+        # newlines_before[b] is the number of newlines in data[: b * block]
+        self.newlines_before = array("Q", [0])
+        newlines = 0
+        for start in range(0, size, LINE_INDEX_BLOCK_BYTES):
+            newlines += data[start : start + LINE_INDEX_BLOCK_BYTES].count(b"\n")
+            self.newlines_before.append(newlines)
+        self.newlines = newlines
+        ends_with_newline = size > 0 and data[size - 1 : size] == b"\n"
+        self.total_lines = newlines + (0 if ends_with_newline or size == 0 else 1)
+
+    def line_start(self, data, line: int) -> int:
+        """Byte offset where the 0-based line starts (size if past the end)."""
+        if line <= 0:
+            return 0
+        if line > self.newlines:
+            return self.size
+        # The block holding the line-th newline is the last one whose count
+        # of preceding newlines is still below line.
+        block = bisect_left(self.newlines_before, line) - 1
+        position = block * LINE_INDEX_BLOCK_BYTES
+        remaining = line - self.newlines_before[block]
+        while remaining:
+            position = data.find(b"\n", position) + 1
+            remaining -= 1
+        return position
+
+
+class ContentCache:
+    """File contents and directory listings, least recently used evicted first.
+
+    Entries are keyed by absolute path and only served while a fresh stat of
+    the path still gives the (st_mtime_ns, st_size, st_ino) they were read
+    with, so changes made outside the agent are picked up on the next read
+    at the cost of one stat instead of a full read.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CONTENT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[tuple, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: str, key: tuple) -> Any:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != key:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, path: str, key: tuple, value: Any, size: int):
+        # One huge file should not flush everything else
+        if size > self.max_bytes // 4:
+            self.invalidate(path)
+            return
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[path] = (key, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate(self, path: str):
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+content_cache = ContentCache()
+
+
+def _read_bytes(path: str, stat_result: Optional[os.stat_result] = None) -> bytes:
+    """The whole file, from the content cache while it is unchanged."""
+    cache_path = os.path.abspath(path)
+    stat_result = stat_result or os.stat(path)
+    data = content_cache.get(cache_path, _file_key(stat_result))
+    if data is not None:
+        return data
+    with open(path, "rb") as file:
+        before = os.fstat(file.fileno())
+        data = file.read()
+        after = os.fstat(file.fileno())
+    # Only cache what was read from one unchanging version of the file
+    if _file_key(before) == _file_key(after):
+        content_cache.put(cache_path, _file_key(after), data, len(data))
+    return data
+
+
+def _remember_write(path: str, data: Optional[bytes]):
+    """Updates the cache with what was just written instead of dropping it."""
+    cache_path = os.path.abspath(path)
+    if data is None:
+        content_cache.invalidate(cache_path)
+        return
+    content_cache.put(cache_path, _file_key(os.stat(path)), data, len(data))
+
+
+def add_listing_source(source: Callable[[str], Optional[list]]):
+    global _listing_sources
+    _listing_sources = _listing_sources + (source,)
+
+
+def remove_listing_source(source: Callable[[str], Optional[list]]):
+    global _listing_sources
+    _listing_sources = tuple(s for s in _listing_sources if s != source)
+
+
+def _scandir_sorted(directory: str) -> List[Tuple[str, bool, bool]]:
+    """(name, is_dir, is_symlink) of a directory's entries, sorted by name."""
+    cache_path = os.path.abspath(directory)
+    for source in _listing_sources:
+        entries = source(cache_path)
+        if entries is not None:
+            return entries
+    # Adding, removing or renaming an entry changes the directory's mtime
+    key = _file_key(os.stat(directory))
+    entries = content_cache.get(cache_path, key)
+    if entries is None:
+        with os.scandir(directory) as iterator:
+            # DirEntry.is_dir uses the file type from the directory listing,
+            # so no extra stat is needed except for symlinks.
+            entries = sorted(
+                (entry.name, entry.is_dir(), entry.is_symlink()) for entry in iterator
+            )
+        content_cache.put(
+            cache_path, key, entries, sum(len(name) + 64 for name, _, _ in entries)
+        )
+    return entries
+
+
+def _get_line_index(path: str, stat_result: os.stat_result, data) -> LineIndex:
+    key = _file_key(stat_result)
+    with _line_indexes_lock:
+        cached = _line_indexes.get(path)
+        if cached is not None and cached[0] == key:
+            _line_indexes.move_to_end(path)
+            return cached[1]
+
+    index = LineIndex(data, stat_result.st_size)
+    with _line_indexes_lock:
+        _line_indexes[path] = (key, index)
+        _line_indexes.move_to_end(path)
+        while len(_line_indexes) > MAX_CACHED_LINE_INDEXES:
+            _line_indexes.popitem(last=False)
+    return index
+
+
+def _split_lines(data: bytes) -> List[bytes]:
+    # Lines end at "\n" only, as in LineIndex; bytes.splitlines would also
+    # split on "\r" and other separators, so line numbers would depend on
+    # the size of the file
+    lines = [line + b"\n" for line in data.split(b"\n")]
+    last = lines.pop()[:-1]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def _format_read(
+    path: str,
+    chunk: bytes,
+    first_line: int,
+    total_lines: int,
+    ranged: bool,
+    max_bytes: int,
+    skip_bytes: int = 0,
+) -> str:
+    truncated = len(chunk) > max_bytes
+    if truncated:
+        # Cut at a line boundary when there is one inside the cap
+        cut = chunk.rfind(b"\n", 0, max_bytes) + 1 or max_bytes
+        chunk = chunk[:cut]
+
+    content = chunk.decode("utf-8", errors="replace")
+    if not ranged and not truncated:
+        return f"Contents of the file {path}:\n{content} "
+
+    lines_returned = chunk.count(b"\n") + (0 if chunk.endswith(b"\n") else 1)
+    last_line = first_line + max(lines_returned, 1) - 1
+    start = f" from byte {skip_bytes} of line {first_line}" if skip_bytes else ""
+    result = (
+        f"Contents of the file {path} "
+        f"(lines {first_line}-{last_line} of {total_lines}{start}):\n{content}"
+    )
+    if truncated:
+        next_line = first_line + chunk.count(b"\n")
+        if next_line == first_line:
+            # The line is longer than the cap; continue inside it
+            result += (
+                f"\n[Output truncated at {max_bytes} bytes inside line "
+                f"{first_line}. Call read_file with offset={first_line} and "
+                f"skip_bytes={skip_bytes + len(chunk)} to continue.]"
+            )
+        else:
+            result += (
+                f"\n[Output truncated at {max_bytes} bytes. "
+                f"Call read_file with offset={next_line} to continue.]"
+            )
+    return result
+
+
+def read_file(
+    path: str,
+    offset: Optional[int] = None,
+    limit: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    skip_bytes: Optional[int] = None,
+) -> str:
+    """Reads a file, optionally only lines offset..offset+limit-1 (1-based).
+
+    skip_bytes drops that many bytes from the start of the first line, to
+    continue a line longer than max_bytes.
+    """
+    max_bytes = min(max_bytes or DEFAULT_MAX_READ_BYTES, DEFAULT_MAX_READ_BYTES)
+    skip_bytes = max(skip_bytes or 0, 0)
+    ranged = offset is not None or limit is not None or skip_bytes > 0
+    first_line = max(offset or 1, 1)
+
+    stat_result = os.stat(path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        # Opening a FIFO or a device can block forever
+        return f"Error: The path {path} is not a regular file."
+    size = stat_result.st_size
+    binary_error = (
+        f"Error: The file at {path} appears to be binary ({size} bytes); "
+        "its contents were not returned."
+    )
+
+    if size < MMAP_THRESHOLD_BYTES:
+        data = _read_bytes(path, stat_result)
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            return binary_error
+        if not ranged:
+            total_lines = data.count(b"\n") + (
+                0 if not data or data.endswith(b"\n") else 1
+            )
+            return _format_read(path, data, 1, total_lines, False, max_bytes)
+        lines = _split_lines(data)
+        end = len(lines) if limit is None else first_line - 1 + limit
+        chunk = b"".join(lines[first_line - 1 : end])[skip_bytes:]
+        return _format_read(
+            path, chunk, first_line, len(lines), True, max_bytes, skip_bytes
+        )
+
+    with open(path, "rb") as file:
+        if b"\0" in file.read(BINARY_SNIFF_BYTES):
+            return binary_error
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            index = _get_line_index(path, stat_result, data)
+            start = index.line_start(data, first_line - 1)
+            if limit is None:
+                end = size
+            else:
+                end = index.line_start(data, first_line - 1 + limit)
+            start = min(start + skip_bytes, end)
+            # Never read more than the cap (plus one byte to detect it)
+            end = min(end, start + max_bytes + 1)
+            return _format_read(
+                path,
+                data[start:end],
+                first_line,
+                index.total_lines,
+                True,
+                max_bytes,
+                skip_bytes,
+            )
+
+
+def _glob_to_regex(pattern: str) -> str:
+    # Git style globs: "*" and "?" stay within one path component, "**"
+    # spans any number of them.
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1 :]:
+            end = pattern.index("]", i + 1)
+            regex += "[" + pattern[i + 1 : end].replace("!", "^", 1) + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+class PathPattern:
+    """A glob matched against a relative path.
+
+    Patterns without a slash match the name at any depth, like .gitignore.
+    """
+
+    def __init__(self, pattern: str):
+        self.directory_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        prefix = "" if anchored else "(?:.*/)?"
+        self.regex = re.compile(prefix + _glob_to_regex(pattern) + r"\Z")
+
+    def matches(self, relative_path: str, is_dir: bool) -> bool:
+        if self.directory_only and not is_dir:
+            return False
+        return self.regex.match(relative_path) is not None
+
+
+class GitIgnore:
+    """The rules of one .gitignore file.
+
+    base is the directory of the file relative to the listing root; prefix is
+    the listing root relative to the directory of the file, for .gitignore
+    files found above the root.
+    """
+
+    def __init__(self, lines: List[str], base: str = "", prefix: str = ""):
+        self.base = base
+        self.prefix = prefix
+        self.rules: List[Tuple[bool, PathPattern]] = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            self.rules.append((negated, PathPattern(line)))
+
+    @classmethod
+    def load(
+        cls, directory: str, base: str = "", prefix: str = ""
+    ) -> Optional["GitIgnore"]:
+        try:
+            data = _read_bytes(os.path.join(directory, ".gitignore"))
+            return cls(data.decode("utf-8").splitlines(), base, prefix)
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def match(self, relative_path: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included, None if no rule applies."""
+        if self.base:
+            if not relative_path.startswith(self.base + "/"):
+                return None
+            relative_path = relative_path[len(self.base) + 1 :]
+        if self.prefix:
+            relative_path = f"{self.prefix}/{relative_path}"
+        result = None
+        for negated, pattern in self.rules:
+            if pattern.matches(relative_path, is_dir):
+                result = not negated
+        return result
+
+
+def _is_ignored(gitignores: List[GitIgnore], relative_path: str, is_dir: bool) -> bool:
+    # Deeper .gitignore files come later and override the ones above them
+    ignored = False
+    for gitignore in gitignores:
+        result = gitignore.match(relative_path, is_dir)
+        if result is not None:
+            ignored = result
+    return ignored
+
+
+def _root_gitignores(root: str) -> List[GitIgnore]:
+    # .gitignore files from the root up to the top of its git repository
+    gitignores = []
+    directory = os.path.abspath(root)
+    while True:
+        gitignore = GitIgnore.load(
+            directory, prefix=os.path.relpath(root, directory).replace(os.sep, "/")
+        )
+        if gitignore is not None:
+            if gitignore.prefix == ".":
+                gitignore.prefix = ""
+            gitignores.insert(0, gitignore)
+        parent = os.path.dirname(directory)
+        if os.path.exists(os.path.join(directory, ".git")) or parent == directory:
+            break
+        directory = parent
+    # Outside a git repository only the root's own .gitignore applies
+    if not os.path.exists(os.path.join(directory, ".git")):
+        gitignores = [gitignore for gitignore in gitignores if not gitignore.prefix]
+    return gitignores
+
+
+def _walk(
+    directory: str,
+    relative_dir: str,
+    depth: int,
+    max_depth: int,
+    gitignores: Optional[List[GitIgnore]],
+    exclude: List[PathPattern],
+    cursor: Optional[Tuple[str, ...]],
+) -> Iterator[Tuple[str, bool]]:
+    """Yields (relative path, is_dir) in sorted pre-order after the cursor.
+
+    Sorted pre-order is the same as ordering by path components, so subtrees
+    that lie entirely before the cursor are skipped without being read.
+    """
+    if gitignores is not None and relative_dir:
+        gitignore = GitIgnore.load(directory, base=relative_dir)
+        if gitignore is not None:
+            gitignores = gitignores + [gitignore]
+
+    for name, is_dir, is_symlink in _scandir_sorted(directory):
+        check_deadline()
+        relative_path = f"{relative_dir}/{name}" if relative_dir else name
+        if is_dir and name == ".git":
+            continue
+        if any(pattern.matches(relative_path, is_dir) for pattern in exclude):
+            continue
+        if gitignores is not None and _is_ignored(gitignores, relative_path, is_dir):
+            continue
+
+        descend = is_dir and depth < max_depth and not is_symlink
+        components = tuple(relative_path.split("/"))
+        if cursor is not None and components <= cursor:
+            # Already listed; only its subtree can still hold the cursor
+            if descend and cursor[: len(components)] == components:
+                yield from _walk(
+                    os.path.join(directory, name),
+                    relative_path,
+                    depth + 1,
+                    max_depth,
+                    gitignores,
+                    exclude,
+                    cursor,
+                )
+            continue
+
+        yield relative_path, is_dir
+        if descend:
+            yield from _walk(
+                os.path.join(directory, name),
+                relative_path,
+                depth + 1,
+                max_depth,
+                gitignores,
+                exclude,
+                None,
+            )
+
+
+def list_files(
+    path: str,
+    max_depth: Optional[int] = None,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    respect_gitignore: Optional[bool] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> str:
+    """Lists a directory tree page by page, following .gitignore by default."""
+    max_depth = max(max_depth or 1, 1)
+    limit = limit or DEFAULT_LIST_LIMIT
+    include_patterns = [PathPattern(pattern) for pattern in include or []]
+    exclude_patterns = [PathPattern(pattern) for pattern in exclude or []]
+    gitignores = _root_gitignores(path) if respect_gitignore is not False else None
+
+    items = []
+    last_listed = None
+    next_cursor = None
+    for relative_path, is_dir in _walk(
+        path,
+        "",
+        1,
+        max_depth,
+        gitignores,
+        exclude_patterns,
+        tuple(cursor.split("/")) if cursor else None,
+    ):
+        # include filters which files are listed; directories are still walked
+        if include_patterns and (
+            is_dir
+            or not any(
+                pattern.matches(relative_path, False) for pattern in include_patterns
+            )
+        ):
+            continue
+        if len(items) == limit:
+            next_cursor = last_listed
+            break
+        items.append(f"[DIR] {relative_path}/" if is_dir else f"[FILE] {relative_path}")
+        last_listed = relative_path
+
+    result = f"Files in directory {path}:\n" + "\n".join(items)
+    if next_cursor is not None:
+        result += (
+            f"\n[More entries available. Call list_files again with "
+            f'cursor="{next_cursor}" to continue.]'
+        )
+    return result
+
+
+def walk_files(root: str, respect_gitignore: bool = True) -> Iterator[str]:
+    """Relative paths of every file under root, skipping what list_files skips."""
+    gitignores = _root_gitignores(root) if respect_gitignore else None
+    for relative_path, is_dir in _walk(root, "", 1, sys.maxsize, gitignores, [], None):
+        if not is_dir:
+            yield relative_path
+
+
+def atomic_write(path: str, chunks: Iterable[bytes]):
+    """Writes chunks to a temporary file next to path, then renames it over
+    path, so a crash leaves either the old or the new file, never half of one.
+    """
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_file(path: str, content: str):
+    data = content.encode("utf-8")
+    atomic_write(path, [data])
+    _remember_write(path, data)
+
+
+def _copy_blocks(data, start: int, end: int) -> Iterator[bytes]:
+    for position in range(start, end, COPY_BLOCK_BYTES):
+        yield data[position : min(position + COPY_BLOCK_BYTES, end)]
+
+
+def _apply_spans(
+    data, size: int, spans: List[Tuple[int, int, bytes]]
+) -> Iterator[bytes]:
+    position = 0
+    for start, end, replacement in spans:
+        yield from _copy_blocks(data, position, start)
+        yield replacement
+        position = end
+    yield from _copy_blocks(data, position, size)
+
+
+def edit_file(path: str, edits: List[Tuple[str, str]]) -> str:
+    """Applies (old_content, new_content) hunks in one pass and one write.
+
+    Like str.replace, every occurrence of each old_content is replaced. All
+    hunks are located in the current file first, so either all of them are
+    applied or, if one is missing or two overlap, none are.
+    """
+    encoded = [(old.encode("utf-8"), new.encode("utf-8")) for old, new in edits]
+    for number, (old, _) in enumerate(encoded, 1):
+        if not old:
+            return f"Error: Edit {number} has empty old content. No changes were made."
+
+    stat_result = os.stat(path)
+    size = stat_result.st_size
+    if size >= STREAMING_EDIT_THRESHOLD_BYTES:
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        data = _read_bytes(path, stat_result)
+    try:
+        spans = []
+        for number, (old, new) in enumerate(encoded, 1):
+            start = data.find(old)
+            if start < 0:
+                if len(edits) == 1:
+                    return f"Error: The specified old content was not found in the file {path}."
+                return (
+                    f"Error: The old content of edit {number} was not found in the "
+                    f"file {path}. No changes were made."
+                )
+            while start >= 0:
+                spans.append((start, start + len(old), new, number))
+                start = data.find(old, start + len(old))
+
+        spans.sort()
+        for previous, current in zip(spans, spans[1:]):
+            if current[0] < previous[1]:
+                return (
+                    f"Error: Edits {previous[3]} and {current[3]} overlap in the "
+                    f"file {path}. No changes were made."
+                )
+
+        chunks = _apply_spans(
+            data, size, [(start, end, new) for start, end, new, _ in spans]
+        )
+        if isinstance(data, mmap.mmap):
+            atomic_write(path, chunks)
+            _remember_write(path, None)
+        else:
+            # Small enough to keep: the cache gets the new version as written
+            new_data = b"".join(chunks)
+            atomic_write(path, [new_data])
+            _remember_write(path, new_data)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    if len(edits) == 1:
+        return f"File {path} has been successfully updated."
+    return (
+        f"File {path} has been successfully updated "
+        f"({len(edits)} edits, {len(spans)} replacements)."
+    )
@@ -1,69 +1,358 @@
 import os
 import sys
 import json
+import re
+import argparse
 import logging
-from dotenv import load_dotenv
-from typing import List, Dict, Any
-from pydantic import BaseModel
-from openai import OpenAI
-
-load_dotenv()
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(message)s",
-    handlers=[logging.FileHandler("agent.log")],
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from context_window import (
+    ContextWindow,
+    deduplicate_tool_results,
+    tool_schema_tokens,
+)
+import file_tools
+from code_index import (
+    DEFAULT_MAX_RESULTS as DEFAULT_SEARCH_RESULTS,
+    CodeIndex,
+    search_code,
+    shared_code_index,
+)
+from relevance_index import (
+    DEFAULT_TOP_K,
+    file_changed,
+    find_relevant_files,
+    relevance_index_for,
+)
+from model_router import (
+    SYNTHESIS_MODES,
+    ModelRouter,
+    Route,
+    RoutingState,
+    configure_shared_model_router,
+    shared_model_router,
+)
+from session_store import SessionStore
+from workspace_watcher import WorkspaceWatcher
+from response_cache import ResponseCache
+from transport import (
+    RetryPolicy,
+    default_timeout,
+    is_rate_limited,
+    shared_http_client,
+)
+from rate_limiter import RateLimiter, configure_shared_rate_limiter, shared_rate_limiter
+from tool_runner import (
+    DEFAULT_TOOL_TIMEOUTS,
+    PROCESS_TOOLS,
+    ToolTimeout,
+    run_with_deadline,
+    shared_worker_pool,
+    timeout_result,
+)
+from tool_output import (
+    DEFAULT_OUTPUT_POLICIES,
+    OutputPolicy,
+    ToolOutputStore,
+    fetch_output,
+    govern_output,
+)
+from metrics import (
+    AgentMetrics,
+    IterationSpan,
+    MetricsSink,
+    PrometheusFileSink,
+    TurnSpan,
 )
 
+# Startup matters for short scripted runs: the OpenAI SDK (with httpx and
+# pydantic) is only imported when the first request is made, and the .env
+# file and log file are set up by the entry points rather than on import.
+
+
+def load_environment():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def configure_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(message)s",
+        handlers=[logging.FileHandler("agent.log")],
+    )
 
-class Tool(BaseModel):
+
+@dataclass
+class Tool:
     name: str
     description: str
     input_schema: Dict[str, Any]
 
 
+SYSTEM_PROMPT = "You are a helpful coding assistant operating in a terminal environment. Output only plain text without markdown formatting, as your responses appear directly in the terminal. Be concise but thorough, providing clear and practical advice with a friendly tone. Don't use any asterisk characters in your responses."
+
+MAX_ITERATIONS = 5
+
+# Tool results starting with these are counted as failed calls
+TOOL_ERROR_PREFIXES = ("Error", "An error")
+
+# Edits to the same file must not interleave, so edit_file calls run one at
+# a time and in the order the model issued them.
+DEFAULT_TOOL_CONCURRENCY = {"edit_file": 1}
+
+
+def _usage_from(usage) -> Optional[Dict[str, int]]:
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+        "cached_tokens": (getattr(details, "cached_tokens", None) or 0),
+    }
+
+
+def _used_tokens(usage: Optional[Dict[str, int]]) -> Optional[int]:
+    if usage is None:
+        return None
+    return usage["prompt_tokens"] + usage["completion_tokens"]
+
+
+def _message_from_completion(response) -> Dict[str, Any]:
+    message = response.choices[0].message
+    tool_calls = [
+        {
+            "id": tool_call.id,
+            "type": "function",
+            "function": {
+                "name": tool_call.function.name,
+                "arguments": tool_call.function.arguments,
+            },
+        }
+        for tool_call in message.tool_calls or []
+    ]
+    return {
+        "content": message.content,
+        "tool_calls": tool_calls,
+        "usage": _usage_from(response.usage),
+    }
+
+
+def _merge_tool_call_fragment(tool_calls_by_index: Dict[int, Dict[str, Any]], fragment):
+    tool_call = tool_calls_by_index.setdefault(
+        fragment.index,
+        {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+    )
+    if fragment.id:
+        tool_call["id"] = fragment.id
+    if fragment.function:
+        if fragment.function.name:
+            tool_call["function"]["name"] += fragment.function.name
+        if fragment.function.arguments:
+            tool_call["function"]["arguments"] += fragment.function.arguments
+
+
+def _message_from_stream(
+    content_parts: List[str],
+    tool_calls_by_index: Dict[int, Dict[str, Any]],
+    usage=None,
+) -> Dict[str, Any]:
+    return {
+        "content": "".join(content_parts) or None,
+        "tool_calls": [
+            tool_calls_by_index[index] for index in sorted(tool_calls_by_index)
+        ],
+        "usage": _usage_from(usage),
+    }
+
+
 class AIAgent:
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
-        self.messages: List[Dict[str, str]] = []
+    def __init__(
+        self,
+        api_key: str,
+        max_tool_workers: int = 8,
+        tool_concurrency: Optional[Dict[str, int]] = None,
+        client=None,
+        context_window: Optional[ContextWindow] = None,
+        session_store: Optional[SessionStore] = None,
+        session_id: Optional[str] = None,
+        response_cache: Optional[ResponseCache] = None,
+        base_url: Optional[str] = None,
+        metrics_sinks: Optional[List[MetricsSink]] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        http_client=None,
+        rate_limiter: Optional[RateLimiter] = None,
+        output_policies: Optional[Dict[str, Optional[OutputPolicy]]] = None,
+        output_digester: Optional[Callable[[str, str, int], str]] = None,
+        deduplicate_context: bool = True,
+        code_index: Optional[CodeIndex] = None,
+        watch_workspace: Optional[str] = None,
+        tool_timeouts: Optional[Dict[str, Optional[float]]] = None,
+        isolated_tools: Optional[List[str]] = None,
+        router: Optional[ModelRouter] = None,
+    ):
+        self.base_url = base_url
+        # Without an http_client, agents share one process-wide connection pool
+        self.http_client = http_client
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Agents in one process draw on the same request and token budget
+        self.rate_limiter = rate_limiter or shared_rate_limiter()
+        self._api_key = api_key
+        self._client = client
+        self._client_lock = threading.Lock()
+        self.messages: List[Dict[str, Any]] = []
+        self.context_window = context_window or ContextWindow()
+        # With a store, every message is persisted as it is produced and an
+        # existing session is picked up where it left off.
+        self.session_store = session_store
+        self.session_id = session_id
+        if session_store is not None and session_id is not None:
+            self.messages = session_store.load(session_id)
+        self.response_cache = response_cache
+        self.metrics = AgentMetrics(metrics_sinks)
+        self._turn: Optional[TurnSpan] = None
+        # Oversized tool results are shortened before they enter the history;
+        # the full text stays reachable through fetch_output.
+        self.output_policies = {**DEFAULT_OUTPUT_POLICIES, **(output_policies or {})}
+        self.output_digester = output_digester
+        self.tool_outputs = ToolOutputStore()
+        self.deduplicate_context = deduplicate_context
+        # search_code answers from a trigram index shared by the process
+        self.code_index = code_index or shared_code_index()
+        # With a workspace to watch, listings under it are answered from an
+        # in-memory snapshot kept current by a background thread
+        self.workspace_watcher = (
+            WorkspaceWatcher(watch_workspace).start() if watch_workspace else None
+        )
+        # A tool call that misses its deadline is answered with a timeout
+        # result; isolated tools run in worker processes that can be killed
+        self.tool_timeouts = {**DEFAULT_TOOL_TIMEOUTS, **(tool_timeouts or {})}
+        self.isolated_tools = set(isolated_tools or ())
+        unsupported = self.isolated_tools - set(PROCESS_TOOLS)
+        if unsupported:
+            raise ValueError(
+                f"Tools {sorted(unsupported)} cannot run in a worker process"
+            )
+        self.worker_pool = shared_worker_pool() if self.isolated_tools else None
+        # Model and sampling parameters are picked per completion; agents
+        # share the process-wide router and its per-route statistics
+        self.router = router or shared_model_router()
         self.tools: Dict[str, Tool] = {}
+        self.max_tool_workers = max_tool_workers
+        self.tool_concurrency = {**DEFAULT_TOOL_CONCURRENCY, **(tool_concurrency or {})}
+        # A call abandoned at its deadline keeps its slot until its thread
+        # really ends, so limited tools (including serial ones) hold a
+        # semaphore that the tool's own thread releases
+        self._tool_semaphores = {
+            name: threading.BoundedSemaphore(limit)
+            for name, limit in self.tool_concurrency.items()
+        }
+        self._tool_executor: Optional[ThreadPoolExecutor] = None
         self._setup_tools()
         logging.info("AI Agent initialized ")
 
+    @property
+    def client(self):
+        # Built on first use; see the note on startup at the top
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client(self._api_key)
+        return self._client
+
+    def _create_client(self, api_key: str):
+        from openai import OpenAI
+
+        # Retries happen in the agent loop, where they are counted and resume
+        # the current iteration, so the SDK's own retries are turned off.
+        return OpenAI(
+            api_key=api_key,
+            base_url=self.base_url,
+            http_client=self.http_client or shared_http_client(),
+            timeout=default_timeout(),
+            max_retries=0,
+        )
+
     def _setup_tools(self):
         self.tools = {
             "read_file": Tool(
                 name="read_file",
-                description="Use this tool to read the contents of a file.",
+                description="Use this tool to read the contents of a file. Large files are returned in pieces; use offset and limit to read a range of lines.",
                 input_schema={
                     "type": "object",
                     "properties": {
                         "path": {
                             "type": "string",
                             "description": "The path to the file to read.",
-                        }
+                        },
+                        "offset": {
+                            "type": "integer",
+                            "description": "The 1-based line number to start reading from.",
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "The maximum number of lines to read.",
+                        },
+                        "max_bytes": {
+                            "type": "integer",
+                            "description": f"The maximum number of bytes to return, at most {file_tools.DEFAULT_MAX_READ_BYTES} (the default).",
+                        },
+                        "skip_bytes": {
+                            "type": "integer",
+                            "description": "Bytes to skip at the start of the first line, to continue reading a line longer than max_bytes.",
+                        },
                     },
                     "required": ["path"],
                 },
             ),
             "list_files": Tool(
                 name="list_files",
-                description="Use this tool to list all files in a directory.",
+                description="Use this tool to list all files in a directory. Set max_depth to list subdirectories recursively. Files ignored by .gitignore are skipped, and long listings are returned in pages.",
                 input_schema={
                     "type": "object",
                     "properties": {
                         "path": {
                             "type": "string",
                             "description": "The path to the directory to list files from.",
-                        }
+                        },
+                        "max_depth": {
+                            "type": "integer",
+                            "description": "How many directory levels to list. 1 lists only the directory itself.",
+                        },
+                        "include": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Glob patterns such as '*.py' or 'src/**/*.ts'; only matching files are listed.",
+                        },
+                        "exclude": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Glob patterns of files and directories to skip.",
+                        },
+                        "respect_gitignore": {
+                            "type": "boolean",
+                            "description": "Skip files ignored by .gitignore. Defaults to true.",
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": f"The maximum number of entries to return. Defaults to {file_tools.DEFAULT_LIST_LIMIT}.",
+                        },
+                        "cursor": {
+                            "type": "string",
+                            "description": "The cursor returned by a previous call, to fetch the next page.",
+                        },
                     },
                     "required": ["path"],
                 },
             ),
             "edit_file": Tool(
                 name="edit_file",
-                description="Use this tool to edit a file.",
+                description="Use this tool to edit a file. Pass several old_content/new_content pairs in edits to make many changes to one file in a single call.",
                 input_schema={
                     "type": "object",
                     "properties": {
@@ -77,101 +366,440 @@ class AIAgent:
                         },
                         "new_content": {
                             "type": "string",
-                            "description": "The new content to replace the old content with.",
+                            "description": "The new content to replace the old content with. Required with old_content; use an empty string to delete it.",
+                        },
+                        "edits": {
+                            "type": "array",
+                            "description": "Several replacements to apply to the file at once. Either all of them are applied or none.",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "old_content": {"type": "string"},
+                                    "new_content": {"type": "string"},
+                                },
+                                "required": ["old_content", "new_content"],
+                            },
                         },
                     },
-                    "required": ["path", "new_content"],
+                    "required": ["path"],
+                },
+            ),
+            "search_code": Tool(
+                name="search_code",
+                description="Use this tool to find where a symbol or text appears in the code. It searches file contents under a directory for a literal string or a regular expression and returns matching lines as path:line: text. Prefer it to listing and reading files one by one.",
+                input_schema={
+                    "type": "object",
+                    "properties": {
+                        "pattern": {
+                            "type": "string",
+                            "description": "The text to search for, or a Python regular expression if regex is true.",
+                        },
+                        "path": {
+                            "type": "string",
+                            "description": "The directory to search in. Defaults to the current directory.",
+                        },
+                        "regex": {
+                            "type": "boolean",
+                            "description": "Treat pattern as a regular expression. Defaults to false.",
+                        },
+                        "ignore_case": {
+                            "type": "boolean",
+                            "description": "Match case-insensitively. Defaults to false.",
+                        },
+                        "include": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Glob patterns such as '*.py'; only matching files are searched.",
+                        },
+                        "max_results": {
+                            "type": "integer",
+                            "description": f"The maximum number of matching lines to return. Defaults to {DEFAULT_SEARCH_RESULTS}.",
+                        },
+                    },
+                    "required": ["pattern"],
+                },
+            ),
+            "find_relevant_files": Tool(
+                name="find_relevant_files",
+                description="Use this tool to find the code related to a question or task described in words, such as 'where are retries handled'. It ranks the files under a directory by BM25 relevance and returns the best matching chunks with their line numbers. Use search_code instead when you know the exact name.",
+                input_schema={
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "What you are looking for, in words or identifiers.",
+                        },
+                        "path": {
+                            "type": "string",
+                            "description": "The directory to search in. Defaults to the current directory.",
+                        },
+                        "top_k": {
+                            "type": "integer",
+                            "description": f"The number of chunks to return. Defaults to {DEFAULT_TOP_K}.",
+                        },
+                        "include": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Glob patterns such as '*.py'; only matching files are ranked.",
+                        },
+                    },
+                    "required": ["query"],
+                },
+            ),
+            "fetch_output": Tool(
+                name="fetch_output",
+                description="Use this tool to read the parts of a shortened tool result, using the handle given at its end.",
+                input_schema={
+                    "type": "object",
+                    "properties": {
+                        "handle": {
+                            "type": "string",
+                            "description": "The handle of the shortened output.",
+                        },
+                        "offset": {
+                            "type": "integer",
+                            "description": "Character offset to start reading at. Defaults to 0.",
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "Maximum number of characters to return.",
+                        },
+                    },
+                    "required": ["handle"],
                 },
             ),
         }
 
-    def _read_file(self, path: str) -> str:
+    def _call_file_tool(self, tool_name: str, function: Callable[..., str], *args):
+        if tool_name in self.isolated_tools:
+            return self.worker_pool.call(
+                tool_name, args, self.tool_timeouts.get(tool_name)
+            )
+        return function(*args)
+
+    def _read_file(
+        self,
+        path: str,
+        offset: Optional[int] = None,
+        limit: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        skip_bytes: Optional[int] = None,
+    ) -> str:
         try:
-            with open(path, "r", encoding="utf-8") as file:
-                content = file.read()
-            return f"Contents of the file {path}:\n{content} "
+            return self._call_file_tool(
+                "read_file",
+                file_tools.read_file,
+                path,
+                offset,
+                limit,
+                max_bytes,
+                skip_bytes,
+            )
         except FileNotFoundError:
             return f"Error: The file at {path} was not found."
         except Exception as e:
             return f"An error occurred while reading the file: {str(e)}"
 
-    def _list_files(self, path: str) -> str:
+    def _list_files(
+        self,
+        path: str,
+        max_depth: Optional[int] = None,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        respect_gitignore: Optional[bool] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> str:
+        # A missing directory is found by the call itself, which for an
+        # isolated tool runs in a worker, so a stat that hangs on a stalled
+        # mount is covered by the deadline
+        try:
+            return self._call_file_tool(
+                "list_files",
+                file_tools.list_files,
+                path,
+                max_depth,
+                include,
+                exclude,
+                respect_gitignore,
+                limit,
+                cursor,
+            )
+        except FileNotFoundError:
+            return f"Error: The directory at {path} does not exist."
+        except Exception as e:
+            return f"An error occurred while listing files: {str(e)}"
+
+    def _search_code(
+        self,
+        pattern: str,
+        path: Optional[str] = None,
+        regex: Optional[bool] = None,
+        ignore_case: Optional[bool] = None,
+        include: Optional[List[str]] = None,
+        max_results: Optional[int] = None,
+    ) -> str:
+        path = path or "."
         try:
-            if not os.path.exists(path):
+            if not os.path.isdir(path):
                 return f"Error: The directory at {path} does not exist."
 
-            items = []
-            for item in sorted(os.listdir(path)):
-                item_path = os.path.join(path, item)
-                if os.path.isdir(item_path):
-                    items.append(f"[DIR] {item}/")
-                else:
-                    items.append(f"[FILE] {item}")
+            return search_code(
+                self.code_index,
+                pattern,
+                path,
+                bool(regex),
+                bool(ignore_case),
+                include,
+                max_results,
+            )
+        except re.error as e:
+            return f"Error: Invalid regular expression {pattern!r}: {e}"
+        except Exception as e:
+            return f"An error occurred while searching the code: {str(e)}"
 
-            return f"Files in directory {path}:\n" + "\n".join(items)
-        except FileNotFoundError:
-            return f"Error: The directory at {path} was not found."
+    def _find_relevant_files(
+        self,
+        query: str,
+        path: Optional[str] = None,
+        top_k: Optional[int] = None,
+        include: Optional[List[str]] = None,
+    ) -> str:
+        path = path or "."
+        try:
+            if not os.path.isdir(path):
+                return f"Error: The directory at {path} does not exist."
+
+            return find_relevant_files(relevance_index_for(path), query, top_k, include)
         except Exception as e:
-            return f"An error occurred while listing files: {str(e)}"
+            return f"An error occurred while ranking files: {str(e)}"
 
-    def _edit_file(self, path: str, old_content: str, new_content: str) -> str:
+    def _file_written(self, path: str):
+        # Keep the search indexes in step with what the agent writes. The
+        # write has already happened, so a failing hook (a locked database,
+        # numpy missing) is logged rather than reported as a failed edit,
+        # which the model might then repeat; the indexes catch up on their
+        # next refresh.
+        hooks = [self.code_index.update_file, file_changed]
+        if self.workspace_watcher is not None:
+            hooks.insert(0, self.workspace_watcher.refresh_path)
+        for hook in hooks:
+            try:
+                hook(path)
+            except Exception as e:
+                logging.warning(f"Could not update indexes for {path}: {e}")
+
+    def _edit_file(
+        self,
+        path: str,
+        old_content: str,
+        new_content: Optional[str],
+        edits: Optional[List[Dict[str, str]]] = None,
+    ) -> str:
         try:
-            if os.path.exists(path) and old_content:
-                with open(path, "r", encoding="utf-8") as file:
-                    current_content = file.read()
-                if old_content and old_content not in current_content:
-                    return f"Error: The specified old content was not found in the file {path}."
+            hunks = [(edit["old_content"], edit["new_content"]) for edit in edits or []]
+            if old_content:
+                # Deleting text takes an explicit empty new_content
+                if new_content is None:
+                    return "Error: old_content was given without new_content."
+                hunks.insert(0, (old_content, new_content))
 
-                content = current_content.replace(old_content, new_content)
-                with open(path, "w", encoding="utf-8") as file:
-                    file.write(content)
+            if hunks:
+                # No separate existence check: the edit's own stat finds a
+                # missing file, so it is one filesystem call under the deadline
+                try:
+                    result = file_tools.edit_file(path, hunks)
+                except FileNotFoundError:
+                    result = None
+                if result is not None:
+                    if not result.startswith(TOOL_ERROR_PREFIXES):
+                        self._file_written(path)
+                    return result
+            if new_content is None:
+                return "Error: Provide new_content or a list of edits."
 
-                return f"File {path} has been successfully updated."
-            else:
-                # Only create directory if path contains sub directories
-                dir_name = os.path.dirname(path)
-                if dir_name:
-                    os.makedirs(dir_name, exist_ok=True)
+            # Only create directory if path contains sub directories
+            dir_name = os.path.dirname(path)
+            if dir_name:
+                os.makedirs(dir_name, exist_ok=True)
 
-                with open(path, "w", encoding="utf-8") as file:
-                    file.write(new_content)
+            file_tools.write_file(path, new_content)
+            self._file_written(path)
 
-                return f"File {path} has been successfully created."
+            return f"File {path} has been successfully created."
         except Exception as e:
             return f"An error occurred while editing the file: {str(e)}"
 
     def _execute_tool(self, tool_name: str, parameters: Dict[str, Any]) -> str:
         try:
             if tool_name == "read_file":
-                return self._read_file(parameters["path"])
+                return self._read_file(
+                    parameters["path"],
+                    parameters.get("offset"),
+                    parameters.get("limit"),
+                    parameters.get("max_bytes"),
+                    parameters.get("skip_bytes"),
+                )
             elif tool_name == "list_files":
-                return self._list_files(parameters["path"])
+                return self._list_files(
+                    parameters["path"],
+                    parameters.get("max_depth"),
+                    parameters.get("include"),
+                    parameters.get("exclude"),
+                    parameters.get("respect_gitignore"),
+                    parameters.get("limit"),
+                    parameters.get("cursor"),
+                )
             elif tool_name == "edit_file":
                 return self._edit_file(
                     parameters["path"],
                     parameters.get("old_content", ""),
-                    parameters["new_content"],
+                    parameters.get("new_content"),
+                    parameters.get("edits"),
+                )
+            elif tool_name == "search_code":
+                return self._search_code(
+                    parameters["pattern"],
+                    parameters.get("path"),
+                    parameters.get("regex"),
+                    parameters.get("ignore_case"),
+                    parameters.get("include"),
+                    parameters.get("max_results"),
+                )
+            elif tool_name == "find_relevant_files":
+                return self._find_relevant_files(
+                    parameters["query"],
+                    parameters.get("path"),
+                    parameters.get("top_k"),
+                    parameters.get("include"),
+                )
+            elif tool_name == "fetch_output":
+                return fetch_output(
+                    self.tool_outputs,
+                    parameters["handle"],
+                    parameters.get("offset") or 0,
+                    parameters.get("limit"),
                 )
             else:
                 return f"Error: Tool {tool_name} is not recognized."
         except Exception as e:
             return f"Error: Error occurred while executing tool {tool_name}."
 
-    def chat(self, user_input: str) -> str:
-        # Add system message at the beginning if not already present
-        if not self.messages or self.messages[0]["role"] != "system":
-            self.messages.insert(
-                0,
-                {
-                    "role": "system",
-                    "content": "You are a helpful coding assistant operating in a terminal environment. Output only plain text without markdown formatting, as your responses appear directly in the terminal. Be concise but thorough, providing clear and practical advice with a friendly tone. Don't use any asterisk characters in your responses.",
-                },
+    def _run_tool_call(self, tool_call: Dict[str, Any]) -> str:
+        tool_name = tool_call["function"]["name"]
+        try:
+            tool_args = json.loads(tool_call["function"]["arguments"])
+        except json.JSONDecodeError as e:
+            # Answered like a failed call, so the tool_calls are not left
+            # without results
+            return f"Error: The arguments for {tool_name} are not valid JSON: {e}"
+
+        semaphore = self._tool_semaphores.get(tool_name)
+        if semaphore is None:
+            return self._timed_execute_tool(tool_name, tool_args)
+        # A slot held by a call abandoned at its deadline comes back only when
+        # that call really ends, which for a hung mount may be never, so the
+        # wait for a slot is bounded by the tool's deadline too
+        if not semaphore.acquire(timeout=self.tool_timeouts.get(tool_name)):
+            return self._no_slot_result(tool_name)
+        return self._timed_execute_tool(tool_name, tool_args, semaphore.release)
+
+    def _no_slot_result(self, tool_name: str) -> str:
+        """The result for a call that got no slot before its deadline; it
+        was never run."""
+        timeout = self.tool_timeouts[tool_name]
+        logging.warning(f"Tool {tool_name} got no free slot within {timeout:g}s")
+        if self._turn is not None:
+            self._turn.record_tool(tool_name, timeout, False, True)
+        return timeout_result(tool_name, timeout)
+
+    def _timed_execute_tool(
+        self,
+        tool_name: str,
+        tool_args: Dict[str, Any],
+        release: Optional[Callable[[], None]] = None,
+    ) -> str:
+        """Runs a tool under its deadline; release is called once it ends."""
+        started = time.perf_counter()
+        timeout = self.tool_timeouts.get(tool_name)
+        try:
+            if tool_name in self.isolated_tools:
+                # The worker pool enforces the deadline, killing late workers
+                try:
+                    result, timed_out = self._execute_tool(tool_name, tool_args), False
+                finally:
+                    if release is not None:
+                        release()
+            else:
+                result, timed_out = run_with_deadline(
+                    tool_name,
+                    lambda: self._execute_tool(tool_name, tool_args),
+                    timeout,
+                    release,
+                )
+        except ToolTimeout:
+            result, timed_out = timeout_result(tool_name, timeout), True
+        if self._turn is not None:
+            self._turn.record_tool(
+                tool_name,
+                time.perf_counter() - started,
+                not result.startswith(TOOL_ERROR_PREFIXES),
+                timed_out,
+            )
+        return govern_output(
+            tool_name,
+            result,
+            self.output_policies.get(tool_name),
+            self.tool_outputs,
+            self.output_digester,
+        )
+
+    def _run_serial_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[str]:
+        return [self._run_tool_call(tool_call) for tool_call in tool_calls]
+
+    def _run_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[str]:
+        if len(tool_calls) == 1 or self.max_tool_workers <= 1:
+            return self._run_serial_tool_calls(tool_calls)
+
+        if self._tool_executor is None:
+            self._tool_executor = ThreadPoolExecutor(
+                max_workers=self.max_tool_workers, thread_name_prefix="agent-tool"
+            )
+
+        # Calls to tools limited to one at a time share a single task so they
+        # keep their call order; everything else gets a task of its own.
+        serial_groups: Dict[str, List[int]] = {}
+        futures = {}
+        for index, tool_call in enumerate(tool_calls):
+            tool_name = tool_call["function"]["name"]
+            if self.tool_concurrency.get(tool_name) == 1:
+                serial_groups.setdefault(tool_name, []).append(index)
+            else:
+                futures[(index,)] = self._tool_executor.submit(
+                    self._run_serial_tool_calls, [tool_call]
+                )
+        for indexes in serial_groups.values():
+            futures[tuple(indexes)] = self._tool_executor.submit(
+                self._run_serial_tool_calls, [tool_calls[i] for i in indexes]
             )
 
-        self.messages.append({"role": "user", "content": user_input})
+        results: List[str] = [""] * len(tool_calls)
+        for indexes, future in futures.items():
+            for index, result in zip(indexes, future.result()):
+                results[index] = result
+        return results
 
+    def close(self):
+        if self._tool_executor is not None:
+            self._tool_executor.shutdown(wait=False)
+            self._tool_executor = None
+        if self.workspace_watcher is not None:
+            self.workspace_watcher.stop()
+            self.workspace_watcher = None
+
+    def _tool_schemas(self) -> List[Dict[str, Any]]:
         # Format tools for OpenAI API
-        tool_schemas = [
+        return [
             {
                 "type": "function",
                 "function": {
@@ -183,69 +811,343 @@ class AIAgent:
             for tool in self.tools.values()
         ]
 
-        max_iterations = 5
-        iteration = 0
+    def _request_params(
+        self, tool_schemas: List[Dict[str, Any]], route: Optional[Route] = None
+    ) -> Dict[str, Any]:
+        route = route or self.router.fast
+        # Repeated tool output is folded in what is sent, not in the history
+        messages = (
+            deduplicate_tool_results(self.messages)
+            if self.deduplicate_context
+            else self.messages
+        )
+        return {
+            "model": route.model,
+            "messages": messages,
+            "tools": tool_schemas,
+            "tool_choice": "auto",
+            "temperature": route.temperature,
+            "max_tokens": route.max_tokens,
+        }
+
+    def _compact_history(self, tool_schemas: List[Dict[str, Any]]):
+        # Keep the prompt, tool schemas and reply within the token budget
+        reserved_tokens = tool_schema_tokens(tool_schemas) + self.router.max_tokens
+        if self.context_window.compact(self.messages, reserved_tokens=reserved_tokens):
+            self._save_snapshot()
+
+    def _append_message(self, message: Dict[str, Any]):
+        self.messages.append(message)
+        if self.session_store is not None and self.session_id is not None:
+            self.session_store.append(self.session_id, message)
+
+    def _save_snapshot(self):
+        if self.session_store is not None and self.session_id is not None:
+            self.session_store.snapshot(self.session_id, self.messages)
+
+    def _create_completion(
+        self,
+        tool_schemas: List[Dict[str, Any]],
+        on_token: Optional[Callable[[str], None]] = None,
+        span: Optional[IterationSpan] = None,
+        route: Optional[Route] = None,
+    ) -> Dict[str, Any]:
+        route = route or self.router.fast
+        params = self._request_params(tool_schemas, route)
+        span = span or IterationSpan(0)
+        span.model = params["model"]
+        span.route = route.name
+        started = time.perf_counter()
+        try:
+            if self.response_cache is None:
+                assistant_message = self._request_with_retries(params, on_token, span)
+                span.record_usage(assistant_message["usage"])
+                return assistant_message
+
+            cached = self.response_cache.get(params)
+            if cached is not None:
+                logging.info("Completion served from the response cache")
+                span.cached_response = True
+                if on_token is not None and cached["content"]:
+                    on_token(cached["content"])
+                return cached
+            assistant_message = self._request_with_retries(params, on_token, span)
+            span.record_usage(assistant_message["usage"])
+            self.response_cache.put(
+                params,
+                {
+                    "content": assistant_message["content"],
+                    "tool_calls": assistant_message["tool_calls"],
+                },
+            )
+            return assistant_message
+        finally:
+            span.completion_seconds = time.perf_counter() - started
+
+    def _routed_completion(
+        self,
+        tool_schemas: List[Dict[str, Any]],
+        on_token: Optional[Callable[[str], None]],
+        span: IterationSpan,
+        routing: RoutingState,
+    ) -> Tuple[Dict[str, Any], IterationSpan]:
+        """Runs the iteration's completion on the route the router picks.
+
+        Returns the reply and the span it was recorded in, which is a new one
+        when a fast answer was discarded and asked of the strong route.
+        """
+        routed = self.router.begin(routing, on_token)
+        assistant_message = self._create_completion(
+            tool_schemas, routed.on_token, span, routed.route
+        )
+        repeat_route = routed.finish(span, assistant_message)
+        if repeat_route is None:
+            return assistant_message, span
+        span = self._turn.start_iteration(span.iteration)
+        assistant_message = self._create_completion(
+            tool_schemas, on_token, span, repeat_route
+        )
+        routed.record_repeat(span)
+        return assistant_message, span
+
+    def _record_routed_tools(self, routing: RoutingState, tool_results: List[str]):
+        failed = sum(result.startswith(TOOL_ERROR_PREFIXES) for result in tool_results)
+        self.router.record_tools(routing, failed)
+
+    def _request_with_retries(
+        self,
+        params: Dict[str, Any],
+        on_token: Optional[Callable[[str], None]],
+        span: IterationSpan,
+    ) -> Dict[str, Any]:
+        # The history is only extended once a completion succeeds, so a retry
+        # repeats this request and keeps the tool results of earlier iterations.
+        estimated_tokens = self._estimate_request_tokens(params)
+        attempt = 0
+        while True:
+            span.rate_limit_wait_seconds += self.rate_limiter.acquire(estimated_tokens)
+            streamed = False
+
+            def forward(token: str):
+                nonlocal streamed
+                streamed = True
+                on_token(token)
 
-        while iteration < max_iterations:
-            iteration += 1
             try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=self.messages,
-                    tools=tool_schemas,
-                    tool_choice="auto",
-                    temperature=0.7,
-                    max_tokens=1500,
+                assistant_message = self._request_completion(
+                    params, forward if on_token is not None else None
                 )
-
-                assistant_message = response.choices[0].message
-                self.messages.append(
-                    {
-                        "role": "assistant",
-                        "content": assistant_message.content,
-                        "tool_calls": assistant_message.tool_calls,
-                    }
+            except Exception as error:
+                if is_rate_limited(error):
+                    self.rate_limiter.record_rate_limited()
+                # Tokens already shown to the user cannot be taken back
+                delay = (
+                    None if streamed else self.retry_policy.retry_delay(error, attempt)
                 )
-                logging.info(f"Assistant message: {assistant_message}")
-                # Check if the assistant wants to call tools
-                if assistant_message.tool_calls:
-                    # Execute each tool call
-                    logging.info(f"Tool calls detected: {assistant_message.tool_calls}")
-                    for tool_call in assistant_message.tool_calls:
-                        tool_name = tool_call.function.name
-                        tool_args = json.loads(tool_call.function.arguments)
-
-                        # Execute the tool
-                        tool_result = self._execute_tool(tool_name, tool_args)
-
-                        # Add tool result to messages
-                        self.messages.append(
-                            {
-                                "role": "tool",
-                                "tool_call_id": tool_call.id,
-                                "content": tool_result,
-                            }
-                        )
+                if delay is None:
+                    raise
+                attempt += 1
+                span.retries += 1
+                logging.warning(
+                    f"Completion request failed ({error}); retry {attempt} in {delay:.2f}s"
+                )
+                time.sleep(delay)
+            else:
+                self.rate_limiter.record_success(
+                    estimated_tokens, _used_tokens(assistant_message["usage"])
+                )
+                return assistant_message
 
-                    # Continue the loop to get the final response
-                    continue
-                else:
-                    # No tool calls, return the assistant's response
-                    logging.info(
-                        f"Final assistant response: {assistant_message.content}"
-                    )
-                    return (
-                        assistant_message.content
-                        or "I apologize, but I couldn't generate a response."
+    def _estimate_request_tokens(self, params: Dict[str, Any]) -> int:
+        if self.rate_limiter.tokens_per_minute is None:
+            return 0
+        # The messages sent may be copies folded by deduplicate_tool_results;
+        # those are counted but not cached
+        return (
+            self.context_window.total_tokens(params["messages"], remember=False)
+            + tool_schema_tokens(params.get("tools") or [])
+            + params["max_tokens"]
+        )
+
+    def _request_completion(
+        self,
+        params: Dict[str, Any],
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
+        if on_token is None:
+            response = self.client.chat.completions.create(**params)
+            return _message_from_completion(response)
+
+        # Streaming: forward content deltas as they arrive and stitch the
+        # tool call fragments back together by their index.
+        stream = self.client.chat.completions.create(
+            **params, stream=True, stream_options={"include_usage": True}
+        )
+        content_parts: List[str] = []
+        tool_calls_by_index: Dict[int, Dict[str, Any]] = {}
+        usage = None
+        for chunk in stream:
+            # With include_usage the last chunk has no choices, only usage
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                on_token(delta.content)
+            for fragment in delta.tool_calls or []:
+                _merge_tool_call_fragment(tool_calls_by_index, fragment)
+
+        return _message_from_stream(content_parts, tool_calls_by_index, usage)
+
+    def _start_turn(self, user_input: str):
+        # Add system message at the beginning if not already present
+        if not self.messages or self.messages[0]["role"] != "system":
+            self.messages.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
+            self._save_snapshot()
+
+        self._append_message({"role": "user", "content": user_input})
+
+    def _record_assistant_message(self, assistant_message: Dict[str, Any]):
+        message = {"role": "assistant", "content": assistant_message["content"]}
+        if assistant_message["tool_calls"]:
+            message["tool_calls"] = assistant_message["tool_calls"]
+        self._append_message(message)
+        logging.info(f"Assistant message: {assistant_message}")
+        if assistant_message["tool_calls"]:
+            logging.info(f"Tool calls detected: {assistant_message['tool_calls']}")
+
+    def _record_tool_results(
+        self, tool_calls: List[Dict[str, Any]], tool_results: List[str]
+    ):
+        # Add tool results to messages in tool call order
+        for tool_call, tool_result in zip(tool_calls, tool_results):
+            self._append_message(
+                {
+                    "role": "tool",
+                    "tool_call_id": tool_call["id"],
+                    "content": tool_result,
+                }
+            )
+
+    def _final_response(self, assistant_message: Dict[str, Any]) -> str:
+        logging.info(f"Final assistant response: {assistant_message['content']}")
+        return (
+            assistant_message["content"]
+            or "I apologize, but I couldn't generate a response."
+        )
+
+    def chat(
+        self, user_input: str, on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        self._start_turn(user_input)
+        tool_schemas = self._tool_schemas()
+        turn = self._turn = self.metrics.start_turn(self.session_id)
+        routing = self.router.start_turn()
+
+        iteration = 0
+
+        try:
+            while iteration < MAX_ITERATIONS:
+                iteration += 1
+                span = turn.start_iteration(iteration)
+                try:
+                    self._compact_history(tool_schemas)
+                    assistant_message, span = self._routed_completion(
+                        tool_schemas, on_token, span, routing
                     )
+                    self._record_assistant_message(assistant_message)
 
-            except Exception as e:
-                return f"An error occurred during chat completion: {str(e)}"
+                    # Check if the assistant wants to call tools
+                    if assistant_message["tool_calls"]:
+                        # Execute the tool calls, concurrently when there are several
+                        started = time.perf_counter()
+                        tool_results = self._run_tool_calls(
+                            assistant_message["tool_calls"]
+                        )
+                        span.tool_seconds = time.perf_counter() - started
+                        self._record_tool_results(
+                            assistant_message["tool_calls"], tool_results
+                        )
+                        self._record_routed_tools(routing, tool_results)
 
-        return "Maximum iterations reached. The conversation may be too complex."
+                        # Continue the loop to get the final response
+                        continue
+                    else:
+                        # No tool calls, return the assistant's response
+                        turn.outcome = "answer"
+                        return self._final_response(assistant_message)
+
+                except Exception as e:
+                    return f"An error occurred during chat completion: {str(e)}"
+
+            turn.outcome = "max_iterations"
+            return "Maximum iterations reached. The conversation may be too complex."
+        finally:
+            turn.escalation = routing.escalation
+            self.metrics.finish_turn(turn)
 
 
 def main():
+    load_environment()
+    configure_logging()
+    parser = argparse.ArgumentParser(description="AI code assistant")
+    parser.add_argument(
+        "--session", help="Session id to persist the conversation under and resume"
+    )
+    parser.add_argument(
+        "--sessions-dir", default="sessions", help="Directory for session logs"
+    )
+    parser.add_argument(
+        "--response-cache",
+        metavar="PATH",
+        help="Answer repeated requests from an on-disk cache at PATH",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="Write Prometheus text-format metrics to PATH after every turn",
+    )
+    parser.add_argument(
+        "--rpm", type=float, help="Requests per minute allowed to the API"
+    )
+    parser.add_argument(
+        "--tpm", type=float, help="Tokens per minute allowed to the API"
+    )
+    parser.add_argument(
+        "--watch",
+        metavar="DIR",
+        nargs="?",
+        const=".",
+        help="Keep a live snapshot of DIR (default: the current directory)",
+    )
+    parser.add_argument(
+        "--isolate-tools",
+        metavar="TOOLS",
+        help="Comma separated tools to run in killable worker processes "
+        f"(any of {', '.join(PROCESS_TOOLS)})",
+    )
+    parser.add_argument(
+        "--fast-model", help="Model for iterations that are still calling tools"
+    )
+    parser.add_argument(
+        "--strong-model",
+        help="Model for escalated turns and, with --synthesis, for answers",
+    )
+    parser.add_argument(
+        "--synthesis",
+        choices=SYNTHESIS_MODES,
+        help="Move answers written after tool calls to the strong model",
+    )
+    args = parser.parse_args()
+    if args.rpm or args.tpm:
+        configure_shared_rate_limiter(args.rpm, args.tpm)
+    if args.fast_model or args.strong_model or args.synthesis:
+        configure_shared_model_router(
+            args.fast_model, args.strong_model, synthesis=args.synthesis
+        )
+
     print("Starting AI Agent...")
     api_key = os.getenv("OPENAI_API_KEY")
     print(f"API key found: {'Yes' if api_key else 'No'}")
@@ -254,8 +1156,21 @@ def main():
         print("Error: OPENAI_API_KEY is not set in environment variables.")
         sys.exit(1)
 
-    agent = AIAgent(api_key=api_key)
-    # test the tool
+    session_store = SessionStore(args.sessions_dir) if args.session else None
+    response_cache = ResponseCache(args.response_cache) if args.response_cache else None
+    agent = AIAgent(
+        api_key=api_key,
+        session_store=session_store,
+        session_id=args.session,
+        response_cache=response_cache,
+        metrics_sinks=(
+            [PrometheusFileSink(args.metrics_file)] if args.metrics_file else None
+        ),
+        watch_workspace=args.watch,
+        isolated_tools=args.isolate_tools.split(",") if args.isolate_tools else None,
+    )
+    if agent.messages:
+        print(f"Resumed session {args.session} with {len(agent.messages)} messages.")
 
     print("AI Code assistant is ready for interaction.")
     print("================================")
@@ -275,11 +1190,29 @@ def main():
 
         print("Assistant:", end="", flush=True)
 
-        response = agent.chat(user_input)
+        # Print the reply as it streams in instead of after it is complete
+        streamed: List[str] = []
 
-        print(response)
+        def on_token(token: str):
+            streamed.append(token)
+            print(token, end="", flush=True)
+
+        response = agent.chat(user_input, on_token=on_token)
+
+        if "".join(streamed).endswith(response):
+            print()
+        else:
+            print(response)
         print()
 
+    for name, stats in agent.router.snapshot().items():
+        logging.info(
+            f"Route {name}: {stats.requests} completions, "
+            f"{stats.mean_seconds:.2f}s mean, {stats.prompt_tokens} prompt and "
+            f"{stats.completion_tokens} completion tokens, "
+            f"{stats.discarded} answers discarded"
+        )
+
 
 if __name__ == "__main__":
     main()
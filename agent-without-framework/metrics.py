@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import file_tools
+
+# Histogram buckets in seconds, from fast local tools to slow completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+@dataclass
+class ToolSpan:
+    name: str
+    seconds: float
+    ok: bool
+    timed_out: bool = False
+
+
+@dataclass
+class IterationSpan:
+    iteration: int
+    model: str = ""
+    route: str = ""
+    completion_seconds: float = 0.0
+    tool_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    retries: int = 0
+    rate_limit_wait_seconds: float = 0.0
+    cached_response: bool = False
+    # The answer was not used and the request was repeated on another route
+    discarded: bool = False
+    tools: List[ToolSpan] = field(default_factory=list)
+
+    def record_usage(self, usage: Optional[Dict[str, int]]):
+        if usage:
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+            self.cached_tokens += usage.get("cached_tokens", 0)
+
+
+@dataclass
+class TurnSpan:
+    session_id: Optional[str]
+    started_at: float
+    seconds: float = 0.0
+    outcome: str = "error"
+    # Why the model router moved the turn to its strong route, if it did
+    escalation: Optional[str] = None
+    iterations: List[IterationSpan] = field(default_factory=list)
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
+
+    def start_iteration(self, iteration: int) -> IterationSpan:
+        span = IterationSpan(iteration)
+        self.iterations.append(span)
+        return span
+
+    def record_tool(self, name: str, seconds: float, ok: bool, timed_out: bool = False):
+        # Tools of one iteration finish on different threads
+        with self._lock:
+            if self.iterations:
+                self.iterations[-1].tools.append(ToolSpan(name, seconds, ok, timed_out))
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(span.prompt_tokens for span in self.iterations)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(span.completion_tokens for span in self.iterations)
+
+    @property
+    def cached_tokens(self) -> int:
+        return sum(span.cached_tokens for span in self.iterations)
+
+    @property
+    def completion_seconds(self) -> float:
+        return sum(span.completion_seconds for span in self.iterations)
+
+    @property
+    def tool_seconds(self) -> float:
+        return sum(span.tool_seconds for span in self.iterations)
+
+    @property
+    def retries(self) -> int:
+        return sum(span.retries for span in self.iterations)
+
+
+class MetricsSink:
+    """Receives every finished turn."""
+
+    def record(self, turn: TurnSpan):
+        raise NotImplementedError
+
+
+class InMemorySink(MetricsSink):
+    def __init__(self, max_turns: int = 10_000):
+        self.turns: "deque[TurnSpan]" = deque(maxlen=max_turns)
+        self._lock = threading.Lock()
+
+    def record(self, turn: TurnSpan):
+        with self._lock:
+            self.turns.append(turn)
+
+    def snapshot(self) -> List[TurnSpan]:
+        with self._lock:
+            return list(self.turns)
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class PrometheusFileSink(MetricsSink):
+    """Aggregates turns and rewrites a Prometheus text-format file after each.
+
+    Point node_exporter's textfile collector, or anything else that reads
+    the exposition format, at path.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        prefix: str = "agent",
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.path = path
+        self.prefix = prefix
+        self.buckets = buckets
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], _Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram(self.buckets)
+        histogram.observe(value)
+
+    def record(self, turn: TurnSpan):
+        with self._lock:
+            self._count("turns_total", outcome=turn.outcome)
+            self._observe("turn_seconds", turn.seconds)
+            if turn.escalation:
+                self._count("route_escalations_total", reason=turn.escalation)
+            for span in turn.iterations:
+                route = {"model": span.model, "route": span.route}
+                self._count("iterations_total", **route)
+                self._count("retries_total", span.retries, **route)
+                self._count(
+                    "rate_limit_wait_seconds_total", span.rate_limit_wait_seconds
+                )
+                self._count("tokens_total", span.prompt_tokens, kind="prompt", **route)
+                self._count(
+                    "tokens_total", span.completion_tokens, kind="completion", **route
+                )
+                self._count("tokens_total", span.cached_tokens, kind="cached", **route)
+                if span.cached_response:
+                    self._count("response_cache_hits_total")
+                if span.discarded:
+                    self._count("discarded_answers_total", **route)
+                self._observe("completion_seconds", span.completion_seconds, **route)
+                for tool in span.tools:
+                    self._count(
+                        "tool_calls_total", tool=tool.name, ok=str(tool.ok).lower()
+                    )
+                    if tool.timed_out:
+                        self._count("tool_timeouts_total", tool=tool.name)
+                    self._observe("tool_seconds", tool.seconds, tool=tool.name)
+            text = self._render()
+        file_tools.atomic_write(self.path, [text.encode("utf-8")])
+
+    def _render(self) -> str:
+        lines = []
+        for name in sorted({name for name, _ in self._counters}):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter, labels), value in sorted(self._counters.items()):
+                if counter == name:
+                    lines.append(f"{metric}{_labels(labels)} {value:g}")
+        for name in sorted({name for name, _ in self._histograms}):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for (histogram_name, labels), histogram in sorted(
+                self._histograms.items(), key=lambda item: item[0]
+            ):
+                if histogram_name != name:
+                    continue
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    bucket_labels = labels + (("le", f"{bound:g}"),)
+                    lines.append(f"{metric}_bucket{_labels(bucket_labels)} {count}")
+                lines.append(
+                    f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} "
+                    f"{histogram.count}"
+                )
+                lines.append(f"{metric}_sum{_labels(labels)} {histogram.total:g}")
+                lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class AgentMetrics:
+    """Builds turn spans for an agent and hands finished ones to the sinks."""
+
+    def __init__(self, sinks: Optional[List[MetricsSink]] = None):
+        self.sinks = list(sinks or [])
+
+    def start_turn(self, session_id: Optional[str] = None) -> TurnSpan:
+        return TurnSpan(session_id=session_id, started_at=time.time())
+
+    def finish_turn(self, turn: TurnSpan):
+        turn.seconds = time.perf_counter() - turn._started
+        for sink in self.sinks:
+            sink.record(turn)
@@ -0,0 +1,363 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# One turn: list files, read a file, then answer
+DEFAULT_SCRIPT = [
+    {"tool_calls": [{"name": "list_files", "arguments": {"path": "."}}]},
+    {"tool_calls": [{"name": "read_file", "arguments": {"path": "README.md"}}]},
+    {"content": "The project is a small AI agent that can read, list and edit files."},
+]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that drop idle keep-alive connections are not errors
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def _estimate_tokens(value: Any) -> int:
+    return len(json.dumps(value)) // 4 + 1
+
+
+class MockOpenAIServer:
+    """Local stand-in for the chat completions API.
+
+    The script describes the iterations of one turn: the n-th completion
+    request after a user message gets script[n], either {"content": ...} or
+    {"tool_calls": [{"name": ..., "arguments": {...}}]}. Because the step is
+    derived from the request itself, any number of conversations can run
+    against the server at once. latency delays the first byte of every
+    response and tokens_per_second paces streamed content. error_rate is
+    the share of requests answered with a 429 carrying Retry-After, and
+    requests_per_minute makes the server enforce a quota the same way.
+    """
+
+    def __init__(
+        self,
+        script: Optional[List[Dict[str, Any]]] = None,
+        latency: float = 0.0,
+        tokens_per_second: Optional[float] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        error_rate: float = 0.0,
+        retry_after: float = 0.05,
+        requests_per_minute: Optional[float] = None,
+    ):
+        self.script = script or DEFAULT_SCRIPT
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.requests_per_minute = requests_per_minute
+        self._window_start = 0.0
+        self._window_requests = 0
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.requests: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="mock-openai", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def step_for(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        step = 0
+        for message in reversed(messages):
+            if message["role"] == "user":
+                break
+            if message["role"] == "assistant":
+                step += 1
+        return self.script[min(step, len(self.script) - 1)]
+
+    def over_quota(self) -> Optional[float]:
+        """Seconds until the current one-second quota window ends, if it is full."""
+        if not self.requests_per_minute:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_requests = 0
+            if self._window_requests >= self.requests_per_minute / 60:
+                return 1.0 - (now - self._window_start)
+            self._window_requests += 1
+        return None
+
+    def _record(self, record: Dict[str, Any]):
+        with self._lock:
+            self.requests.append(record)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; without this, delayed
+            # ACKs add tens of milliseconds to every response.
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                received = time.perf_counter()
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "Not found"}})
+                    return
+
+                request = json.loads(body)
+                step = server.step_for(request["messages"])
+                time.sleep(server.latency)
+                retry_after = server.over_quota()
+                if retry_after is None and random.random() < server.error_rate:
+                    retry_after = server.retry_after
+                if retry_after is not None:
+                    self._send_json(
+                        429,
+                        {
+                            "error": {
+                                "message": "Rate limit reached",
+                                "type": "requests",
+                            }
+                        },
+                        {"Retry-After": f"{retry_after:.3f}"},
+                    )
+                elif request.get("stream"):
+                    self._stream(request, step)
+                else:
+                    self._send_json(200, self._completion(request, step))
+                server._record(
+                    {
+                        "messages": len(request["messages"]),
+                        "status": self._status,
+                        "stream": bool(request.get("stream")),
+                        "service_time": time.perf_counter() - received,
+                    }
+                )
+
+            def _usage(self, request, step) -> Dict[str, int]:
+                prompt_tokens = _estimate_tokens(request["messages"])
+                completion_tokens = _estimate_tokens(step)
+                return {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+
+            def _tool_calls(self, step) -> List[Dict[str, Any]]:
+                return [
+                    {
+                        "id": f"call_{uuid.uuid4().hex[:24]}",
+                        "type": "function",
+                        "function": {
+                            "name": tool_call["name"],
+                            "arguments": json.dumps(tool_call.get("arguments", {})),
+                        },
+                    }
+                    for tool_call in step.get("tool_calls", [])
+                ]
+
+            def _completion(self, request, step) -> Dict[str, Any]:
+                tool_calls = self._tool_calls(step)
+                message = {"role": "assistant", "content": step.get("content")}
+                if tool_calls:
+                    message["tool_calls"] = tool_calls
+                return {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": message,
+                            "finish_reason": "tool_calls" if tool_calls else "stop",
+                        }
+                    ],
+                    "usage": self._usage(request, step),
+                }
+
+            def _stream(self, request, step):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+                def send_chunk(delta, finish_reason=None, usage=None, choices=True):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request["model"],
+                        "choices": (
+                            [
+                                {
+                                    "index": 0,
+                                    "delta": delta,
+                                    "finish_reason": finish_reason,
+                                }
+                            ]
+                            if choices
+                            else []
+                        ),
+                    }
+                    if usage is not None:
+                        chunk["usage"] = usage
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+
+                delay = 1 / server.tokens_per_second if server.tokens_per_second else 0
+                send_chunk({"role": "assistant", "content": ""})
+                words = (step.get("content") or "").split(" ")
+                for index, word in enumerate(words if step.get("content") else []):
+                    send_chunk({"content": word if index == 0 else " " + word})
+                    time.sleep(delay)
+
+                for index, tool_call in enumerate(self._tool_calls(step)):
+                    arguments = tool_call["function"]["arguments"]
+                    middle = len(arguments) // 2
+                    send_chunk(
+                        {
+                            "tool_calls": [
+                                {
+                                    "index": index,
+                                    "id": tool_call["id"],
+                                    "type": "function",
+                                    "function": {
+                                        "name": tool_call["function"]["name"],
+                                        "arguments": arguments[:middle],
+                                    },
+                                }
+                            ]
+                        }
+                    )
+                    send_chunk(
+                        {
+                            "tool_calls": [
+                                {
+                                    "index": index,
+                                    "function": {"arguments": arguments[middle:]},
+                                }
+                            ]
+                        }
+                    )
+                    time.sleep(delay)
+
+                send_chunk({}, "tool_calls" if step.get("tool_calls") else "stop")
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    send_chunk(None, usage=self._usage(request, step), choices=False)
+                self._write_chunk("data: [DONE]\n\n")
+                self._write_chunk("")
+
+            def _write_chunk(self, text: str):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def send_response(self, code, message=None):
+                self._status = code
+                super().send_response(code, message)
+
+            def _send_json(
+                self,
+                status: int,
+                payload: Dict[str, Any],
+                headers: Optional[Dict[str, str]] = None,
+            ):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local OpenAI-compatible chat completions server for testing"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--script", help="JSON file with the list of steps of one turn")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds before each response"
+    )
+    parser.add_argument(
+        "--tokens-per-second", type=float, help="Pace of streamed content tokens"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Share of requests answered with 429 Too Many Requests",
+    )
+    parser.add_argument(
+        "--rpm", type=float, help="Requests per minute before answering 429"
+    )
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as file:
+            script = json.load(file)
+
+    server = MockOpenAIServer(
+        script,
+        args.latency,
+        args.tokens_per_second,
+        args.host,
+        args.port,
+        error_rate=args.error_rate,
+        requests_per_minute=args.rpm,
+    )
+    print(f"Mock OpenAI server listening on {server.url}")
+    print(f"Point the agent at it with OPENAI_BASE_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import IterationSpan
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    model: str
+    temperature: float = 0.7
+    max_tokens: int = 1500
+
+
+DEFAULT_ROUTES: Dict[str, Route] = {
+    # Picks tools and reads their results
+    "fast": Route("fast", "gpt-4o-mini", temperature=0.7, max_tokens=1500),
+    # Writes answers from gathered context and takes over when things go wrong
+    "strong": Route("strong", "gpt-4o", temperature=0.2, max_tokens=1500),
+}
+
+# Tool iterations in one turn after which the rest of the turn is escalated
+DEFAULT_ESCALATE_AFTER = 3
+
+# How answers written after tool calls may be moved to the strong route:
+# - after_tools: every completion that follows tool results is sent to the
+#   strong route, decided before the request is made
+# - redo: a fast answer written after tool calls is discarded and the request
+#   repeated on the strong route; the answer is generated twice and streamed
+#   tokens are held back until it is kept
+SYNTHESIS_MODES = ("after_tools", "redo")
+
+
+@dataclass
+class RouteStats:
+    requests: int = 0
+    seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    # Completions whose answer was thrown away and asked of the strong route
+    discarded: int = 0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.requests if self.requests else 0.0
+
+
+@dataclass
+class RoutingState:
+    """What the router knows about the turn so far."""
+
+    tool_iterations: int = 0
+    failed_tools: int = 0
+    retries: int = 0
+    escalation: Optional[str] = None
+
+
+class ModelRouter:
+    """Picks the model and sampling parameters for every completion of a turn.
+
+    Completions that are still gathering context with tool calls go to the
+    fast route. A failed tool call, a completion that needed retries or a
+    turn that runs past escalate_after tool iterations moves the rest of the
+    turn to the strong route. By default the fast route also writes the
+    answer; synthesis (one of SYNTHESIS_MODES) opts into the strong route
+    for answers written after tool calls.
+    """
+
+    def __init__(
+        self,
+        routes: Optional[Dict[str, Route]] = None,
+        escalate_after: int = DEFAULT_ESCALATE_AFTER,
+        synthesis: Optional[str] = None,
+    ):
+        if synthesis is not None and synthesis not in SYNTHESIS_MODES:
+            raise ValueError(f"Unknown synthesis mode {synthesis!r}")
+        self.routes = {**DEFAULT_ROUTES, **(routes or {})}
+        self.escalate_after = escalate_after
+        self.synthesis = synthesis
+        self.stats: Dict[str, RouteStats] = {name: RouteStats() for name in self.routes}
+        self._lock = threading.Lock()
+
+    @property
+    def fast(self) -> Route:
+        return self.routes["fast"]
+
+    @property
+    def strong(self) -> Route:
+        return self.routes["strong"]
+
+    @property
+    def max_tokens(self) -> int:
+        """The largest reply any route may produce, for context budgeting."""
+        return max(route.max_tokens for route in self.routes.values())
+
+    def start_turn(self) -> RoutingState:
+        return RoutingState()
+
+    def choose(self, state: RoutingState) -> Route:
+        if state.escalation is None:
+            if state.failed_tools:
+                state.escalation = "tool_error"
+            elif state.retries:
+                state.escalation = "retries"
+            elif state.tool_iterations >= self.escalate_after:
+                state.escalation = "long_turn"
+            if state.escalation is not None:
+                logging.info(
+                    f"Escalating the rest of the turn to {self.strong.model} "
+                    f"({state.escalation})"
+                )
+        if state.escalation is not None:
+            return self.strong
+        if self.synthesis == "after_tools" and state.tool_iterations:
+            return self.strong
+        return self.fast
+
+    def redo_answer(self, state: RoutingState, route: Route) -> bool:
+        """Whether an answer from route should be asked of the strong route."""
+        return (
+            self.synthesis == "redo"
+            and route.name == self.fast.name
+            and state.tool_iterations > 0
+            and self.fast != replace(self.strong, name=self.fast.name)
+        )
+
+    def begin(
+        self, state: RoutingState, on_token: Optional[Callable[[str], None]] = None
+    ) -> "RoutedCompletion":
+        return RoutedCompletion(self, state, on_token)
+
+    def record_completion(self, state: RoutingState, route: Route, span: IterationSpan):
+        state.retries += span.retries
+        with self._lock:
+            stats = self.stats.setdefault(route.name, RouteStats())
+            stats.requests += 1
+            stats.seconds += span.completion_seconds
+            stats.prompt_tokens += span.prompt_tokens
+            stats.completion_tokens += span.completion_tokens
+            stats.cached_tokens += span.cached_tokens
+
+    def record_discarded(self, route: Route):
+        with self._lock:
+            self.stats.setdefault(route.name, RouteStats()).discarded += 1
+
+    def record_tools(self, state: RoutingState, failed: int):
+        state.tool_iterations += 1
+        state.failed_tools += failed
+
+    def snapshot(self) -> Dict[str, RouteStats]:
+        with self._lock:
+            return {name: replace(stats) for name, stats in self.stats.items()}
+
+
+class RoutedCompletion:
+    """The routing of one iteration's completion, for the sync and async loops.
+
+    Make the request on route, streaming to on_token, then pass the reply to
+    finish. When finish returns a route, the answer was discarded and the
+    request is to be repeated on that route, streaming to the caller's
+    on_token, and recorded with record_repeat.
+    """
+
+    def __init__(
+        self,
+        router: ModelRouter,
+        state: RoutingState,
+        on_token: Optional[Callable[[str], None]],
+    ):
+        self.router = router
+        self.state = state
+        self.route = router.choose(state)
+        self.redo_answer = router.redo_answer(state, self.route)
+        self._on_token = on_token
+        self._held: List[str] = []
+        # An answer that may be discarded is only streamed once it is kept
+        if self.redo_answer and on_token is not None:
+            self.on_token: Optional[Callable[[str], None]] = self._held.append
+        else:
+            self.on_token = on_token
+
+    def finish(
+        self, span: IterationSpan, assistant_message: Dict[str, Any]
+    ) -> Optional[Route]:
+        self.router.record_completion(self.state, self.route, span)
+        if assistant_message["tool_calls"] or not self.redo_answer:
+            if self._held:
+                self._on_token("".join(self._held))
+            return None
+        logging.info(f"Asking {self.router.strong.model} for the answer")
+        span.discarded = True
+        self.router.record_discarded(self.route)
+        return self.router.strong
+
+    def record_repeat(self, span: IterationSpan):
+        self.router.record_completion(self.state, self.router.strong, span)
+
+
+_shared_router: Optional[ModelRouter] = None
+_shared_lock = threading.Lock()
+
+
+def _routes_from_env() -> Dict[str, Route]:
+    routes = {}
+    for name, variable in (
+        ("fast", "AGENT_FAST_MODEL"),
+        ("strong", "AGENT_STRONG_MODEL"),
+    ):
+        model = os.getenv(variable)
+        if model:
+            routes[name] = replace(DEFAULT_ROUTES[name], model=model)
+    return routes
+
+
+def shared_model_router() -> ModelRouter:
+    """The process-wide router, with models from AGENT_FAST_MODEL and
+    AGENT_STRONG_MODEL when they are set."""
+    global _shared_router
+    with _shared_lock:
+        if _shared_router is None:
+            _shared_router = ModelRouter(_routes_from_env())
+        return _shared_router
+
+
+def configure_shared_model_router(
+    fast_model: Optional[str] = None,
+    strong_model: Optional[str] = None,
+    **kwargs,
+) -> ModelRouter:
+    global _shared_router
+    routes = _routes_from_env()
+    if fast_model:
+        routes["fast"] = replace(DEFAULT_ROUTES["fast"], model=fast_model)
+    if strong_model:
+        routes["strong"] = replace(DEFAULT_ROUTES["strong"], model=strong_model)
+    with _shared_lock:
+        _shared_router = ModelRouter(routes, **kwargs)
+        return _shared_router
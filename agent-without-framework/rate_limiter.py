@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Refills at rate units per second up to capacity.
+
+    Takes never fail: the level may go negative, and the caller is told how
+    long to wait for its share. Later callers queue behind that debt instead
+    of racing for the same refill.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, amount: float, now: float) -> float:
+        """Takes amount and returns the seconds until it is covered."""
+        self._refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def give_back(self, amount: float, now: float):
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+# Seconds of quota a full bucket holds. Providers count the limits per
+# minute, so an idle limiter lets a minute's worth through at once and only
+# throttles requests as the minute's quota runs out.
+DEFAULT_BURST_SECONDS = 60.0
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget shared by agents.
+
+    Both budgets are token buckets that hold burst_seconds worth of quota.
+    Their refill rate adapts AIMD style: every 429 halves it (at most once
+    per cooldown, since concurrent requests are throttled together) and
+    while requests succeed it grows back by increase_per_second of the
+    configured limit each second.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        burst_seconds: float = DEFAULT_BURST_SECONDS,
+        decrease_factor: float = 0.5,
+        increase_per_second: float = 0.05,
+        min_fraction: float = 0.1,
+        cooldown_seconds: float = 2.0,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_seconds = burst_seconds
+        self.decrease_factor = decrease_factor
+        self.increase_per_second = increase_per_second
+        self.min_fraction = min_fraction
+        self.cooldown_seconds = cooldown_seconds
+        # Share of the configured limits currently allowed
+        self.fraction = 1.0
+        self.rate_limited = 0
+        self._last_decrease = float("-inf")
+        self._last_increase = time.monotonic()
+        self._lock = threading.Lock()
+        self._requests = self._bucket(requests_per_minute)
+        self._tokens = self._bucket(tokens_per_minute)
+
+    def _bucket(self, per_minute: Optional[float]) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        rate = per_minute / 60
+        return TokenBucket(rate, max(1.0, rate * self.burst_seconds))
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests is not None or self._tokens is not None
+
+    def _set_fraction(self, fraction: float):
+        self.fraction = min(1.0, max(self.min_fraction, fraction))
+        for bucket, per_minute in (
+            (self._requests, self.requests_per_minute),
+            (self._tokens, self.tokens_per_minute),
+        ):
+            if bucket is not None:
+                bucket.rate = per_minute / 60 * self.fraction
+
+    def reserve(self, tokens: int) -> float:
+        """Books one request of about tokens tokens; returns seconds to wait."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        wait = 0.0
+        with self._lock:
+            if self._requests is not None:
+                wait = max(wait, self._requests.take(1, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.take(tokens, now))
+        return wait
+
+    def acquire(self, tokens: int) -> float:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record_success(self, reserved_tokens: int, used_tokens: Optional[int] = None):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            # Estimates are upper bounds; return what the request did not use
+            if self._tokens is not None and used_tokens is not None:
+                unused = reserved_tokens - used_tokens
+                if unused > 0:
+                    self._tokens.give_back(unused, now)
+            if self.fraction < 1.0:
+                self._set_fraction(
+                    self.fraction
+                    + (now - self._last_increase) * self.increase_per_second
+                )
+            self._last_increase = now
+
+    def record_rate_limited(self):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self.rate_limited += 1
+            if now - self._last_decrease < self.cooldown_seconds:
+                return
+            self._last_decrease = self._last_increase = now
+            self._set_fraction(self.fraction * self.decrease_factor)
+
+
+_shared_limiter: Optional[RateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def shared_rate_limiter() -> RateLimiter:
+    """The process-wide limiter, from AGENT_RPM and AGENT_TPM by default."""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter(
+                _env_float("AGENT_RPM"), _env_float("AGENT_TPM")
+            )
+        return _shared_limiter
+
+
+def configure_shared_rate_limiter(
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    **kwargs,
+) -> RateLimiter:
+    global _shared_limiter
+    with _shared_lock:
+        _shared_limiter = RateLimiter(requests_per_minute, tokens_per_minute, **kwargs)
+        return _shared_limiter
@@ -0,0 +1,381 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import file_tools
+from code_index import MAX_INDEXED_FILE_BYTES, REFRESH_INTERVAL_SECONDS
+from tool_runner import check_deadline
+
+# numpy adds about 100 ms to startup, so it is imported on first search
+if TYPE_CHECKING:
+    import numpy as np
+
+DEFAULT_INDEX_DIR = ".cache/relevance"
+INDEX_FORMAT_VERSION = 1
+
+# Files are ranked by chunks of this many lines
+CHUNK_LINES = 60
+DEFAULT_TOP_K = 5
+MAX_CHUNK_CHARS = 3000
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by do does for from how i if in is it of on or "
+    "the this that to what when where which who why with".split()
+)
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+# Splits camelCase, PascalCase and HTTPServer style identifiers
+_SUBWORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words, with identifiers also split into their parts."""
+    tokens = []
+    for word in _WORD.findall(text):
+        parts = [
+            part.lower()
+            for piece in word.split("_")
+            for part in _SUBWORD.findall(piece)
+        ]
+        whole = word.strip("_").lower()
+        if len(parts) > 1:
+            tokens.append(whole)
+        tokens.extend(parts)
+    return [token for token in tokens if len(token) > 1 and token not in STOP_WORDS]
+
+
+class _Chunk:
+    __slots__ = ("start", "end", "term_ids", "counts")
+
+    def __init__(self, start: int, end: int, term_ids: "np.ndarray", counts):
+        self.start = start
+        self.end = end
+        self.term_ids = term_ids
+        self.counts = counts
+
+
+class RelevanceIndex:
+    """BM25 index of the chunks of the text files under one directory.
+
+    Every chunk is a sparse term vector (term ids and counts as NumPy
+    arrays). Searching concatenates them into one CSR style matrix, kept
+    until a file changes, and scores all chunks against the query at once.
+    The index is saved to an .npz file; a refresh re-tokenizes only files
+    whose (mtime, size, inode) changed since they were indexed.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        path: Optional[str] = None,
+        refresh_interval: float = REFRESH_INTERVAL_SECONDS,
+    ):
+        self.root = os.path.abspath(root)
+        digest = hashlib.sha256(self.root.encode("utf-8")).hexdigest()[:16]
+        self.path = path or os.path.join(DEFAULT_INDEX_DIR, f"{digest}.npz")
+        self.refresh_interval = refresh_interval
+        self.vocabulary: Dict[str, int] = {}
+        self.terms: List[str] = []
+        # relative path -> (stat key, chunks)
+        self.files: Dict[str, Tuple[tuple, List[_Chunk]]] = {}
+        self._matrix = None
+        self._dirty = False
+        self._refreshed: Optional[float] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _term_id(self, term: str) -> int:
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            term_id = self.vocabulary[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def _chunk_file(self, relative_path: str, text: str) -> List[_Chunk]:
+        import numpy as np
+
+        # Path words count in every chunk, so "rate limiter" finds rate_limiter.py
+        path_tokens = tokenize(relative_path)
+        lines = text.split("\n")
+        chunks = []
+        for start in range(0, len(lines), CHUNK_LINES):
+            block = lines[start : start + CHUNK_LINES]
+            counts = Counter(tokenize("\n".join(block)))
+            counts.update(path_tokens)
+            if not counts:
+                continue
+            ids = np.fromiter(
+                (self._term_id(term) for term in counts), np.int32, len(counts)
+            )
+            values = np.fromiter(counts.values(), np.int32, len(counts))
+            chunks.append(_Chunk(start + 1, start + len(block), ids, values))
+        return chunks
+
+    def _index_file(self, relative_path: str, stat_result: os.stat_result):
+        key = (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+        chunks: List[_Chunk] = []
+        if stat_result.st_size <= MAX_INDEXED_FILE_BYTES:
+            try:
+                with open(os.path.join(self.root, relative_path), "rb") as file:
+                    data = file.read()
+            except OSError:
+                data = b"\0"
+            if b"\0" not in data[: file_tools.BINARY_SNIFF_BYTES]:
+                chunks = self._chunk_file(
+                    relative_path, data.decode("utf-8", errors="replace")
+                )
+        self.files[relative_path] = (key, chunks)
+        self._matrix = None
+        self._dirty = True
+
+    def refresh(self, force: bool = False) -> int:
+        """Re-indexes changed files and saves the index; returns their number."""
+        with self._lock:
+            if (
+                not force
+                and self._refreshed is not None
+                and time.monotonic() - self._refreshed < self.refresh_interval
+            ):
+                return 0
+            seen = set()
+            changed = 0
+            for relative_path in file_tools.walk_files(self.root):
+                try:
+                    stat_result = os.stat(os.path.join(self.root, relative_path))
+                except OSError:
+                    continue
+                seen.add(relative_path)
+                key = (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+                entry = self.files.get(relative_path)
+                if entry is None or entry[0] != key:
+                    check_deadline()
+                    self._index_file(relative_path, stat_result)
+                    changed += 1
+            for relative_path in set(self.files) - seen:
+                del self.files[relative_path]
+                self._matrix = None
+                self._dirty = True
+            if self._dirty:
+                self._save()
+            self._refreshed = time.monotonic()
+            return changed
+
+    def update_file(self, path: str):
+        """Re-indexes one file right after it was written (or deleted)."""
+        relative_path = os.path.relpath(os.path.abspath(path), self.root)
+        if relative_path.startswith(".."):
+            return
+        relative_path = relative_path.replace(os.sep, "/")
+        with self._lock:
+            try:
+                stat_result = os.stat(os.path.join(self.root, relative_path))
+            except OSError:
+                if self.files.pop(relative_path, None) is not None:
+                    self._matrix = None
+                    self._dirty = True
+                return
+            self._index_file(relative_path, stat_result)
+
+    def _build_matrix(self):
+        import numpy as np
+
+        refs = []
+        ids = []
+        counts = []
+        for relative_path in sorted(self.files):
+            for chunk in self.files[relative_path][1]:
+                refs.append((relative_path, chunk.start, chunk.end))
+                ids.append(chunk.term_ids)
+                counts.append(chunk.counts)
+        lengths = np.fromiter((len(chunk) for chunk in ids), np.int64, len(ids))
+        indices = np.concatenate(ids) if ids else np.zeros(0, np.int32)
+        data = np.concatenate(counts) if counts else np.zeros(0, np.int32)
+        rows = np.repeat(np.arange(len(ids)), lengths)
+        chunk_lengths = np.bincount(rows, weights=data, minlength=len(ids))
+        # A chunk holds each of its terms once, so this counts chunks per term
+        document_frequency = np.bincount(indices, minlength=len(self.terms))
+        self._matrix = (refs, indices, data, rows, chunk_lengths, document_frequency)
+        return self._matrix
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K, include=None):
+        """The top_k (relative path, start line, end line, score) chunks."""
+        import numpy as np
+
+        self.refresh()
+        include_patterns = [file_tools.PathPattern(glob) for glob in include or []]
+        with self._lock:
+            query_ids = sorted(
+                {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+            )
+            if not query_ids:
+                return []
+            refs, indices, data, rows, chunk_lengths, document_frequency = (
+                self._matrix or self._build_matrix()
+            )
+        if not refs:
+            return []
+
+        chunk_count = len(refs)
+        frequency = document_frequency[query_ids]
+        idf = np.zeros(len(document_frequency))
+        idf[query_ids] = np.log(1 + (chunk_count - frequency + 0.5) / (frequency + 0.5))
+        hits = np.isin(indices, query_ids)
+        term_frequency = data[hits].astype(np.float64)
+        hit_rows = rows[hits]
+        norm = BM25_K1 * (
+            1 - BM25_B + BM25_B * chunk_lengths[hit_rows] / chunk_lengths.mean()
+        )
+        scores = np.bincount(
+            hit_rows,
+            weights=idf[indices[hits]]
+            * term_frequency
+            * (BM25_K1 + 1)
+            / (term_frequency + norm),
+            minlength=chunk_count,
+        )
+
+        results = []
+        for row in np.argsort(-scores, kind="stable"):
+            if scores[row] <= 0 or len(results) == top_k:
+                break
+            relative_path, start, end = refs[row]
+            if include_patterns and not any(
+                glob.matches(relative_path, False) for glob in include_patterns
+            ):
+                continue
+            results.append((relative_path, start, end, float(scores[row])))
+        return results
+
+    def _save(self):
+        import numpy as np
+
+        file_entries = []
+        chunk_rows = []
+        ids = []
+        counts = []
+        for relative_path, (key, chunks) in self.files.items():
+            file_entries.append([relative_path, *key, len(chunks)])
+            for chunk in chunks:
+                chunk_rows.append((chunk.start, chunk.end, len(chunk.term_ids)))
+                ids.append(chunk.term_ids)
+                counts.append(chunk.counts)
+        meta = {
+            "version": INDEX_FORMAT_VERSION,
+            "root": self.root,
+            "terms": self.terms,
+            "files": file_entries,
+        }
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            meta=np.frombuffer(json.dumps(meta).encode("utf-8"), np.uint8),
+            chunks=np.array(chunk_rows, np.int64).reshape(-1, 3),
+            term_ids=np.concatenate(ids) if ids else np.zeros(0, np.int32),
+            counts=np.concatenate(counts) if counts else np.zeros(0, np.int32),
+        )
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_tools.atomic_write(self.path, [buffer.getvalue()])
+        self._dirty = False
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        import numpy as np
+
+        try:
+            with np.load(self.path, allow_pickle=False) as saved:
+                meta = json.loads(saved["meta"].tobytes())
+                chunk_rows = saved["chunks"]
+                term_ids = saved["term_ids"]
+                counts = saved["counts"]
+        except (OSError, ValueError, KeyError) as e:
+            # A damaged index is rebuilt by the next refresh
+            logging.warning(f"Ignoring unreadable relevance index {self.path}: {e}")
+            return
+        if meta.get("version") != INDEX_FORMAT_VERSION or meta["root"] != self.root:
+            return
+
+        self.terms = meta["terms"]
+        self.vocabulary = {term: term_id for term_id, term in enumerate(self.terms)}
+        row = 0
+        position = 0
+        for relative_path, mtime_ns, size, inode, chunk_count in meta["files"]:
+            chunks = []
+            for start, end, length in chunk_rows[row : row + chunk_count]:
+                chunks.append(
+                    _Chunk(
+                        int(start),
+                        int(end),
+                        term_ids[position : position + length],
+                        counts[position : position + length],
+                    )
+                )
+                position += length
+            row += chunk_count
+            self.files[relative_path] = ((mtime_ns, size, inode), chunks)
+
+
+def _read_lines(path: str, start: int, end: int) -> str:
+    with open(path, "rb") as file:
+        lines = file.read().decode("utf-8", errors="replace").split("\n")
+    text = "\n".join(lines[start - 1 : end])
+    if len(text) > MAX_CHUNK_CHARS:
+        text = text[:MAX_CHUNK_CHARS] + "\n[... chunk truncated ...]"
+    return text
+
+
+def find_relevant_files(
+    index: RelevanceIndex,
+    query: str,
+    top_k: Optional[int] = None,
+    include: Optional[List[str]] = None,
+) -> str:
+    top_k = top_k or DEFAULT_TOP_K
+    results = index.search(query, top_k, include)
+    if not results:
+        return f"No files under {index.root} match {query!r}."
+
+    sections = [f"Chunks under {index.root} most relevant to {query!r}:"]
+    for rank, (relative_path, start, end, score) in enumerate(results, 1):
+        try:
+            text = _read_lines(os.path.join(index.root, relative_path), start, end)
+        except OSError:
+            text = "[file no longer readable]"
+        sections.append(
+            f"{rank}. {relative_path} lines {start}-{end} (score {score:.2f})\n{text}"
+        )
+    return "\n\n".join(sections)
+
+
+_indexes: Dict[str, RelevanceIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def relevance_index_for(root: str) -> RelevanceIndex:
+    """The process-wide index of root, loaded from disk on first use."""
+    root = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = RelevanceIndex(root)
+        return index
+
+
+def file_changed(path: str):
+    """Tells every loaded index that contains path to re-index it."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.update_file(path)
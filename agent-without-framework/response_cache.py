@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from session_store import to_jsonable
+
+# Request parameters that determine the reply; anything else (such as
+# stream) does not change what the model would answer.
+KEY_PARAMS = ("model", "messages", "tools", "tool_choice", "temperature", "max_tokens")
+
+
+def request_key(params: Dict[str, Any]) -> str:
+    canonical = json.dumps(
+        {name: to_jsonable(params.get(name)) for name in KEY_PARAMS},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of assistant messages keyed by the canonical request.
+
+    Entries expire after ttl_seconds and the least recently used ones are
+    evicted once the cache holds more than max_entries or max_bytes.
+    """
+
+    def __init__(
+        self,
+        path: str = ".cache/responses.sqlite3",
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        max_entries: int = 10_000,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        import sqlite3
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed_at
+                ON responses (accessed_at);
+            """)
+
+    def get(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = request_key(params)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1], now):
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, params: Dict[str, Any], message: Dict[str, Any]):
+        key = request_key(params)
+        value = json.dumps(to_jsonable(message))
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict(now)
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _evict(self, now: float):
+        if self.ttl_seconds is not None:
+            self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+        count, total_bytes = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        # Walk from the least recently used entry until both limits hold
+        evict = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ):
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            evict.append((key,))
+            count -= 1
+            total_bytes -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evict)
@@ -0,0 +1,530 @@
+"""HTTP front end that hosts many agent sessions in one process.
+
+    POST   /v1/sessions                    {"session_id": optional} -> {"session_id"}
+    GET    /v1/sessions/<id>               -> {"session_id", "messages"}
+    DELETE /v1/sessions/<id>
+    POST   /v1/sessions/<id>/messages      {"message": "...", "stream": false}
+    GET    /healthz
+
+With "stream": true the reply is sent as server-sent events: one "token"
+event per content delta and a final "done" event with the full response.
+
+Sessions live in a SessionStore, and the in-memory agents are only a
+cache of it: idle ones are evicted and rebuilt from the log on the next
+request. With --workers, several processes share the port through
+SO_REUSEPORT and the session directory; a worker reloads a session when the
+log was changed by another worker since it last saw it.
+
+    uv run python server.py --port 8080 --workers 4
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from main import AIAgent, configure_logging, load_environment
+from rate_limiter import configure_shared_rate_limiter
+from response_cache import ResponseCache
+from session_store import SessionStore
+
+MAX_BODY_BYTES = 1024 * 1024
+
+_SESSION_PATH = re.compile(r"^/v1/sessions/([^/]+)(/messages)?/?$")
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class SessionBusy(RuntimeError):
+    pass
+
+
+class _Session:
+    def __init__(self, agent: AIAgent):
+        self.agent = agent
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.log_key: Optional[Tuple[int, int]] = None
+
+
+class SessionManager:
+    """Keeps recently used agents in memory in front of a SessionStore."""
+
+    def __init__(
+        self,
+        create_agent: Callable[[str], AIAgent],
+        session_store: SessionStore,
+        idle_seconds: float = 600.0,
+        max_sessions: int = 1000,
+    ):
+        self.create_agent = create_agent
+        self.session_store = session_store
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, _Session] = {}
+        # Sessions whose agent is being built, for requests that arrive
+        # meanwhile; building one (replaying its log) happens outside _lock
+        self._loading: Dict[str, "Future[_Session]"] = {}
+        self._lock = threading.Lock()
+
+    def _log_key(self, session_id: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.session_store.path(session_id))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def create(self, session_id: Optional[str] = None) -> str:
+        session_id = session_id or uuid.uuid4().hex
+        self.session_store.path(session_id)  # validates the id
+        if not self.session_store.exists(session_id):
+            self.session_store.snapshot(session_id, [])
+        return session_id
+
+    def get(self, session_id: str) -> _Session:
+        log_key = self._log_key(session_id)
+        if log_key is None:
+            raise SessionNotFound(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                return session
+            loading = self._loading.get(session_id)
+            if loading is not None:
+                building = False
+            else:
+                loading = self._loading[session_id] = Future()
+                building = True
+        if not building:
+            return loading.result()
+
+        try:
+            session = _Session(self.create_agent(session_id))
+        except BaseException as e:
+            with self._lock:
+                del self._loading[session_id]
+            loading.set_exception(e)
+            raise
+        session.log_key = log_key
+        with self._lock:
+            del self._loading[session_id]
+            self._sessions[session_id] = session
+            evicted = self._evict_over_limit()
+        loading.set_result(session)
+        for agent in evicted:
+            agent.close()
+        return session
+
+    def _reload(self, session_id: str, session: _Session, log_key):
+        # Another worker continued this session
+        session.agent.messages = self.session_store.load(session_id)
+        session.log_key = log_key
+
+    def chat(
+        self,
+        session_id: str,
+        message: str,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        session = self.get(session_id)
+        if not session.lock.acquire(blocking=False):
+            raise SessionBusy(session_id)
+        try:
+            # session.lock only covers this process; with --workers another
+            # worker may be serving the same session
+            with self.session_store.exclusive(session_id, blocking=False) as locked:
+                if not locked:
+                    raise SessionBusy(session_id)
+                log_key = self._log_key(session_id)
+                if log_key is None:
+                    raise SessionNotFound(session_id)
+                if log_key != session.log_key:
+                    self._reload(session_id, session, log_key)
+                response = session.agent.chat(message, on_token=on_token)
+                session.log_key = self._log_key(session_id)
+                session.last_used = time.monotonic()
+                return response
+        finally:
+            session.lock.release()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.agent.close()
+        self.session_store.delete(session_id)
+
+    def _evict_over_limit(self):
+        evicted = []
+        if len(self._sessions) <= self.max_sessions:
+            return evicted
+        for session_id, session in sorted(
+            self._sessions.items(), key=lambda item: item[1].last_used
+        ):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if not session.lock.locked():
+                evicted.append(self._sessions.pop(session_id).agent)
+        return evicted
+
+    def evict_idle(self) -> int:
+        deadline = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [
+                session_id
+                for session_id, session in self._sessions.items()
+                if session.last_used < deadline and not session.lock.locked()
+            ]
+            agents = [self._sessions.pop(session_id).agent for session_id in idle]
+        for agent in agents:
+            agent.close()
+        if idle:
+            logging.info(f"Evicted {len(idle)} idle sessions")
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.agent.close()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class AgentServer:
+    def __init__(
+        self,
+        sessions: SessionManager,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        reuse_port: bool = False,
+    ):
+        self.sessions = sessions
+        self._httpd = _Server((host, port), self._handler_class(), False)
+        self._httpd.allow_reuse_port = reuse_port
+        try:
+            self._httpd.server_bind()
+            self._httpd.server_activate()
+        except OSError:
+            self._httpd.server_close()
+            raise
+        self._stopped = threading.Event()
+        self._threads = []
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _evict_loop(self):
+        interval = max(1.0, min(60.0, self.sessions.idle_seconds / 4))
+        while not self._stopped.wait(interval):
+            self.sessions.evict_idle()
+
+    def start(self) -> "AgentServer":
+        for target in (self._httpd.serve_forever, self._evict_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def serve_forever(self):
+        evictor = threading.Thread(target=self._evict_loop, daemon=True)
+        evictor.start()
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._stopped.set()
+            self._httpd.server_close()
+            self.sessions.close()
+
+    def stop(self):
+        self._stopped.set()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self.sessions.close()
+
+    def __enter__(self) -> "AgentServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        sessions = self.sessions
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                logging.info(f"{self.address_string()} {format % args}")
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/healthz":
+                    self._send_json(200, {"status": "ok", "sessions": len(sessions)})
+                    return
+                session_id, messages = self._route()
+                if session_id is None or messages:
+                    self._send_error(404, "Not found")
+                    return
+                try:
+                    session = sessions.get(session_id)
+                except (SessionNotFound, ValueError):
+                    self._send_error(404, f"Unknown session {session_id}")
+                    return
+                self._send_json(
+                    200,
+                    {"session_id": session_id, "messages": len(session.agent.messages)},
+                )
+
+            def do_DELETE(self):
+                session_id, messages = self._route()
+                if session_id is None or messages:
+                    self._send_error(404, "Not found")
+                    return
+                try:
+                    sessions.delete(session_id)
+                except ValueError as e:
+                    self._send_error(400, str(e))
+                    return
+                self._send_json(200, {"session_id": session_id, "deleted": True})
+
+            def do_POST(self):
+                body = self._read_json()
+                if body is None:
+                    return
+                if self.path.rstrip("/") == "/v1/sessions":
+                    try:
+                        session_id = sessions.create(body.get("session_id"))
+                    except ValueError as e:
+                        self._send_error(400, str(e))
+                        return
+                    self._send_json(201, {"session_id": session_id})
+                    return
+
+                session_id, messages = self._route()
+                if session_id is None or not messages:
+                    self._send_error(404, "Not found")
+                    return
+                message = body.get("message")
+                if not isinstance(message, str) or not message.strip():
+                    self._send_error(400, "Provide a non-empty message")
+                    return
+                if body.get("stream"):
+                    self._chat_stream(session_id, message)
+                    return
+                try:
+                    response = sessions.chat(session_id, message)
+                except (SessionNotFound, ValueError):
+                    self._send_error(404, f"Unknown session {session_id}")
+                    return
+                except SessionBusy:
+                    self._send_error(409, "Session is busy with another message")
+                    return
+                self._send_json(200, {"session_id": session_id, "response": response})
+
+            def _chat_stream(self, session_id: str, message: str):
+                headers_sent = False
+                connected = True
+
+                def send_event(event: str, data: Any):
+                    nonlocal headers_sent, connected
+                    if not headers_sent:
+                        self.send_response(200)
+                        self.send_header("Content-Type", "text/event-stream")
+                        self.send_header("Cache-Control", "no-cache")
+                        self.send_header("Transfer-Encoding", "chunked")
+                        self.end_headers()
+                        headers_sent = True
+                    if not connected:
+                        return
+                    try:
+                        self._write_chunk(
+                            f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                        )
+                    except (ConnectionResetError, BrokenPipeError):
+                        # Finish the turn anyway so the session log stays whole
+                        connected = False
+
+                try:
+                    response = sessions.chat(
+                        session_id,
+                        message,
+                        on_token=lambda token: send_event("token", token),
+                    )
+                except (SessionNotFound, ValueError):
+                    self._send_error(404, f"Unknown session {session_id}")
+                    return
+                except SessionBusy:
+                    self._send_error(409, "Session is busy with another message")
+                    return
+                send_event("done", {"session_id": session_id, "response": response})
+                if connected:
+                    self._write_chunk("")
+
+            def _route(self) -> Tuple[Optional[str], bool]:
+                match = _SESSION_PATH.match(self.path)
+                if match is None:
+                    return None, False
+                return match.group(1), match.group(2) is not None
+
+            def _read_json(self) -> Optional[Dict[str, Any]]:
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY_BYTES:
+                    self._send_error(413, "Request body too large")
+                    return None
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_error(400, "Request body is not valid JSON")
+                    return None
+                if not isinstance(body, dict):
+                    self._send_error(400, "Request body must be a JSON object")
+                    return None
+                return body
+
+            def _write_chunk(self, text: str):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_error(self, status: int, message: str):
+                self._send_json(status, {"error": {"message": message}})
+
+            def _send_json(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def _serve(args: argparse.Namespace, api_key: str, reuse_port: bool):
+    if args.rpm or args.tpm:
+        # Each worker gets its share of the quota
+        configure_shared_rate_limiter(
+            args.rpm / args.workers if args.rpm else None,
+            args.tpm / args.workers if args.tpm else None,
+        )
+    session_store = SessionStore(args.sessions_dir)
+    response_cache = ResponseCache(args.response_cache) if args.response_cache else None
+
+    def create_agent(session_id: str) -> AIAgent:
+        return AIAgent(
+            api_key=api_key,
+            session_store=session_store,
+            session_id=session_id,
+            response_cache=response_cache,
+        )
+
+    sessions = SessionManager(
+        create_agent, session_store, args.idle_seconds, args.max_sessions
+    )
+    server = AgentServer(sessions, args.host, args.port, reuse_port=reuse_port)
+    print(f"Agent server (pid {os.getpid()}) listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    load_environment()
+    configure_logging()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes sharing the port; sessions are spread across them",
+    )
+    parser.add_argument(
+        "--sessions-dir", default="sessions", help="Directory for session logs"
+    )
+    parser.add_argument(
+        "--idle-seconds",
+        type=float,
+        default=600.0,
+        help="Drop a session's in-memory state after this long without use",
+    )
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=1000,
+        help="Sessions kept in memory per worker",
+    )
+    parser.add_argument(
+        "--response-cache",
+        metavar="PATH",
+        help="Answer repeated requests from an on-disk cache at PATH",
+    )
+    parser.add_argument(
+        "--rpm", type=float, help="Requests per minute allowed to the API"
+    )
+    parser.add_argument(
+        "--tpm", type=float, help="Tokens per minute allowed to the API"
+    )
+    args = parser.parse_args()
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        print("Error: OPENAI_API_KEY is not set in environment variables.")
+        sys.exit(1)
+
+    if args.workers <= 1:
+        _serve(args, api_key, reuse_port=False)
+        return
+    if not hasattr(socket, "SO_REUSEPORT"):
+        print("Error: --workers needs SO_REUSEPORT, which this platform lacks.")
+        sys.exit(1)
+    if args.port == 0:
+        print("Error: --workers needs a fixed --port.")
+        sys.exit(1)
+
+    workers = [
+        multiprocessing.Process(target=_serve, args=(args, api_key, True))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+import file_tools
+
+try:
+    import fcntl
+except ImportError:  # Windows: sessions are only shared within one process
+    fcntl = None
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+
+def to_jsonable(value: Any) -> Any:
+    """Converts messages, including SDK objects such as tool calls, to JSON."""
+    if hasattr(value, "model_dump"):
+        return to_jsonable(value.model_dump(exclude_none=True))
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    return value
+
+
+INTERRUPTED_TOOL_RESULT = (
+    "Error: The session was interrupted before this tool call returned a result."
+)
+
+
+def answer_dangling_tool_calls(messages: List[Dict[str, Any]]) -> int:
+    """Adds an error result for every tool call that has none, in place.
+
+    A process that dies between appending an assistant message with
+    tool_calls and appending their results leaves calls the API requires an
+    answer to; without one every later request is rejected. Returns the
+    number of results added.
+    """
+    added = 0
+    i = 0
+    while i < len(messages):
+        message = messages[i]
+        i += 1
+        if message.get("role") != "assistant" or not message.get("tool_calls"):
+            continue
+        answered = set()
+        while i < len(messages) and messages[i].get("role") == "tool":
+            answered.add(messages[i].get("tool_call_id"))
+            i += 1
+        for tool_call in message["tool_calls"]:
+            if tool_call["id"] not in answered:
+                messages.insert(
+                    i,
+                    {
+                        "role": "tool",
+                        "tool_call_id": tool_call["id"],
+                        "content": INTERRUPTED_TOOL_RESULT,
+                    },
+                )
+                i += 1
+                added += 1
+    return added
+
+
+class SessionStore:
+    """Append-only JSONL log per session.
+
+    Each line is either {"message": ...}, appended as the conversation
+    produces it, or {"snapshot": [...]}, written when the history is
+    rewritten (for example by context compaction). A snapshot replaces the
+    whole file, so loading a session reads only its compacted history plus
+    the messages appended since.
+    """
+
+    def __init__(self, directory: str = "sessions", fsync: bool = False):
+        self.directory = directory
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, session_id: str) -> str:
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        return os.path.join(self.directory, f"{session_id}.jsonl")
+
+    def _lock_path(self, session_id: str) -> str:
+        return self.path(session_id)[: -len(".jsonl")] + ".lock"
+
+    @contextmanager
+    def exclusive(self, session_id: str, blocking: bool = True) -> Iterator[bool]:
+        """Holds the session's lock across processes; yields whether it did.
+
+        The lock is an flock on a separate .lock file, since snapshots
+        replace the log file itself. Server workers hold it for a whole turn,
+        so two processes never append to or snapshot one session at once.
+        """
+        if fcntl is None:
+            yield True
+            return
+        with open(self._lock_path(session_id), "a") as file:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(file.fileno(), flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def exists(self, session_id: str) -> bool:
+        return os.path.exists(self.path(session_id))
+
+    def list_sessions(self) -> List[str]:
+        return sorted(
+            name[: -len(".jsonl")]
+            for name in os.listdir(self.directory)
+            if name.endswith(".jsonl")
+        )
+
+    def load(self, session_id: str) -> List[Dict[str, Any]]:
+        messages: List[Dict[str, Any]] = []
+        try:
+            with open(self.path(session_id), "r", encoding="utf-8") as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return messages
+
+        for number, line in enumerate(lines, 1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-append can leave a torn last line; skip it
+                logging.warning(
+                    f"Skipping unreadable line {number} of session {session_id}"
+                )
+                continue
+            if "snapshot" in record:
+                messages = record["snapshot"]
+            else:
+                messages.append(record["message"])
+        repaired = answer_dangling_tool_calls(messages)
+        if repaired:
+            logging.warning(
+                f"Answered {repaired} interrupted tool calls in session {session_id}"
+            )
+        return messages
+
+    def append(self, session_id: str, message: Dict[str, Any]):
+        line = json.dumps({"message": to_jsonable(message)}) + "\n"
+        with self._lock:
+            with open(self.path(session_id), "a", encoding="utf-8") as file:
+                file.write(line)
+                if self.fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+
+    def snapshot(self, session_id: str, messages: List[Dict[str, Any]]):
+        line = json.dumps({"snapshot": to_jsonable(messages)}) + "\n"
+        with self._lock:
+            file_tools.atomic_write(self.path(session_id), [line.encode("utf-8")])
+
+    def delete(self, session_id: str):
+        with self._lock:
+            for path in (self.path(session_id), self._lock_path(session_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,161 @@
+import json
+import time
+
+import pytest
+
+import file_tools
+from main import AIAgent
+from metrics import InMemorySink
+from mock_server import MockOpenAIServer
+from model_router import ModelRouter
+from session_store import SessionStore
+from transport import RetryPolicy
+
+ANSWER = "notes.txt says hello from the workspace."
+
+SCRIPT = [
+    {"tool_calls": [{"name": "read_file", "arguments": {"path": "notes.txt"}}]},
+    {"content": ANSWER},
+]
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    (tmp_path / "notes.txt").write_text("hello from the workspace\n")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def _agent(server, **kwargs):
+    return AIAgent(
+        api_key="test",
+        base_url=server.url,
+        router=ModelRouter(),
+        **kwargs,
+    )
+
+
+def test_streamed_tool_call_fragments_are_reassembled(workspace):
+    sink = InMemorySink()
+    tokens = []
+    with MockOpenAIServer(SCRIPT) as server:
+        agent = _agent(server, metrics_sinks=[sink])
+        answer = agent.chat("What does notes.txt say?", on_token=tokens.append)
+        requests = list(server.requests)
+
+    assert answer == ANSWER
+    assert "".join(tokens) == ANSWER
+    assert all(request["stream"] for request in requests)
+    # The arguments arrived in two fragments; the tool only ran if they
+    # were joined back into valid JSON
+    (call,) = [m for m in agent.messages if m.get("tool_calls")][0]["tool_calls"]
+    assert json.loads(call["function"]["arguments"]) == {"path": "notes.txt"}
+    (result,) = [m for m in agent.messages if m["role"] == "tool"]
+    assert "hello from the workspace" in result["content"]
+    (turn,) = sink.snapshot()
+    assert [tool.ok for tool in turn.iterations[0].tools] == [True]
+
+
+def test_rate_limited_completions_are_retried(workspace):
+    sink = InMemorySink()
+    # Two requests per second: the third completion of the turn gets a 429
+    script = [SCRIPT[0], SCRIPT[0], SCRIPT[1]]
+    with MockOpenAIServer(script, requests_per_minute=120) as server:
+        agent = _agent(
+            server,
+            metrics_sinks=[sink],
+            retry_policy=RetryPolicy(max_retries=4, base_delay=0.01),
+        )
+        answer = agent.chat("What does notes.txt say?")
+        statuses = [request["status"] for request in server.requests]
+
+    assert answer == ANSWER
+    assert 429 in statuses
+    (turn,) = sink.snapshot()
+    assert sum(iteration.retries for iteration in turn.iterations) > 0
+
+
+def test_a_session_is_resumed_by_a_new_agent(workspace):
+    store = SessionStore(str(workspace / "sessions"))
+    with MockOpenAIServer(SCRIPT) as server:
+        first = _agent(server, session_store=store, session_id="resume")
+        first.chat("What does notes.txt say?")
+
+        second = _agent(server, session_store=store, session_id="resume")
+        assert second.messages == first.messages
+        second.chat("And again?")
+        messages_sent = server.requests[-1]["messages"]
+
+    # The last request carried the first turn as well as the new question
+    assert messages_sent == len(second.messages) - 1
+    contents = [m["content"] for m in second.messages if m["role"] == "user"]
+    assert contents == ["What does notes.txt say?", "And again?"]
+    assert store.load("resume") == second.messages
+
+
+def test_concurrent_tool_calls_keep_their_full_results(workspace):
+    (workspace / "todo.txt").write_text("write the tests\n")
+    script = [
+        {
+            "tool_calls": [
+                {"name": "read_file", "arguments": {"path": "notes.txt"}},
+                {"name": "list_files", "arguments": {"path": "."}},
+                {"name": "read_file", "arguments": {"path": "todo.txt"}},
+            ]
+        },
+        {"content": ANSWER},
+    ]
+    results = {}
+    for workers in (1, 8):
+        with MockOpenAIServer(script) as server:
+            agent = _agent(server, max_tool_workers=workers)
+            agent.chat("What is in the workspace?")
+        results[workers] = [m["content"] for m in agent.messages if m["role"] == "tool"]
+
+    notes, listing, todo = results[8]
+    assert "hello from the workspace" in notes
+    assert "[FILE] notes.txt" in listing and "[FILE] todo.txt" in listing
+    assert "write the tests" in todo
+    assert results[8] == results[1]
+
+
+def _tool_call(call_id, name, arguments):
+    return {
+        "id": call_id,
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }
+
+
+def test_a_call_queued_behind_a_hung_call_keeps_its_deadline(workspace, monkeypatch):
+    # A read that stalls like one on a dead mount, without deadline checks
+    monkeypatch.setattr(file_tools, "read_file", lambda *args: time.sleep(3) or "")
+    agent = AIAgent(
+        api_key="test",
+        router=ModelRouter(),
+        tool_concurrency={"read_file": 1},
+        tool_timeouts={"read_file": 0.3},
+    )
+    calls = [_tool_call(str(i), "read_file", {"path": "notes.txt"}) for i in range(2)]
+
+    started = time.perf_counter()
+    results = agent._run_tool_calls(calls)
+
+    assert time.perf_counter() - started < 1.5
+    assert all('"status": "timeout"' in result for result in results)
+
+
+def test_list_files_reports_a_missing_directory(workspace):
+    agent = AIAgent(api_key="test", router=ModelRouter())
+    result = agent._execute_tool("list_files", {"path": "missing"})
+    assert result == "Error: The directory at missing does not exist."
+
+
+def test_a_large_read_has_a_single_continuation_hint(workspace):
+    (workspace / "big.py").write_text("".join(f"line = {i}\n" for i in range(20_000)))
+    agent = AIAgent(api_key="test", router=ModelRouter())
+    (result,) = agent._run_tool_calls(
+        [_tool_call("1", "read_file", {"path": "big.py"})]
+    )
+    assert "fetch_output" not in result
+    assert result.count("to continue.]") == 1
@@ -0,0 +1,67 @@
+import json
+
+import batch
+from batch import load_items, run_batch
+
+
+def test_load_items_reports_bad_lines_one_by_one(tmp_path):
+    path = tmp_path / "prompts.jsonl"
+    lines = [
+        {"id": "ok", "turns": ["hi", "bye"]},
+        [1, 2],
+        {"id": "string-turns", "turns": "hey"},
+        {"id": "number-turns", "turns": ["hi", 3]},
+        "just a prompt",
+    ]
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n{broken\n")
+
+    items = list(load_items(str(path)))
+
+    assert [item.get("turns") for item in items] == [
+        ["hi", "bye"],
+        [],
+        [],
+        [],
+        ["just a prompt"],
+        [],
+    ]
+    assert [bool(item.get("error")) for item in items] == [
+        False,
+        True,
+        True,
+        True,
+        False,
+        True,
+    ]
+
+
+def test_an_item_that_raises_does_not_end_the_batch(tmp_path, monkeypatch):
+    class FailingAgent:
+        def __init__(self, **kwargs):
+            pass
+
+        def chat(self, message):
+            if message == "boom":
+                raise RuntimeError("the agent broke")
+            return message.upper()
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(batch, "AIAgent", FailingAgent)
+    input_path = tmp_path / "prompts.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    input_path.write_text(
+        "\n".join(json.dumps({"id": id, "prompt": id}) for id in ("a", "boom", "b"))
+    )
+
+    counts = run_batch(str(input_path), str(output_path), "test", concurrency=1)
+
+    results = {
+        result["id"]: result
+        for result in map(json.loads, output_path.read_text().splitlines())
+    }
+    assert counts == {"skipped": 0, "answer": 2, "failed": 1}
+    assert results["b"]["responses"] == ["B"]
+    assert results["boom"]["outcome"] == "error"
+    assert results["boom"]["error"] == "RuntimeError: the agent broke"
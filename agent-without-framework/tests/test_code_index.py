@@ -0,0 +1,63 @@
+import re
+
+import pytest
+
+from code_index import CodeIndex, required_literals, search_code
+
+
+@pytest.mark.parametrize(
+    "pattern, literals",
+    [
+        ("def handle_request", ["def handle_request"]),
+        (r"hello\.world", ["hello.world"]),
+        (r"foo\w+barbaz", ["foo", "barbaz"]),
+        (r"abc(def)?ghi", ["abc", "ghi"]),
+        ("colou?r_name", ["colo", "r_name"]),
+        ("abc|def", []),
+        (r"\x41bcd", ["bcd"]),
+        (r"abc\u00e9defg", ["abc", "defg"]),
+        (r"\N{LATIN SMALL LETTER E}xyzw", ["xyzw"]),
+        (r"ab\0123def", ["3def"]),
+        (r"(abc)\1xyz", ["xyz"]),
+        ("(?i)hello", []),
+        ("(?x)hello", []),
+        ("(?m)^hello$", []),
+    ],
+)
+def test_required_literals(pattern, literals):
+    assert required_literals(pattern) == literals
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [r"\x41bcd", r"Abcd", r"\N{LATIN CAPITAL LETTER A}bcd", r"\101bcd", "(?i)ABCD"],
+)
+def test_required_literals_are_in_every_match(pattern):
+    text = "xx Abcd yy"
+    match = re.search(pattern, text)
+    assert match is not None
+    for literal in required_literals(pattern):
+        assert literal in match.group(0)
+
+
+def test_search_code_finds_escaped_patterns(tmp_path):
+    (tmp_path / "module.py").write_text("value = 'Abcd'\n")
+    index = CodeIndex(str(tmp_path / "index.sqlite3"))
+    try:
+        for pattern in (r"\x41bcd", r"(?i)aBCD", "Abcd"):
+            result = search_code(index, pattern, str(tmp_path), regex=True)
+            assert "module.py:1:" in result, pattern
+    finally:
+        index.close()
+
+
+def test_search_code_literal(tmp_path):
+    (tmp_path / "a.py").write_text("first\nneedle here\n")
+    (tmp_path / "b.py").write_text("nothing\n")
+    index = CodeIndex(str(tmp_path / "index.sqlite3"))
+    try:
+        result = search_code(index, "needle", str(tmp_path))
+        assert result.splitlines()[1:] == ["a.py:2: needle here"]
+        assert search_code(index, "missing", str(tmp_path)).startswith("No matches")
+    finally:
+        index.close()
@@ -0,0 +1,47 @@
+from context_window import ContextWindow, deduplicate_tool_results
+
+
+def _history(reads):
+    messages = [{"role": "system", "content": "prompt"}]
+    for i in range(reads):
+        messages += [
+            {"role": "user", "content": f"read it again {i}"},
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{i}",
+                        "type": "function",
+                        "function": {
+                            "name": "read_file",
+                            "arguments": '{"path": "a.py"}',
+                        },
+                    }
+                ],
+            },
+            {"role": "tool", "tool_call_id": f"call_{i}", "content": "x = 1\n" * 100},
+        ]
+    return messages
+
+
+def test_counting_request_copies_does_not_grow_the_cache():
+    window = ContextWindow()
+    messages = _history(3)
+    window.total_tokens(messages)
+    cached = len(window._token_counts)
+
+    for _ in range(20):
+        sent = deduplicate_tool_results(messages)
+        assert sent is not messages
+        window.total_tokens(sent, remember=False)
+    assert len(window._token_counts) == cached
+
+
+def test_compact_keeps_recent_turns_under_budget():
+    window = ContextWindow(max_tokens=400, keep_recent_turns=1)
+    messages = _history(5)
+    assert window.compact(messages)
+    assert messages[0]["content"] == "prompt"
+    assert messages[-1]["tool_call_id"] == "call_4"
+    assert window.total_tokens(messages) <= 400
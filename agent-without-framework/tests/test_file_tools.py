@@ -0,0 +1,105 @@
+import re
+
+import pytest
+
+import file_tools
+from file_tools import read_file
+
+
+def _read_both_paths(monkeypatch, path, **kwargs):
+    """read_file below and above the mmap threshold."""
+    small = read_file(str(path), **kwargs)
+    monkeypatch.setattr(file_tools, "MMAP_THRESHOLD_BYTES", 0)
+    large = read_file(str(path), **kwargs)
+    monkeypatch.undo()
+    return small, large
+
+
+def test_read_file_counts_lines_alike_below_and_above_mmap_threshold(
+    tmp_path, monkeypatch
+):
+    path = tmp_path / "progress.log"
+    path.write_bytes(b"progress 10%\rprogress 100%\nline2\nline3\nline4")
+    small, large = _read_both_paths(monkeypatch, path, offset=2, limit=1)
+    assert small == large
+    assert "(lines 2-2 of 4)" in small
+    assert small.endswith("line2\n")
+
+
+def test_read_file_continues_inside_a_long_line(tmp_path, monkeypatch):
+    path = tmp_path / "minified.js"
+    path.write_bytes(b"a" * 25 + b"b" * 25 + b"\nnext\n")
+    for result in _read_both_paths(monkeypatch, path, max_bytes=25):
+        assert result.splitlines()[1] == "a" * 25
+        assert "offset=1 and skip_bytes=25" in result
+
+    for result in _read_both_paths(monkeypatch, path, offset=1, skip_bytes=25):
+        assert "from byte 25 of line 1" in result
+        assert result.splitlines()[1:] == ["b" * 25, "next"]
+
+
+def test_list_files_pages_through_a_directory_with_the_cursor(tmp_path):
+    for name in ("a.txt", "b.txt", "c.txt", "d.txt", "e.txt"):
+        (tmp_path / name).write_text(name)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "f.txt").write_text("f")
+
+    listed, cursor, pages = [], None, 0
+    while True:
+        result = file_tools.list_files(
+            str(tmp_path), max_depth=2, limit=2, cursor=cursor
+        )
+        pages += 1
+        listed += [line for line in result.splitlines() if line.startswith("[")]
+        match = re.search(r'cursor="([^"]+)"', result)
+        if match is None:
+            break
+        cursor = match.group(1)
+
+    assert pages == 4
+    assert [line for line in listed if not line.startswith("[More")] == [
+        "[FILE] a.txt",
+        "[FILE] b.txt",
+        "[FILE] c.txt",
+        "[FILE] d.txt",
+        "[FILE] e.txt",
+        "[DIR] sub/",
+        "[FILE] sub/f.txt",
+    ]
+
+
+def test_edit_file_applies_every_hunk_in_one_write(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text("import os\n\ndef old():\n    return 1\n")
+    result = file_tools.edit_file(
+        str(path), [("import os", "import sys"), ("return 1", "return 2")]
+    )
+    assert not result.startswith("Error")
+    assert path.read_text() == "import sys\n\ndef old():\n    return 2\n"
+
+
+@pytest.mark.parametrize(
+    "edits",
+    [
+        [("import os", "import sys"), ("missing", "anything")],
+        [("def old():", "def new():"), ("old():\n    return", "x")],
+    ],
+    ids=["missing hunk", "overlapping hunks"],
+)
+def test_edit_file_changes_nothing_when_a_hunk_cannot_be_applied(tmp_path, edits):
+    path = tmp_path / "module.py"
+    original = "import os\n\ndef old():\n    return 1\n"
+    path.write_text(original)
+    result = file_tools.edit_file(str(path), edits)
+    assert result.startswith("Error")
+    assert "No changes were made" in result
+    assert path.read_text() == original
+
+
+def test_read_file_cannot_be_asked_for_more_than_the_cap(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_text(("x" * 99 + "\n") * 1000)
+    result = read_file(str(path), max_bytes=10 * file_tools.DEFAULT_MAX_READ_BYTES)
+    assert len(result) < file_tools.DEFAULT_MAX_READ_BYTES + 200
+    next_line = file_tools.DEFAULT_MAX_READ_BYTES // 100 + 1
+    assert result.endswith(f"Call read_file with offset={next_line} to continue.]")
@@ -0,0 +1,14 @@
+from rate_limiter import RateLimiter
+
+
+def test_an_idle_limiter_admits_a_typical_request_without_waiting():
+    limiter = RateLimiter(requests_per_minute=500, tokens_per_minute=90_000)
+    assert limiter.reserve(20_000) == 0.0
+
+
+def test_requests_wait_once_the_minute_quota_is_spent():
+    limiter = RateLimiter(tokens_per_minute=90_000)
+    for _ in range(4):
+        assert limiter.reserve(20_000) == 0.0
+    # 10,000 tokens are left; the next 10,000 take about 60 * 10k / 90k seconds
+    assert 6.0 < limiter.reserve(20_000) <= 60 * 10_000 / 90_000
@@ -0,0 +1,46 @@
+import threading
+
+from server import SessionManager
+from session_store import SessionStore
+
+
+class _Agent:
+    def close(self):
+        pass
+
+
+def test_loading_one_session_does_not_hold_up_the_others(tmp_path):
+    slow_started, slow_may_finish = threading.Event(), threading.Event()
+    built = []
+
+    def create_agent(session_id):
+        built.append(session_id)
+        if session_id == "slow":
+            slow_started.set()
+            slow_may_finish.wait(5)
+        return _Agent()
+
+    sessions = SessionManager(create_agent, SessionStore(str(tmp_path)))
+    for session_id in ("slow", "fast"):
+        sessions.create(session_id)
+
+    got = []
+    waiters = [
+        threading.Thread(target=lambda: got.append(sessions.get("slow")))
+        for _ in range(2)
+    ]
+    for waiter in waiters:
+        waiter.start()
+    assert slow_started.wait(5)
+
+    # Answered while the slow session is still replaying its log
+    fast = threading.Thread(target=sessions.get, args=("fast",))
+    fast.start()
+    fast.join(2)
+    assert not fast.is_alive()
+
+    slow_may_finish.set()
+    for waiter in waiters:
+        waiter.join(5)
+    assert built.count("slow") == 1
+    assert len(got) == 2 and got[0] is got[1]
@@ -0,0 +1,68 @@
+import json
+
+from session_store import INTERRUPTED_TOOL_RESULT, SessionStore
+
+
+def _tool_call(call_id):
+    return {
+        "id": call_id,
+        "type": "function",
+        "function": {"name": "read_file", "arguments": "{}"},
+    }
+
+
+def test_load_replays_appends_after_the_last_snapshot(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.append("s", {"role": "user", "content": "old"})
+    store.snapshot("s", [{"role": "system", "content": "summary"}])
+    store.append("s", {"role": "user", "content": "new"})
+    with open(store.path("s"), "a") as file:
+        file.write('{"message": {"role": "assis')  # torn last line
+
+    assert store.load("s") == [
+        {"role": "system", "content": "summary"},
+        {"role": "user", "content": "new"},
+    ]
+
+
+def test_load_answers_tool_calls_interrupted_by_a_crash(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.append("s", {"role": "user", "content": "read two files"})
+    store.append(
+        "s",
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [_tool_call("a"), _tool_call("b")],
+        },
+    )
+    store.append("s", {"role": "tool", "tool_call_id": "a", "content": "done"})
+    # The process died before the result for "b"; the user came back later
+    store.append("s", {"role": "user", "content": "are you there?"})
+
+    messages = store.load("s")
+    assert [message["role"] for message in messages] == [
+        "user",
+        "assistant",
+        "tool",
+        "tool",
+        "user",
+    ]
+    assert messages[3] == {
+        "role": "tool",
+        "tool_call_id": "b",
+        "content": INTERRUPTED_TOOL_RESULT,
+    }
+
+
+def test_load_answers_tool_calls_at_the_end_of_the_log(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.append(
+        "s", {"role": "assistant", "content": None, "tool_calls": [_tool_call("a")]}
+    )
+
+    messages = store.load("s")
+    assert messages[-1]["tool_call_id"] == "a"
+    # The log itself is left as written
+    with open(store.path("s")) as file:
+        assert len([json.loads(line) for line in file]) == 1
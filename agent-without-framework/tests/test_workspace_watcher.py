@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+
+from workspace_watcher import WorkspaceWatcher
+
+
+@pytest.mark.parametrize("use_inotify", [True, False], ids=["inotify", "polling"])
+def test_refreshes_from_concurrent_tool_threads(tmp_path, use_inotify):
+    watcher = WorkspaceWatcher(str(tmp_path), use_inotify=use_inotify).start()
+    try:
+        assert watcher.ready.wait(5)
+
+        def write_files(worker):
+            for number in range(20):
+                path = tmp_path / f"dir{worker}" / f"sub{number}" / "file.txt"
+                path.parent.mkdir(parents=True)
+                path.write_text(f"{worker} {number}")
+                watcher.refresh_path(str(path))
+
+        threads = [threading.Thread(target=write_files, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected = {
+            f"dir{worker}/sub{number}/file.txt"
+            for worker in range(8)
+            for number in range(20)
+        }
+        assert set(watcher.files()) == expected
+        if watcher.mode == "inotify":
+            # One watch per directory, each mapped to its own descriptor
+            watched = sorted(watcher._watches.values())
+            assert len(watched) == len(set(watched)) == 1 + 8 + 8 * 20
+    finally:
+        watcher.stop()
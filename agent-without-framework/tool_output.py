@@ -0,0 +1,243 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+# Largest slice fetch_output hands back at once
+MAX_FETCH_CHARS = 20_000
+
+# Lines worth keeping when the middle of a file is elided, most useful
+# first: top-level definitions, other top-level lines (imports, headings,
+# statements), then nested definitions such as methods.
+DEFINITION_PATTERN = re.compile(
+    r"^\s*(?:async\s+def|def|class|function|func|fn|struct|interface|type|enum|"
+    r"export|public|private|protected|@|#{1,6}\s)"
+)
+MAX_STRUCTURE_LINE_CHARS = 300
+
+
+def _structure_rank(line: str) -> Optional[int]:
+    if not line.strip() or len(line) > MAX_STRUCTURE_LINE_CHARS:
+        return None
+    top_level = not line[0].isspace()
+    if DEFINITION_PATTERN.match(line):
+        return 0 if top_level else 2
+    return 1 if top_level else None
+
+
+@dataclass
+class OutputPolicy:
+    """How a tool's result is cut down before it enters the conversation.
+
+    mode is "head_tail" (keep the start and the end), "elide" (keep the
+    start, the end and the structural lines in between) or "digest" (a
+    model-written digest, falling back to head_tail without a digester).
+    Results up to max_chars are passed through untouched.
+    """
+
+    max_chars: int = 20_000
+    mode: str = "head_tail"
+    tail_fraction: float = 0.25
+
+
+# read_file has none: it pages its output itself, at
+# file_tools.DEFAULT_MAX_READ_BYTES, with offsets the model can continue from
+DEFAULT_OUTPUT_POLICIES: Dict[str, OutputPolicy] = {
+    "list_files": OutputPolicy(max_chars=8_000, mode="head_tail"),
+    "edit_file": OutputPolicy(max_chars=4_000, mode="head_tail"),
+    "search_code": OutputPolicy(max_chars=8_000, mode="head_tail"),
+    "find_relevant_files": OutputPolicy(max_chars=16_000, mode="head_tail"),
+}
+
+
+class ToolOutputStore:
+    """Full tool outputs behind their handles, least recently used dropped first."""
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._outputs: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, text: str) -> str:
+        handle = "out_" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            if handle in self._outputs:
+                self._outputs.move_to_end(handle)
+                return handle
+            self._outputs[handle] = text
+            self._bytes += len(text)
+            while self._bytes > self.max_bytes and len(self._outputs) > 1:
+                _, evicted = self._outputs.popitem(last=False)
+                self._bytes -= len(evicted)
+        return handle
+
+    def get(self, handle: str) -> Optional[str]:
+        with self._lock:
+            text = self._outputs.get(handle)
+            if text is not None:
+                self._outputs.move_to_end(handle)
+            return text
+
+
+def _omitted(start: int, end: int, lines: Optional[int] = None) -> str:
+    what = f"{lines} lines, " if lines is not None else ""
+    return f"[... {what}characters {start}-{end} omitted ...]"
+
+
+def head_tail(text: str, max_chars: int, tail_fraction: float = 0.25) -> str:
+    tail_chars = int(max_chars * tail_fraction)
+    head_chars = max_chars - tail_chars
+    # Cut on line boundaries when one is close by
+    head_end = text.rfind("\n", 0, head_chars) + 1 or head_chars
+    if head_end < head_chars // 2:
+        head_end = head_chars
+    tail_start = text.find("\n", len(text) - tail_chars) + 1 or len(text) - tail_chars
+    if tail_start <= head_end:
+        return text
+    return text[:head_end] + _omitted(head_end, tail_start) + "\n" + text[tail_start:]
+
+
+def elide_structure(text: str, max_chars: int, tail_fraction: float = 0.25) -> str:
+    """Keeps the head and tail and, in between, as many structural lines as fit."""
+    tail_chars = int(max_chars * tail_fraction)
+    head_chars = (max_chars - tail_chars) // 2
+    lines = text.splitlines(keepends=True)
+    offsets: List[int] = []
+    position = 0
+    for line in lines:
+        offsets.append(position)
+        position += len(line)
+
+    head_count = 0
+    while (
+        head_count < len(lines)
+        and offsets[head_count] + len(lines[head_count]) <= head_chars
+    ):
+        head_count += 1
+    tail_count = 0
+    while (
+        tail_count < len(lines) - head_count
+        and len(text) - offsets[len(lines) - tail_count - 1] <= tail_chars
+    ):
+        tail_count += 1
+    middle = range(head_count, len(lines) - tail_count)
+    tail_start = offsets[middle.stop] if middle.stop < len(lines) else len(text)
+
+    # Fill the space left between head and tail, best ranked lines first;
+    # every run of dropped lines costs a marker of about 50 characters.
+    budget = max_chars - offsets[middle.start] - (len(text) - tail_start)
+    ranked = sorted(
+        (rank, index)
+        for index in middle
+        if (rank := _structure_rank(lines[index])) is not None
+    )
+    selected = set()
+    for rank, index in ranked:
+        cost = len(lines[index]) + 50
+        if cost > budget:
+            break
+        selected.add(index)
+        budget -= cost
+
+    kept = lines[:head_count]
+    run_start: Optional[int] = None
+    run_lines = 0
+    for index in middle:
+        if index in selected:
+            if run_start is not None:
+                kept.append(_omitted(run_start, offsets[index], run_lines) + "\n")
+                run_start, run_lines = None, 0
+            kept.append(lines[index])
+        else:
+            if run_start is None:
+                run_start = offsets[index]
+            run_lines += 1
+    if run_start is not None:
+        kept.append(_omitted(run_start, tail_start, run_lines) + "\n")
+    kept.extend(lines[middle.stop :])
+
+    elided = "".join(kept)
+    if len(elided) < max_chars // 2:
+        # Little structure to show (or very long lines); more raw text helps more
+        return head_tail(text, max_chars, tail_fraction)
+    return elided
+
+
+def govern_output(
+    tool_name: str,
+    text: str,
+    policy: Optional[OutputPolicy],
+    store: ToolOutputStore,
+    digester: Optional[Callable[[str, str, int], str]] = None,
+) -> str:
+    if policy is None or len(text) <= policy.max_chars:
+        return text
+
+    handle = store.put(text)
+    shortened = None
+    if policy.mode == "digest" and digester is not None:
+        try:
+            shortened = digester(tool_name, text, policy.max_chars)[: policy.max_chars]
+        except Exception as e:
+            logging.warning(f"Digest of {tool_name} output failed: {e}")
+    if shortened is None and policy.mode == "elide":
+        shortened = elide_structure(text, policy.max_chars, policy.tail_fraction)
+    if shortened is None:
+        shortened = head_tail(text, policy.max_chars, policy.tail_fraction)
+
+    logging.info(
+        f"Shortened {tool_name} output from {len(text)} to {len(shortened)} characters"
+    )
+    return (
+        f"{shortened}\n[Output shortened from {len(text)} characters. Call "
+        f'fetch_output with handle="{handle}" and an offset to read the omitted parts.]'
+    )
+
+
+def fetch_output(
+    store: ToolOutputStore, handle: str, offset: int = 0, limit: Optional[int] = None
+) -> str:
+    text = store.get(handle)
+    if text is None:
+        return f"Error: Output {handle} is no longer available; run the tool again."
+    limit = min(limit or MAX_FETCH_CHARS, MAX_FETCH_CHARS)
+    offset = max(offset, 0)
+    piece = text[offset : offset + limit]
+    end = offset + len(piece)
+    result = f"Output {handle}, characters {offset}-{end} of {len(text)}:\n{piece}"
+    if end < len(text):
+        result += f"\n[Call fetch_output with offset={end} to continue.]"
+    return result
+
+
+def model_digester(
+    client, model: str = "gpt-4o-mini"
+) -> Callable[[str, str, int], str]:
+    """A digester that asks the model for a digest of an oversized output.
+
+    Takes a synchronous OpenAI client. Only the start and end of very large
+    outputs are sent, bounded by the digest's own budget.
+    """
+
+    def digest(tool_name: str, text: str, max_chars: int) -> str:
+        excerpt = head_tail(text, max_chars * 4)
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Write a dense digest of this tool output for a coding "
+                    "assistant. Keep names, paths, signatures, numbers and errors.",
+                },
+                {"role": "user", "content": f"Output of {tool_name}:\n{excerpt}"},
+            ],
+            max_tokens=max(64, max_chars // 4),
+            temperature=0,
+        )
+        return f"[Digest of {tool_name} output]\n{response.choices[0].message.content}"
+
+    return digest
@@ -0,0 +1,258 @@
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Seconds a tool call may take before its result is given up on; tools
+# without an entry (or with None) run without a deadline. edit_file has none:
+# a write cannot be cancelled part way, and an abandoned edit that lands
+# later would race the next edit of the same file.
+DEFAULT_TOOL_TIMEOUTS: Dict[str, Optional[float]] = {
+    "read_file": 30.0,
+    "list_files": 30.0,
+    "edit_file": None,
+    "search_code": 60.0,
+    "find_relevant_files": 120.0,
+    "fetch_output": 5.0,
+}
+
+# Tools that can run in a worker process, by the function that implements
+# them; only plain functions of picklable arguments qualify
+PROCESS_TOOLS: Dict[str, Tuple[str, str]] = {
+    "read_file": ("file_tools", "read_file"),
+    "list_files": ("file_tools", "list_files"),
+}
+
+DEFAULT_WORKER_PROCESSES = 2
+
+
+class ToolTimeout(BaseException):
+    """The running tool's deadline passed.
+
+    A BaseException, like asyncio.CancelledError, so that the tools' own
+    "except Exception" error handling does not turn it into an ordinary
+    error result.
+    """
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.cancelled = threading.Event()
+
+    def expired(self) -> bool:
+        return self.cancelled.is_set() or time.monotonic() >= self.expires_at
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "tool_deadline", default=None
+)
+
+
+def check_deadline():
+    """Raises ToolTimeout once the running tool's deadline has passed.
+
+    Long loops in the tools call this, so a call that was given up on stops
+    at the next check instead of running on in the background.
+    """
+    deadline = _current_deadline.get()
+    if deadline is not None and deadline.expired():
+        raise ToolTimeout()
+
+
+def timeout_result(tool_name: str, seconds: float, cancelled: bool = True) -> str:
+    """The result given for a late call.
+
+    cancelled says whether the call is known to have stopped; a call that
+    was only asked to stop may still complete, so its outcome is unknown.
+    """
+    details = json.dumps(
+        {
+            "status": "timeout",
+            "tool": tool_name,
+            "timeout_seconds": seconds,
+            "outcome": "cancelled" if cancelled else "unknown",
+        }
+    )
+    if cancelled:
+        what_happened = "was cancelled"
+    else:
+        what_happened = (
+            "was asked to stop, but may still complete; its outcome is unknown"
+        )
+    return (
+        f"Error: Tool {tool_name} did not finish within {seconds:g} seconds and "
+        f"{what_happened}. Try a narrower request or another approach. {details}"
+    )
+
+
+def run_with_deadline(
+    tool_name: str,
+    function: Callable[[], str],
+    timeout: Optional[float],
+    on_done: Optional[Callable[[], None]] = None,
+) -> Tuple[str, bool]:
+    """Runs function on its own thread; returns (result, timed_out).
+
+    A thread blocked in the kernel cannot be stopped, so after the deadline
+    the thread is left behind (it is a daemon) and cancelled cooperatively:
+    its next check_deadline raises. on_done is called once function has
+    really returned, which for an abandoned call is after this returns;
+    callers release per-tool locks there so a late call keeps its slot.
+    """
+    if timeout is None:
+        try:
+            return function(), False
+        finally:
+            if on_done is not None:
+                on_done()
+    deadline = Deadline(timeout)
+    outcome: Dict[str, Any] = {}
+    done = threading.Event()
+
+    def target():
+        _current_deadline.set(deadline)
+        try:
+            outcome["result"] = function()
+        except ToolTimeout:
+            outcome["result"] = timeout_result(tool_name, timeout)
+            outcome["timed_out"] = True
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            if on_done is not None:
+                on_done()
+            done.set()
+
+    threading.Thread(target=target, name=f"tool-{tool_name}", daemon=True).start()
+    if not done.wait(timeout):
+        deadline.cancelled.set()
+        logging.warning(f"Tool {tool_name} missed its {timeout:g}s deadline")
+        return timeout_result(tool_name, timeout, cancelled=False), True
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"], outcome.get("timed_out", False)
+
+
+def _worker_main(connection):
+    import importlib
+
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        (module_name, function_name), args = request
+        try:
+            function = getattr(importlib.import_module(module_name), function_name)
+            reply = (True, function(*args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            connection.send(reply)
+        except Exception as e:
+            # The exception itself could not be pickled
+            connection.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class WorkerPool:
+    """Warm worker processes for tools that may hang in the kernel.
+
+    A thread stuck reading a FIFO or a dead network mount cannot be stopped,
+    but a process can: a call that misses its deadline kills its worker and
+    a fresh one is started in its place, so the pool stays warm. Workers are
+    spawned rather than forked, since forking a process with running
+    threads can deadlock the child.
+    """
+
+    def __init__(self, size: int = DEFAULT_WORKER_PROCESSES):
+        import multiprocessing
+
+        self.size = size
+        self.replaced = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child,), name="tool-worker", daemon=True
+        )
+        process.start()
+        child.close()
+        return process, parent
+
+    def _replace(self, process, connection):
+        process.kill()
+        process.join()
+        connection.close()
+        self.replaced += 1
+        self._idle.put(self._start_worker())
+
+    def call(self, tool_name: str, args: tuple, timeout: Optional[float]) -> Any:
+        """Runs a PROCESS_TOOLS tool in a worker; raises ToolTimeout when late.
+
+        Exceptions raised by the tool are raised here, so callers handle
+        them as if the tool had run in process.
+        """
+        started = time.monotonic()
+        try:
+            process, connection = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise ToolTimeout()
+        remaining = None if timeout is None else timeout - (time.monotonic() - started)
+        try:
+            connection.send((PROCESS_TOOLS[tool_name], args))
+            reply = connection.recv() if connection.poll(remaining) else None
+        except (EOFError, OSError) as e:
+            logging.warning(f"Tool worker died running {tool_name}: {e}")
+            self._replace(process, connection)
+            raise RuntimeError(f"The worker process running {tool_name} died")
+        if reply is None:
+            logging.warning(
+                f"Killing the worker running {tool_name} after {timeout:g}s"
+            )
+            self._replace(process, connection)
+            raise ToolTimeout()
+
+        self._idle.put((process, connection))
+        ok, value = reply
+        if not ok:
+            raise value
+        return value
+
+    def close(self):
+        for _ in range(self.size):
+            try:
+                process, connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+            connection.close()
+
+
+_shared_pool: Optional[WorkerPool] = None
+_shared_lock = threading.Lock()
+
+
+def shared_worker_pool() -> WorkerPool:
+    """The process-wide pool used by agents that isolate tools."""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = WorkerPool()
+        return _shared_pool
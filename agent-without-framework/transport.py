@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+# httpx and openai take most of the agent's startup time, so they are only
+# imported once a client is built or a request has failed.
+if TYPE_CHECKING:
+    import httpx
+
+# Connect fails fast; reads allow for long completions between chunks
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 120.0
+POOL_TIMEOUT = 10.0
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 30.0
+
+_shared_http_client: Optional["httpx.Client"] = None
+_shared_lock = threading.Lock()
+
+
+def default_timeout() -> "httpx.Timeout":
+    import httpx
+
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT)
+
+
+def default_limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def create_http_client(timeout=None, limits=None) -> "httpx.Client":
+    from openai import DefaultHttpxClient
+
+    return DefaultHttpxClient(
+        timeout=timeout or default_timeout(), limits=limits or default_limits()
+    )
+
+
+def create_async_http_client(timeout=None, limits=None) -> "httpx.AsyncClient":
+    from openai import DefaultAsyncHttpxClient
+
+    return DefaultAsyncHttpxClient(
+        timeout=timeout or default_timeout(), limits=limits or default_limits()
+    )
+
+
+def shared_http_client() -> "httpx.Client":
+    """The process-wide connection pool used by agents without their own client."""
+    global _shared_http_client
+    with _shared_lock:
+        if _shared_http_client is None or _shared_http_client.is_closed:
+            _shared_http_client = create_http_client()
+        return _shared_http_client
+
+
+def retry_after_seconds(headers: "httpx.Headers") -> Optional[float]:
+    """Parses retry-after-ms, or Retry-After as seconds or an HTTP date."""
+    import email.utils
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    # SDK status errors carry status_code; checked by duck typing so that
+    # the SDK is not imported just to classify an exception
+    return getattr(error, "status_code", None) == 429
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff for transient completion failures.
+
+    Rate limits, server errors, timeouts and dropped connections are retried;
+    a Retry-After from the server takes precedence over the backoff.
+    """
+
+    max_retries: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    retry_statuses: frozenset = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+    def retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retry number attempt + 1, or None to give up."""
+        if attempt >= self.max_retries:
+            return None
+        import httpx
+        from openai import APIConnectionError, APIStatusError
+
+        retry_after = None
+        if isinstance(error, APIStatusError):
+            if error.status_code not in self.retry_statuses:
+                return None
+            retry_after = retry_after_seconds(error.response.headers)
+        elif not isinstance(error, (APIConnectionError, httpx.TransportError)):
+            return None
+
+        if retry_after is not None:
+            # A little jitter so clients told the same instant do not align
+            return min(retry_after, self.max_delay) + random.uniform(0, self.base_delay)
+        # Full jitter: anywhere between zero and the exponential ceiling
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
@@ -0,0 +1,420 @@
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import logging
+import os
+import select
+import struct
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import file_tools
+
+# Seconds between scans when inotify is not available
+DEFAULT_POLL_INTERVAL = 2.0
+
+# Larger files get sizes and mtimes in the snapshot but no content hash
+HASH_MAX_BYTES = 1024 * 1024
+
+# Directories that are neither watched nor kept in the snapshot; listings
+# inside them go to the filesystem as before
+UNWATCHED_NAMES = frozenset(
+    {
+        ".git",
+        ".hg",
+        ".svn",
+        ".cache",
+        ".venv",
+        "venv",
+        "node_modules",
+        "__pycache__",
+        ".mypy_cache",
+        ".pytest_cache",
+        ".tox",
+    }
+)
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+@dataclass
+class FileInfo:
+    size: int
+    mtime_ns: int
+    # blake2b of the contents, None for files over HASH_MAX_BYTES
+    digest: Optional[str]
+
+
+class _Inotify:
+    """Minimal inotify binding over ctypes; raises OSError where unsupported."""
+
+    def __init__(self):
+        library = ctypes.util.find_library("c")
+        if library is None:
+            raise OSError(errno.ENOSYS, "libc not found")
+        self._libc = ctypes.CDLL(library, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read_events(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """(watch descriptor, mask, name) of the events within timeout."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        position = 0
+        while position < len(buffer):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, position)
+            position += _EVENT_HEADER.size
+            name = buffer[position : position + length].rstrip(b"\0")
+            position += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _stat_key(stat_result: os.stat_result) -> tuple:
+    return (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+
+
+def _digest(path: str, size: int) -> Optional[str]:
+    if size > HASH_MAX_BYTES:
+        return None
+    try:
+        with open(path, "rb") as file:
+            return hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+    except OSError:
+        return None
+
+
+class WorkspaceWatcher:
+    """In-memory snapshot of a workspace tree, kept current in the background.
+
+    The snapshot holds the sorted listing of every directory and the size,
+    mtime and content hash of every file. A daemon thread keeps it current
+    from inotify events, or by rescanning every poll_interval seconds where
+    inotify is unavailable (other platforms, or out of watches). While it
+    runs, file_tools answers listings inside the workspace from the
+    snapshot instead of the filesystem. Changes made outside the agent show
+    up once their events are processed, usually within milliseconds.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        use_inotify: bool = True,
+    ):
+        self.root = os.path.abspath(root)
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.mode: Optional[str] = None
+        self.ready = threading.Event()
+        # relative dir ("" for the root) -> (stat key, sorted entries)
+        self._dirs: Dict[str, Tuple[tuple, List[Tuple[str, bool, bool]]]] = {}
+        self._files: Dict[str, FileInfo] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._inotify: Optional[_Inotify] = None
+        self._watches: Dict[int, str] = {}
+        # Scans run on the watcher thread and, through refresh_path, on tool
+        # threads; one at a time, since they change _watches and add watches
+        # on the shared inotify fd
+        self._scan_lock = threading.Lock()
+        # inotify instances given up on by _watch; only the watcher thread
+        # reads the fd, so it is the one that closes them
+        self._retired: List[_Inotify] = []
+
+    def start(self) -> "WorkspaceWatcher":
+        self._thread = threading.Thread(
+            target=self._run, name="workspace-watcher", daemon=True
+        )
+        self._thread.start()
+        file_tools.add_listing_source(self.listing)
+        return self
+
+    def stop(self):
+        file_tools.remove_listing_source(self.listing)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _absolute(self, relative_path: str) -> str:
+        return os.path.join(self.root, relative_path) if relative_path else self.root
+
+    def _relative(self, path: str) -> Optional[str]:
+        path = os.path.abspath(path)
+        if path == self.root:
+            return ""
+        if not path.startswith(self.root + os.sep):
+            return None
+        relative_path = path[len(self.root) + 1 :].replace(os.sep, "/")
+        if any(part in UNWATCHED_NAMES for part in relative_path.split("/")):
+            return None
+        return relative_path
+
+    def listing(self, directory: str) -> Optional[List[Tuple[str, bool, bool]]]:
+        """The snapshot's (name, is_dir, is_symlink) entries, if it has them."""
+        if not self.ready.is_set():
+            return None
+        relative_dir = self._relative(directory)
+        if relative_dir is None:
+            return None
+        with self._lock:
+            entry = self._dirs.get(relative_dir)
+        return entry[1] if entry is not None else None
+
+    def file_info(self, path: str) -> Optional[FileInfo]:
+        relative_path = self._relative(path)
+        if relative_path is None or not self.ready.is_set():
+            return None
+        with self._lock:
+            return self._files.get(relative_path)
+
+    def files(self) -> Dict[str, FileInfo]:
+        with self._lock:
+            return dict(self._files)
+
+    def refresh_path(self, path: str):
+        """Brings one file and its directory up to date right away."""
+        relative_path = self._relative(path)
+        if relative_path is None:
+            return
+        with self._scan_lock:
+            self._scan_file(relative_path)
+            # Rescanning the nearest known directory also picks up
+            # directories created for the file
+            parent = relative_path.rpartition("/")[0]
+            with self._lock:
+                while parent and parent not in self._dirs:
+                    parent = parent.rpartition("/")[0]
+            self._scan_dir(parent, recursive=False)
+
+    def _scan_file(self, relative_path: str):
+        path = self._absolute(relative_path)
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._files.pop(relative_path, None)
+            return
+        info = FileInfo(
+            stat_result.st_size,
+            stat_result.st_mtime_ns,
+            _digest(path, stat_result.st_size),
+        )
+        with self._lock:
+            self._files[relative_path] = info
+
+    def _forget_dir(self, relative_dir: str):
+        prefix = relative_dir + "/" if relative_dir else ""
+        with self._lock:
+            for name in [
+                d for d in self._dirs if d == relative_dir or d.startswith(prefix)
+            ]:
+                del self._dirs[name]
+            for name in [f for f in self._files if f.startswith(prefix)]:
+                del self._files[name]
+
+    def _scan_dir(self, relative_dir: str, recursive: bool):
+        """Rescans a directory; new subdirectories are always scanned fully."""
+        directory = self._absolute(relative_dir)
+        try:
+            key = _stat_key(os.stat(directory))
+            with os.scandir(directory) as iterator:
+                entries = sorted(
+                    (entry.name, entry.is_dir(), entry.is_symlink())
+                    for entry in iterator
+                )
+        except OSError:
+            self._forget_dir(relative_dir)
+            return
+
+        with self._lock:
+            previous = self._dirs.get(relative_dir)
+            self._dirs[relative_dir] = (key, entries)
+        old_names = (
+            {name: is_dir for name, is_dir, _ in previous[1]} if previous else {}
+        )
+        new_names = {name: is_dir for name, is_dir, _ in entries}
+        for name, is_dir in old_names.items():
+            if new_names.get(name) != is_dir:
+                child = f"{relative_dir}/{name}" if relative_dir else name
+                if is_dir:
+                    self._forget_dir(child)
+                else:
+                    with self._lock:
+                        self._files.pop(child, None)
+
+        for name, is_dir, is_symlink in entries:
+            child = f"{relative_dir}/{name}" if relative_dir else name
+            if is_dir:
+                if name in UNWATCHED_NAMES or is_symlink:
+                    continue
+                if recursive or child not in self._dirs:
+                    self._watch(child)
+                    self._scan_dir(child, recursive)
+            elif recursive or name not in old_names:
+                self._scan_file(child)
+
+    def _watch(self, relative_dir: str):
+        if self._inotify is None:
+            return
+        try:
+            self._watches[self._inotify.add_watch(self._absolute(relative_dir))] = (
+                relative_dir
+            )
+        except OSError as e:
+            # Usually ENOSPC: out of watches. Polling still sees everything.
+            logging.warning(f"Workspace watcher falls back to polling: {e}")
+            self._retired.append(self._inotify)
+            self._inotify = None
+            self._watches.clear()
+            self.mode = "polling"
+
+    def _run(self):
+        if self.use_inotify:
+            try:
+                self._inotify = _Inotify()
+                self.mode = "inotify"
+            except OSError as e:
+                logging.info(f"inotify unavailable ({e}); polling the workspace")
+        if self._inotify is None:
+            self.mode = "polling"
+        try:
+            with self._scan_lock:
+                self._watch("")
+                self._scan_dir("", recursive=True)
+            self.ready.set()
+            logging.info(
+                f"Workspace snapshot of {self.root}: {len(self._files)} files, "
+                f"{len(self._dirs)} directories, {self.mode}"
+            )
+            while not self._stop.is_set():
+                self._close_retired()
+                inotify = self._inotify
+                if inotify is not None:
+                    events = inotify.read_events(0.5)
+                    with self._scan_lock:
+                        # Unless a tool thread's refresh gave up on inotify
+                        if self._inotify is inotify:
+                            self._process_events(events)
+                elif not self._stop.wait(self.poll_interval):
+                    with self._scan_lock:
+                        self._poll()
+        except Exception as e:
+            logging.error(f"Workspace watcher stopped: {e}")
+        finally:
+            # Never serve a snapshot that is no longer maintained
+            self.ready.clear()
+            with self._scan_lock:
+                if self._inotify is not None:
+                    self._retired.append(self._inotify)
+                    self._inotify = None
+            self._close_retired()
+
+    def _close_retired(self):
+        with self._scan_lock:
+            retired, self._retired = self._retired, []
+        for inotify in retired:
+            inotify.close()
+
+    def _process_events(self, events: List[Tuple[int, int, str]]):
+        dirty_dirs: Set[str] = set()
+        dirty_files: Set[str] = set()
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; only a full rescan is safe
+                self._scan_dir("", recursive=True)
+                return
+            relative_dir = self._watches.get(wd)
+            if relative_dir is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                dirty_dirs.add(relative_dir.rpartition("/")[0])
+                continue
+            child = f"{relative_dir}/{name}" if relative_dir else name
+            if mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO):
+                dirty_dirs.add(relative_dir)
+            if not mask & IN_ISDIR and name not in UNWATCHED_NAMES:
+                dirty_files.add(child)
+        for relative_dir in sorted(dirty_dirs):
+            self._scan_dir(relative_dir, recursive=False)
+        for relative_path in dirty_files:
+            self._scan_file(relative_path)
+
+    def _poll(self):
+        # A file's mtime changes without touching its directory's, so every
+        # file is stat'ed; directories are only rescanned when they changed
+        with self._lock:
+            dirs = {name: key for name, (key, _) in self._dirs.items()}
+            files = dict(self._files)
+        for relative_dir, key in dirs.items():
+            try:
+                changed = _stat_key(os.stat(self._absolute(relative_dir)))
+            except OSError:
+                changed = None
+            if changed != key:
+                self._scan_dir(relative_dir, recursive=False)
+        for relative_path, info in files.items():
+            try:
+                stat_result = os.stat(self._absolute(relative_path))
+            except OSError:
+                continue
+            if (stat_result.st_size, stat_result.st_mtime_ns) != (
+                info.size,
+                info.mtime_ns,
+            ):
+                self._scan_file(relative_path)
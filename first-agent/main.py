@@ -1,11 +1,6 @@
-from dotenv import load_dotenv
-from pydantic import BaseModel
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
-from langchain.agents import create_agent
-from tools import search_tool, wiki_tool, save_tool
+import argparse
 
-load_dotenv()
+from pydantic import BaseModel
 
 
 class ResearchResponse(BaseModel):
@@ -15,35 +10,104 @@ class ResearchResponse(BaseModel):
     tools_used: list[str]
 
 
-def main():
-    try:
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-
-        # Create parser for structured output
-        parser = PydanticOutputParser(pydantic_object=ResearchResponse)
+# How the final ResearchResponse is produced:
+# - tool: the model answers by calling a ResearchResponse tool
+# - native: the provider's JSON-schema response format constrains the answer
+# - parser: format instructions go in the prompt and the reply text is parsed
+OUTPUT_MODES = ("tool", "native", "parser")
 
-        # Create tool calling agent with search tool only (wiki_tool causing issues)
-        tools = [search_tool, wiki_tool, save_tool]
+# Follow-up requests made when the final answer is missing or does not
+# validate; each one continues the same conversation, so no tool is rerun
+MAX_REPAIR_ATTEMPTS = 1
 
-        agent = create_agent(
-            model=llm,
-            system_prompt=f"""You are a research assistant. 
+SYSTEM_PROMPT = """You are a research assistant.
 
             CRITICAL INSTRUCTION: For ANY user question, you MUST use the search tool to find current information before responding.
 
             Available tools:
-            - search: Use this to find current web information about any topic            
+            - search: Use this to find current web information about any topic
             - wiki: Use this to query Wikipedia for information
             - save: Use this to save research output to a file
 
             Use necessary tools to gather information.
 
-            {parser.get_format_instructions()}
+            IMPORTANT:
+            - Use real URLs from search results for sources"""
+
+PARSER_PROMPT = """
+
+            {format_instructions}
+
+            - Provide only the JSON response after using tools"""
+
+REPAIR_PROMPT = (
+    "Your final answer could not be used as a ResearchResponse: {error}. "
+    "Give the final answer again as a ResearchResponse, using the information "
+    "you have already gathered."
+)
+
+
+def response_format(mode: str):
+    from langchain.agents.structured_output import ProviderStrategy, ToolStrategy
+
+    if mode == "tool":
+        return ToolStrategy(ResearchResponse)
+    if mode == "native":
+        return ProviderStrategy(ResearchResponse)
+    return None
+
+
+def structured_output(response, parser=None) -> ResearchResponse:
+    """The ResearchResponse of an agent run; raises when there is none."""
+    if parser is not None:
+        return parser.parse(response["messages"][-1].content)
+    structured = response.get("structured_response")
+    if structured is None:
+        raise ValueError("the agent finished without giving a ResearchResponse")
+    return structured
 
-            IMPORTANT: 
-            - Use real URLs from search results for sources
-            - Provide only the JSON response after using tools""",
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Research assistant agent")
+    arg_parser.add_argument(
+        "--output-mode",
+        choices=OUTPUT_MODES,
+        default="tool",
+        help="How the structured ResearchResponse is obtained (default: tool)",
+    )
+    args = arg_parser.parse_args()
+
+    # LangChain, the OpenAI client and the tools are imported here rather
+    # than at module level so that importing this file stays cheap
+    from dotenv import load_dotenv
+    from langchain_core.output_parsers import PydanticOutputParser
+    from langchain_openai import ChatOpenAI
+    from langchain.agents import create_agent
+    from tools import search_tool, wiki_tool, save_tool
+
+    load_dotenv()
+
+    try:
+        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+
+        # Only the parser mode puts the schema in the prompt; the other modes
+        # hand it to the model as a tool or response format
+        parser = None
+        system_prompt = SYSTEM_PROMPT
+        if args.output_mode == "parser":
+            parser = PydanticOutputParser(pydantic_object=ResearchResponse)
+            system_prompt += PARSER_PROMPT.format(
+                format_instructions=parser.get_format_instructions()
+            )
+
+        # Create tool calling agent with search tool only (wiki_tool causing issues)
+        tools = [search_tool, wiki_tool, save_tool]
+
+        agent = create_agent(
+            model=llm,
+            system_prompt=system_prompt,
             tools=tools,
+            response_format=response_format(args.output_mode),
         )
 
         # Enable dynamic input - tools should work now
@@ -61,13 +125,38 @@ def main():
         print(f"❌ Error during agent setup or execution: {e}")
         return
 
+    # Extract the structured response, asking the agent to repair its final
+    # answer a bounded number of times
+    structured = None
+    for attempt in range(MAX_REPAIR_ATTEMPTS + 1):
+        try:
+            structured = structured_output(response, parser)
+            break
+        except Exception as e:
+            error = e
+        if attempt == MAX_REPAIR_ATTEMPTS:
+            break
+        print(f"⚠️  Final answer was not a valid ResearchResponse, repairing: {error}")
+        try:
+            response = agent.invoke(
+                {
+                    "messages": response["messages"]
+                    + [{"role": "user", "content": REPAIR_PROMPT.format(error=error)}]
+                }
+            )
+        except Exception as e:
+            print(f"❌ Error during repair: {e}")
+            break
+
     # Show tool usage clearly
     print("=== Tool Usage Summary ===")
     tool_calls = []
     for message in response["messages"]:
         if hasattr(message, "tool_calls") and message.tool_calls:
             for tool_call in message.tool_calls:
-                tool_calls.append(tool_call)
+                # The tool mode's answer arrives as a ResearchResponse call
+                if tool_call["name"] != ResearchResponse.__name__:
+                    tool_calls.append(tool_call)
 
     if tool_calls:
         print("Tools used by agent:")
@@ -78,25 +167,19 @@ def main():
 
     print(f"\n=== Agent Made {len(tool_calls)} Tool Call(s) ===")
 
-    # Extract and parse the structured response
-    last_message = response["messages"][-1]
-
-    try:
-        # Parse the structured response using PydanticOutputParser
-        structured_output = parser.parse(last_message.content)
-
-        print("=== Successfully Parsed Structured Response ===")
-        print(f"Topic: {structured_output.topic}")
-        print(f"Summary: {structured_output.summary}")
-        print(f"Sources: {structured_output.sources}")
-        print(f"Tools used: {structured_output.tools_used}")
+    if structured is None:
+        print(f"❌ Parsing error: {error}")
+        print("Raw agent response:", response["messages"][-1].content)
+        return
 
-        print("\nTool calling agent with empty tools list worked successfully!")
-        print("PydanticOutputParser successfully parsed the structured response!")
+    print("=== Successfully Parsed Structured Response ===")
+    print(f"Topic: {structured.topic}")
+    print(f"Summary: {structured.summary}")
+    print(f"Sources: {structured.sources}")
+    print(f"Tools used: {structured.tools_used}")
 
-    except Exception as e:
-        print(f"❌ Parsing error: {e}")
-        print("Raw agent response:", last_message.content)
+    print("\nTool calling agent with empty tools list worked successfully!")
+    print(f"Structured response obtained in {args.output_mode} mode!")
 
 
 if __name__ == "__main__":
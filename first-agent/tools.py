@@ -1,20 +1,45 @@
-from langchain_community.tools import DuckDuckGoSearchRun, WikipediaQueryRun
-from langchain_community.utilities import WikipediaAPIWrapper
-from langchain_core.tools import Tool
+import threading
 from datetime import datetime
 
-search = DuckDuckGoSearchRun()
-search_tool = Tool(
-    name="search",
-    func=search.run,
-    description="""Search the web for current, accurate information about any topic. 
-    Use this tool to find facts, statistics, recent news, and reliable sources.
-    Input should be a clear search query about the topic you need information on.
-    Returns relevant web search results with factual content.""",
-)
+# The tools are built on first access (from tools import search_tool, or
+# tools.search_tool), so importing this module does not pull in
+# langchain_community or open the search and Wikipedia clients.
+_tools = {}
+
+# Seconds a web or Wikipedia lookup may take before the agent moves on
+TOOL_TIMEOUT_SECONDS = 20
+
+
+def with_timeout(func, name: str, seconds: float = TOOL_TIMEOUT_SECONDS):
+    """Wraps a tool function so a stalled call returns an error message.
 
-api_wrapper = WikipediaAPIWrapper(top_k_results=1, max_summary_chars=100)
-wiki_tool = WikipediaQueryRun(api_wrapper=api_wrapper)
+    The call runs on a daemon thread; after the deadline the agent gets a
+    timeout message and continues, and the stalled thread is left to finish
+    (or die with the process) on its own.
+    """
+
+    def run(*args, **kwargs):
+        outcome = {}
+
+        def target():
+            try:
+                outcome["result"] = func(*args, **kwargs)
+            except Exception as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=target, name=f"tool-{name}", daemon=True)
+        thread.start()
+        thread.join(seconds)
+        if thread.is_alive():
+            return (
+                f"Error: {name} did not respond within {seconds} seconds. "
+                "Continue with the information you already have."
+            )
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    return run
 
 
 def save_to_file(data: str, filename: str = "research_output.txt"):
@@ -27,8 +52,57 @@ def save_to_file(data: str, filename: str = "research_output.txt"):
     return f"Successfully saved to {full_filename}"
 
 
-save_tool = Tool(
-    name="save_to_file",
-    func=save_to_file,
-    description="Saves the provided research data to a timestamped text file. Input should be the research output text.",
-)
+def build_search_tool():
+    from langchain_community.tools import DuckDuckGoSearchRun
+    from langchain_core.tools import Tool
+
+    search = DuckDuckGoSearchRun()
+    return Tool(
+        name="search",
+        func=with_timeout(search.run, "search"),
+        description="""Search the web for current, accurate information about any topic.
+    Use this tool to find facts, statistics, recent news, and reliable sources.
+    Input should be a clear search query about the topic you need information on.
+    Returns relevant web search results with factual content.""",
+    )
+
+
+def build_wiki_tool():
+    from langchain_community.tools import WikipediaQueryRun
+    from langchain_community.utilities import WikipediaAPIWrapper
+    from langchain_core.tools import Tool
+
+    api_wrapper = WikipediaAPIWrapper(top_k_results=1, max_summary_chars=100)
+    wiki = WikipediaQueryRun(api_wrapper=api_wrapper)
+    # Same name and description, with the lookup behind a deadline
+    return Tool(
+        name=wiki.name,
+        func=with_timeout(wiki.run, wiki.name),
+        description=wiki.description,
+    )
+
+
+def build_save_tool():
+    from langchain_core.tools import Tool
+
+    return Tool(
+        name="save_to_file",
+        func=save_to_file,
+        description="Saves the provided research data to a timestamped text file. Input should be the research output text.",
+    )
+
+
+_builders = {
+    "search_tool": build_search_tool,
+    "wiki_tool": build_wiki_tool,
+    "save_tool": build_save_tool,
+}
+
+
+def __getattr__(name):
+    builder = _builders.get(name)
+    if builder is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name not in _tools:
+        _tools[name] = builder()
+    return _tools[name]